@@ -6,7 +6,8 @@ from .models import (
     Kudos,
     Follower,
     ActivityPoint,
-    UserMonthlyStats
+    UserMonthlyStats,
+    ArchivedTrack
 )
 
 admin.site.register(Activity)
@@ -15,4 +16,5 @@ admin.site.register(Comment)
 admin.site.register(Kudos)
 admin.site.register(Follower)
 admin.site.register(ActivityPoint)
-admin.site.register(UserMonthlyStats)
\ No newline at end of file
+admin.site.register(UserMonthlyStats)
+admin.site.register(ArchivedTrack)
\ No newline at end of file
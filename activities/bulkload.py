@@ -0,0 +1,45 @@
+"""
+Швидке масове завантаження рядків: PostgreSQL COPY, для інших БД — bulk_create.
+Пише лише в основну БД (django.db.connection), тож з шардуванням не використовується.
+"""
+import io
+
+from django.core.management.color import no_style
+from django.db import connection
+
+BATCH_SIZE = 5000
+
+
+def supports_copy():
+    return connection.vendor == 'postgresql'
+
+
+def copy_text(model, columns, text):
+    """Завантажує текст у форматі COPY (див. synthetic.to_copy_text) у таблицю моделі."""
+    if not text:
+        return
+    qn = connection.ops.quote_name
+    sql = f"COPY {qn(model._meta.db_table)} ({', '.join(qn(c) for c in columns)}) FROM STDIN"
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2
+            raw.copy_expert(sql, io.StringIO(text))
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(text)
+
+
+def insert_rows(model, columns, rows, batch_size=BATCH_SIZE):
+    """Fallback для SQLite та інших БД."""
+    model.objects.bulk_create(
+        [model(**dict(zip(columns, row))) for row in rows], batch_size=batch_size
+    )
+
+
+def reset_sequences(*models):
+    """Після вставки з явними id (COPY) вирівнює послідовності автоінкременту."""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,132 @@
+"""
+HTTP conditional requests (ETag / Last-Modified) для API.
+
+ETag будується не з тіла відповіді, а з лічильників версій DataVersion,
+які збільшуються при кожному записі в модель. Тому перевірка
+If-None-Match / If-Modified-Since коштує один запит до маленької таблиці
+і виконується ДО основного запиту та серіалізації (для retrieve — після
+перевірки існування і прав доступу).
+
+Рядки лічильників створює міграція (0015), а версія збільшується одним
+UPDATE ... SET version = version + 1 після коміту транзакції запису, тож
+блокування рядка не тримається до кінця чужої транзакції.
+"""
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import metrics
+from .models import DataVersion
+
+
+def version_name(model):
+    return model._meta.label_lower
+
+
+_batch = threading.local()
+
+
+@contextmanager
+def batch_version_bumps():
+    """
+    Усередині блоку bump_version лише запам'ятовує моделі, а на виході кожна
+    отримує одне оновлення (для пакетних записів, що шлють сигнали на кожен рядок).
+    """
+    if getattr(_batch, 'models', None) is not None:
+        yield  # вкладений блок: оновить зовнішній
+        return
+    pending = _batch.models = {}
+    try:
+        yield
+    finally:
+        _batch.models = None
+    bump_version(*pending)
+
+
+def bump_version(*models):
+    """Збільшує версію даних для кожної з переданих моделей."""
+    pending = getattr(_batch, 'models', None)
+    if pending is not None:
+        pending.update(dict.fromkeys(models))
+        return
+    names = sorted({version_name(model) for model in models})
+    if names:
+        transaction.on_commit(lambda: _increment(names))
+
+
+def _increment(names):
+    now = timezone.now()
+    for name in names:
+        updated = DataVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now)
+        if not updated:
+            # Модель без рядка з міграції: створюємо з нулем і теж збільшуємо через F()
+            DataVersion.objects.get_or_create(name=name, defaults={'version': 0})
+            DataVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now)
+
+
+def get_versions(models):
+    """Повертає ({name: version}, last_modified) для набору моделей одним запитом."""
+    names = sorted({version_name(model) for model in models})
+    rows = DataVersion.objects.filter(name__in=names).values_list('name', 'version', 'updated_at')
+    versions = {name: 0 for name in names}
+    last_modified = None
+    for name, version, updated_at in rows:
+        versions[name] = version
+        if last_modified is None or updated_at > last_modified:
+            last_modified = updated_at
+    return versions, last_modified
+
+
+def make_etag(scope, versions):
+    raw = scope + '|' + ','.join(f"{name}:{version}" for name, version in sorted(versions.items()))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        # Слабкі ETag ('W/"..."') порівнюємо без префікса.
+        etags = [tag[2:] if tag.startswith('W/') else tag for tag in etags]
+        return '*' in etags or etag in etags
+
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since and last_modified:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and int(last_modified.timestamp()) <= since
+    return False
+
+
+class ConditionalResponseMixin:
+    """
+    Домішка для ViewSet'ів: обгортає побудову відповіді перевіркою
+    If-None-Match / If-Modified-Since і додає заголовки ETag / Last-Modified.
+    """
+
+    def conditional_response(self, request, scope, models, build_response):
+        if request.method not in ('GET', 'HEAD'):
+            return build_response()
+
+        versions, last_modified = get_versions(models)
+        etag = make_etag(f"{scope}|{request.get_full_path()}", versions)
+
+        if is_not_modified(request, etag, last_modified):
+            metrics.inc('cache_requests_total', cache='etag', result='hit')
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            metrics.inc('cache_requests_total', cache='etag', result='miss')
+            response = build_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
@@ -0,0 +1,180 @@
+"""
+Пошук дублікатів активностей при завантаженні.
+
+Одне тренування часто синхронізується з кількох пристроїв. Для кожної
+активності зберігається ActivityFingerprint: кошик часу старту, тривалість,
+дистанція і, якщо трек відомий, MinHash-підпис множини клітинок geohash
+(точність 7, ~150 м), через які він пройшов. Кандидати шукаються за
+індексом (user, start_bucket) у сусідніх кошиках, далі перевіряються
+допуски DEDUP_START_TOLERANCE_SEC / DEDUP_TOLERANCE, а якщо підписи є
+в обох — ще й оцінка схожості Жаккара (DEDUP_MIN_SIMILARITY), тож
+паралельні, але різні маршрути в той самий час не плутаються.
+
+POST /api/activities/upload/ перевіряє відбиток до того, як активність і
+її точки записані; звичайне створення активності — за тим самим відбитком
+без треку.
+"""
+import functools
+import hashlib
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from . import sharding
+from .lazy import lazy_import
+from .models import ActivityFingerprint
+
+np = lazy_import('numpy')
+
+MINHASH_SIZE = 64
+MINHASH_PRIME = 2 ** 31 - 1
+# Geohash точності 7 = 35 біт: 18 на довготу, 17 на широту
+GEOHASH_LON_BITS = 18
+GEOHASH_LAT_BITS = 17
+
+
+def start_bucket_sec():
+    return getattr(settings, 'DEDUP_START_BUCKET_SEC', 300)
+
+
+def start_tolerance_sec():
+    return getattr(settings, 'DEDUP_START_TOLERANCE_SEC', 120)
+
+
+def tolerance():
+    return getattr(settings, 'DEDUP_TOLERANCE', 0.05)
+
+
+def min_similarity():
+    return getattr(settings, 'DEDUP_MIN_SIMILARITY', 0.5)
+
+
+def _coefficient(name, index):
+    # Стабільні між версіями numpy і процесами (на відміну від генератора випадкових чисел)
+    digest = hashlib.blake2b(f"{name}{index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % (MINHASH_PRIME - 1) + 1
+
+
+@functools.cache
+def _hash_coefficients():
+    return (
+        np.array([_coefficient('a', i) for i in range(MINHASH_SIZE)], dtype=np.uint64)[:, None],
+        np.array([_coefficient('b', i) for i in range(MINHASH_SIZE)], dtype=np.uint64)[:, None],
+    )
+
+
+def geohash_cells(lat, lon):
+    """Унікальні клітинки geohash точності 7 (35-бітні цілі) для масивів координат."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    x = np.clip(((lon + 180.0) / 360.0 * 2 ** GEOHASH_LON_BITS).astype(np.int64), 0, 2 ** GEOHASH_LON_BITS - 1)
+    y = np.clip(((lat + 90.0) / 180.0 * 2 ** GEOHASH_LAT_BITS).astype(np.int64), 0, 2 ** GEOHASH_LAT_BITS - 1)
+    # Для MinHash важлива лише тотожність клітинки, тож біти не перемежовуються
+    return np.unique((x << GEOHASH_LAT_BITS) | y).astype(np.uint64)
+
+
+def track_minhash(lat, lon):
+    """MinHash-підпис (MINHASH_SIZE x uint32, bytes) множини клітинок треку або None без точок."""
+    if not len(lat):
+        return None
+    cells = geohash_cells(lat, lon) % MINHASH_PRIME
+    a, b = _hash_coefficients()
+    # (a * x + b) mod p: a, x < 2^31, тож добуток вміщається в uint64
+    hashes = (a * cells[None, :] + b) % MINHASH_PRIME
+    return hashes.min(axis=1).astype('<u4').tobytes()
+
+
+def similarity(left, right):
+    """Оцінка коефіцієнта Жаккара двох підписів."""
+    left = np.frombuffer(bytes(left), dtype='<u4')
+    right = np.frombuffer(bytes(right), dtype='<u4')
+    return float(np.mean(left == right))
+
+
+@dataclass
+class Fingerprint:
+    start_ts: int
+    duration_sec: float
+    distance_m: float
+    track_minhash: bytes = None
+
+    @property
+    def start_bucket(self):
+        return self.start_ts // start_bucket_sec()
+
+
+def fingerprint(start_time, duration_sec, distance_m, lat=(), lon=()):
+    """Відбиток активності; None, якщо немає start_time (тоді дублікати не шукаються)."""
+    if start_time is None:
+        return None
+    return Fingerprint(int(start_time.timestamp()), duration_sec, distance_m, track_minhash(lat, lon))
+
+
+def _close(left, right):
+    # Відносний допуск + 1 одиниця, щоб нульові дистанції (зал, йога) теж збігались
+    return abs(left - right) <= tolerance() * max(left, right) + 1
+
+
+def match_score(candidate, wanted):
+    """Схожість кандидата (ActivityFingerprint) з відбитком або None, якщо це не дублікат."""
+    if abs(candidate.start_ts - wanted.start_ts) > start_tolerance_sec():
+        return None
+    if not (_close(candidate.duration_sec, wanted.duration_sec) and _close(candidate.distance_m, wanted.distance_m)):
+        return None
+    if candidate.track_minhash is None or wanted.track_minhash is None:
+        return 0.0  # трек невідомий: достатньо збігу часу, тривалості й дистанції
+    score = similarity(candidate.track_minhash, wanted.track_minhash)
+    return score if score >= min_similarity() else None
+
+
+def find_duplicate(user_id, wanted, exclude_activity_id=None):
+    """id наявної активності користувача, дублікатом якої є відбиток, або None."""
+    if wanted is None:
+        return None
+    bucket = wanted.start_bucket
+    candidates = ActivityFingerprint.objects.using(sharding.shard_for(user_id)).filter(
+        user_id=user_id, start_bucket__in=[bucket - 1, bucket, bucket + 1]
+    )
+    if exclude_activity_id is not None:
+        candidates = candidates.exclude(activity_id=exclude_activity_id)
+    best = None
+    for candidate in candidates:
+        score = match_score(candidate, wanted)
+        if score is not None and (best is None or score > best[0]):
+            best = (score, candidate.activity_id)
+    return best[1] if best else None
+
+
+def record_new(activities):
+    """Відбитки щойно створених активностей (одного шарда) одним INSERT."""
+    activities = [activity for activity in activities if activity.start_time is not None]
+    if not activities:
+        return
+    rows = []
+    for activity in activities:
+        wanted = fingerprint(activity.start_time, activity.duration_sec, activity.distance_m)
+        rows.append(ActivityFingerprint(
+            activity_id=activity.pk, user_id=activity.user_id, start_bucket=wanted.start_bucket,
+            start_ts=wanted.start_ts, duration_sec=wanted.duration_sec, distance_m=wanted.distance_m,
+        ))
+    ActivityFingerprint.objects.using(sharding.owner_alias(activities[0])).bulk_create(rows, batch_size=1000)
+
+
+def record(activity, minhash=None):
+    """Створює або оновлює відбиток активності; наявний підпис треку зберігається, якщо minhash не передано."""
+    fingerprints = ActivityFingerprint.objects.using(sharding.owner_alias(activity))
+    if activity.start_time is None:
+        fingerprints.filter(activity_id=activity.pk).delete()
+        return None
+    wanted = fingerprint(activity.start_time, activity.duration_sec, activity.distance_m)
+    defaults = {
+        'user_id': activity.user_id,
+        'start_bucket': wanted.start_bucket,
+        'start_ts': wanted.start_ts,
+        'duration_sec': wanted.duration_sec,
+        'distance_m': wanted.distance_m,
+    }
+    if minhash is not None:
+        defaults['track_minhash'] = minhash
+    fingerprint_row, _ = fingerprints.update_or_create(activity_id=activity.pk, defaults=defaults)
+    return fingerprint_row
@@ -0,0 +1,302 @@
+"""
+Граф підписок у пам'яті процесу.
+
+Усі рядки Follower завантажуються в CSR-структуру (compressed sparse row):
+масив вузлів (id користувачів, відсортований), indptr і суміжні id — окремо
+для підписок (out) і підписників (in). Сусіди вузла — це зріз масиву, тож
+"люди, яких ви можете знати", спільні підписники і лічильники рахуються
+в пам'яті без JOIN'ів.
+
+CSR незмінний, тому підписки/відписки після завантаження накопичуються в
+невеликому оверлеї (added/removed). Коли оверлей перевищує
+COMPACT_THRESHOLD, CSR перебудовується з поточних ребер у пам'яті.
+Читання бере base і копії множин оверлею під блокуванням графа, тож
+паралельні зміни не ламають ітерацію.
+
+Записи інших процесів підхоплюються повним перезавантаженням раз на
+FOLLOW_GRAPH_REBUILD_SECONDS: новий граф будується у фоновому потоці,
+запити тим часом читають попередній. Зміни, що прийшли під час
+завантаження, повторюються на новому графі перед підміною.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .lazy import lazy_import
+from .models import Follower
+
+np = lazy_import('numpy')
+
+COMPACT_THRESHOLD = 10000
+
+logger = logging.getLogger(__name__)
+
+
+def _csr(rows, cols, nodes):
+    """indptr / indices для ребер rows -> cols; рядки — позиції в nodes."""
+    order = np.lexsort((cols, rows))
+    rows, cols = rows[order], cols[order]
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(np.searchsorted(nodes, rows), minlength=len(nodes)), out=indptr[1:])
+    return indptr, cols
+
+
+class CSRGraph:
+    """Незмінний орієнтований граф follower -> followee."""
+
+    def __init__(self, edges):
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        dtype = np.int32 if not len(edges) or edges.max() < 2 ** 31 else np.int64
+        edges = edges.astype(dtype)
+        src, dst = edges[:, 0], edges[:, 1]
+        self.nodes = np.unique(edges)
+        self.out_indptr, self.out_ids = _csr(src, dst, self.nodes)
+        self.in_indptr, self.in_ids = _csr(dst, src, self.nodes)
+
+    def __len__(self):
+        return len(self.out_ids)
+
+    def _position(self, user_id):
+        position = np.searchsorted(self.nodes, user_id)
+        if position < len(self.nodes) and self.nodes[position] == user_id:
+            return position
+        return None
+
+    def following(self, user_id):
+        position = self._position(user_id)
+        if position is None:
+            return self.out_ids[:0]
+        return self.out_ids[self.out_indptr[position]:self.out_indptr[position + 1]]
+
+    def followers(self, user_id):
+        position = self._position(user_id)
+        if position is None:
+            return self.in_ids[:0]
+        return self.in_ids[self.in_indptr[position]:self.in_indptr[position + 1]]
+
+    def has_edge(self, follower_id, followee_id):
+        row = self.following(follower_id)
+        position = np.searchsorted(row, followee_id)
+        return bool(position < len(row) and row[position] == followee_id)
+
+    def edges(self):
+        counts = np.diff(self.out_indptr)
+        return np.column_stack((np.repeat(self.nodes, counts), self.out_ids))
+
+
+class FollowGraph:
+    """CSRGraph + оверлей змін після завантаження."""
+
+    def __init__(self, edges):
+        self.base = CSRGraph(edges)
+        self.loaded_at = time.monotonic()
+        self._lock = threading.RLock()
+        self._reset_overlay()
+
+    def _reset_overlay(self):
+        self._pending = 0
+        # {user_id: set(...)} — додані / видалені сусіди відносно base
+        self._added_out, self._removed_out = {}, {}
+        self._added_in, self._removed_in = {}, {}
+
+    def _change(self, follower_id, followee_id, add_to, discard_from):
+        add_out, add_in = add_to
+        discard_out, discard_in = discard_from
+        discard_out.get(follower_id, set()).discard(followee_id)
+        discard_in.get(followee_id, set()).discard(follower_id)
+        add_out.setdefault(follower_id, set()).add(followee_id)
+        add_in.setdefault(followee_id, set()).add(follower_id)
+        self._pending += 1
+
+    def follow(self, follower_id, followee_id):
+        with self._lock:
+            added = (self._added_out, self._added_in)
+            removed = (self._removed_out, self._removed_in)
+            if self.base.has_edge(follower_id, followee_id):
+                # Ребро є в base: достатньо скасувати відписку
+                self._removed_out.get(follower_id, set()).discard(followee_id)
+                self._removed_in.get(followee_id, set()).discard(follower_id)
+            else:
+                self._change(follower_id, followee_id, added, removed)
+            self._maybe_compact()
+
+    def unfollow(self, follower_id, followee_id):
+        with self._lock:
+            added = (self._added_out, self._added_in)
+            removed = (self._removed_out, self._removed_in)
+            if self.base.has_edge(follower_id, followee_id):
+                self._change(follower_id, followee_id, removed, added)
+            else:
+                self._added_out.get(follower_id, set()).discard(followee_id)
+                self._added_in.get(followee_id, set()).discard(follower_id)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._pending < COMPACT_THRESHOLD:
+            return
+        edges = self.base.edges().astype(np.int64)
+        removed = [(u, v) for u, targets in self._removed_out.items() for v in targets]
+        if removed:
+            # Ребро -> один int64-ключ, щоб відфільтрувати векторно
+            keys = (edges[:, 0] << 32) | edges[:, 1]
+            removed_keys = [(u << 32) | v for u, v in removed]
+            edges = edges[~np.isin(keys, removed_keys)]
+        added = [(u, v) for u, targets in self._added_out.items() for v in targets]
+        self.base = CSRGraph(np.concatenate([edges, np.asarray(added, dtype=np.int64).reshape(-1, 2)]))
+        self._reset_overlay()
+
+    def _snapshot(self, user_id, added_map, removed_map):
+        # base і оверлей мають бути узгоджені між собою; множини копіюються,
+        # бо follow()/unfollow() з іншого потоку змінюють їх на місці
+        with self._lock:
+            return self.base, tuple(added_map.get(user_id, ())), tuple(removed_map.get(user_id, ()))
+
+    @staticmethod
+    def _adjust(ids, added, removed):
+        if removed:
+            ids = ids[~np.isin(ids, removed)]
+        if added:
+            ids = np.union1d(ids, np.asarray(added, dtype=ids.dtype))
+        return ids
+
+    def following(self, user_id):
+        base, added, removed = self._snapshot(user_id, self._added_out, self._removed_out)
+        return self._adjust(base.following(user_id), added, removed)
+
+    def followers(self, user_id):
+        base, added, removed = self._snapshot(user_id, self._added_in, self._removed_in)
+        return self._adjust(base.followers(user_id), added, removed)
+
+    def counts(self, user_ids):
+        """{user_id: {'followers': n, 'following': n}}."""
+        return {
+            user_id: {'followers': len(self.followers(user_id)), 'following': len(self.following(user_id))}
+            for user_id in user_ids
+        }
+
+    def mutual_followers(self, user_id, other_id):
+        """Користувачі, які підписані і на user_id, і на other_id."""
+        return np.intersect1d(self.followers(user_id), self.followers(other_id), assume_unique=True)
+
+    def suggestions(self, user_id, limit=10):
+        """
+        "Люди, яких ви можете знати": підписки ваших підписок, ранжовані за
+        кількістю ваших підписок, що на них підписані, далі — за кількістю
+        підписників. Повертає [(user_id, mutual_count), ...].
+        """
+        following = self.following(user_id)
+        if not len(following):
+            return []
+        candidates = np.concatenate([self.following(followee) for followee in following.tolist()])
+        candidates, scores = np.unique(candidates, return_counts=True)
+        keep = (candidates != user_id) & ~np.isin(candidates, following)
+        candidates, scores = candidates[keep], scores[keep]
+        order = np.lexsort((candidates, -self._base_in_degree(candidates), -scores))[:limit]
+        return [(int(candidates[i]), int(scores[i])) for i in order]
+
+    def _base_in_degree(self, user_ids):
+        # Для впорядкування при рівних балах оверлей не враховуємо
+        base = self.base
+        positions = np.searchsorted(base.nodes, user_ids)
+        found = positions < len(base.nodes)
+        found[found] = base.nodes[positions[found]] == user_ids[found]
+        degree = np.zeros(len(user_ids), dtype=np.int64)
+        degree[found] = base.in_indptr[positions[found] + 1] - base.in_indptr[positions[found]]
+        return degree
+
+
+_lock = threading.RLock()
+_graph = None
+_generation = 0
+# Зміни, що прийшли під час завантаження графа (None — завантаження не йде)
+_replay = None
+# Одне завантаження на процес; фонове тримає його до підміни
+_load_lock = threading.Lock()
+
+
+def _rebuild_seconds():
+    return getattr(settings, 'FOLLOW_GRAPH_REBUILD_SECONDS', 600)
+
+
+def load_graph():
+    edges = list(Follower.objects.values_list('follower_id', 'followee_id').iterator(chunk_size=50000))
+    return FollowGraph(edges)
+
+
+def _load_and_swap():
+    """Завантажує граф поза _lock і підміняє ним поточний (викликається під _load_lock)."""
+    global _graph, _replay
+    with _lock:
+        generation = _generation
+        _replay = []
+    try:
+        graph = load_graph()
+    except BaseException:
+        with _lock:
+            _replay = None
+        raise
+    with _lock:
+        # follow/unfollow ідемпотентні, тож повтор уже врахованих завантаженням змін безпечний
+        for method, follower_id, followee_id in _replay:
+            getattr(graph, method)(follower_id, followee_id)
+        _replay = None
+        if generation == _generation:
+            _graph = graph
+    return graph
+
+
+def _refresh():
+    try:
+        _load_and_swap()
+    except Exception:
+        logger.exception("Follow graph reload failed")
+    finally:
+        _load_lock.release()
+        connections.close_all()
+
+
+def get_graph():
+    with _lock:
+        graph = _graph
+    if graph is None:
+        with _load_lock:
+            with _lock:
+                graph = _graph
+            if graph is None:
+                graph = _load_and_swap()
+        return graph
+    if time.monotonic() - graph.loaded_at > _rebuild_seconds() and _load_lock.acquire(blocking=False):
+        # Застарілий граф віддаємо, поки новий будується у фоні
+        threading.Thread(target=_refresh, name='follow-graph-reload', daemon=True).start()
+    return graph
+
+
+def invalidate():
+    global _graph, _generation
+    with _lock:
+        _generation += 1
+        _graph = None
+
+
+def _apply(method, edges):
+    with _lock:
+        if _replay is not None:
+            _replay.extend((method, follower_id, followee_id) for follower_id, followee_id in edges)
+        if _graph is None:
+            return  # граф ще не завантажений — при завантаженні зміни вже будуть у БД
+        for follower_id, followee_id in edges:
+            getattr(_graph, method)(follower_id, followee_id)
+
+
+def record_follows(edges):
+    """Застосовує нові підписки [(follower_id, followee_id), ...] після коміту."""
+    edges = list(edges)
+    transaction.on_commit(lambda: _apply('follow', edges))
+
+
+def record_unfollows(edges):
+    edges = list(edges)
+    transaction.on_commit(lambda: _apply('unfollow', edges))
@@ -0,0 +1,522 @@
+"""
+Теплова карта треків користувача у вигляді тайлів Web Mercator (z/x/y, 256x256).
+
+Для кожного зуму HEATMAP_MIN_ZOOM..HEATMAP_MAX_ZOOM точки ActivityPoint
+користувача біняться в пікселі тайлів (np.unique по ключу пікселя). Зум
+зберігається як розріджений масив CELL_DTYPE (ключ, кількість точок),
+відсортований за ключем:
+
+    key = ((tile_x << zoom) | tile_y) << 16 | py << 8 | px
+
+тож пікселі одного тайла лежать поспіль, і тайл вирізається двома
+searchsorted з memmap-файлу без читання решти карти.
+
+Файли: HEATMAP_DIR/<user_id // 1000>/<user_id>/meta.json і каталог
+поточної ревізії з z<zoom>.npy та кешем відрендерених PNG (tiles/z/x/y.png).
+
+Оновлення інкрементальне: meta.json пам'ятає watermark і версію
+ActivityPoint (DataVersion), на якій карту перевіряли. Коли версія
+змінюється, дочитуються точки з id > watermark (з БД і з треків,
+архівованих після попередньої перевірки) і зливаються з масивами.
+id видаються при INSERT, а не при коміті, тож точка з меншим id може
+з'явитися пізніше за більшу: id уже врахованих точок вище watermark
+лежать у recent_ids.npy ревізії, а watermark підтягується до найбільшого
+id перевірки лише через HEATMAP_LOOKBACK_SECONDS після неї.
+Видалення чи зміна точок збільшують "покоління" користувача (рядок
+HeatmapGeneration в основній БД, тож його бачать усі воркери) — тоді карта
+перебудовується з нуля, разом із холодним архівом.
+
+Оновлення однієї карти серіалізується блокуванням файлу <user>/.lock
+(flock), тож паралельні воркери не пишуть ревізії одночасно. Видаляються
+лише ревізії, старші за попередню: читач, що встиг прочитати старий
+meta.json, дочитає свою ревізію.
+"""
+import functools
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import chain, islice
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: лише блокування між потоками процесу
+    fcntl = None
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics, sharding, track_archive
+from .caching import LRUCache
+from .conditional import get_versions, version_name
+from .lazy import lazy_import
+from .models import Activity, ActivityPoint, ArchivedTrack, HeatmapGeneration
+
+np = lazy_import('numpy')
+
+TILE_SIZE = 256
+MAX_LATITUDE = 85.0511287798  # межа проєкції Web Mercator
+CELL_FIELDS = [('key', '<i8'), ('count', '<u4')]
+POINT_FIELDS = [('id', '<i8'), ('lat', '<f8'), ('lon', '<f8')]
+CHUNK_SIZE = 500_000  # точок за раз при читанні з БД
+
+# Палітра: прозорий -> темно-червоний -> помаранчевий -> жовтий -> білий (позиція, RGBA)
+COLOR_STOPS = [
+    (0.0, (120, 0, 0, 0)),
+    (0.15, (180, 20, 10, 150)),
+    (0.45, (240, 100, 20, 210)),
+    (0.75, (255, 210, 50, 240)),
+    (1.0, (255, 255, 230, 255)),
+]
+
+
+def heatmap_dir():
+    return Path(getattr(settings, 'HEATMAP_DIR', Path(settings.BASE_DIR) / 'archive' / 'heatmaps'))
+
+
+def min_zoom():
+    return getattr(settings, 'HEATMAP_MIN_ZOOM', 2)
+
+
+def max_zoom():
+    return getattr(settings, 'HEATMAP_MAX_ZOOM', 16)
+
+
+def lookback_seconds():
+    return getattr(settings, 'HEATMAP_LOOKBACK_SECONDS', 3600)
+
+
+def user_dir(user_id):
+    # Підкаталоги по 1000 користувачів, як у track_archive
+    return heatmap_dir() / f"{user_id // 1000:06d}" / str(user_id)
+
+
+def generation(user_id):
+    return HeatmapGeneration.objects.filter(user_id=user_id).values_list('generation', flat=True).first() or 0
+
+
+def bump_generation(user_id):
+    bump = HeatmapGeneration.objects.filter(user_id=user_id)
+    if bump.update(generation=F('generation') + 1):
+        return
+    try:
+        _, created = HeatmapGeneration.objects.get_or_create(user_id=user_id, defaults={'generation': 1})
+    except IntegrityError:
+        return  # користувача вже видалено — перебудовувати нічого
+    if not created:  # рядок щойно створив інший процес
+        bump.update(generation=F('generation') + 1)
+
+
+def invalidate(user_id):
+    """Після коміту позначає карту користувача для повної перебудови."""
+    transaction.on_commit(lambda: bump_generation(user_id))
+
+
+_owners = LRUCache(10000)  # activity_id -> user_id (власник активності не змінюється)
+
+
+def invalidate_activities(activity_ids):
+    """invalidate() для власників активностей (зміна чи видалення їхніх точок)."""
+    owners = set()
+    missing = []
+    for activity_id in set(activity_ids):
+        user_id = _owners.get(activity_id)
+        if user_id is None:
+            missing.append(activity_id)
+        else:
+            owners.add(user_id)
+    for activity_id, user_id in sharding.scatter(Activity.objects.filter(id__in=missing).values_list('id', 'user_id')):
+        _owners.set(activity_id, user_id)
+        owners.add(user_id)
+    for user_id in owners:
+        invalidate(user_id)
+
+
+# --- Біннінг -------------------------------------------------------------------
+
+def cell_dtype():
+    return np.dtype(CELL_FIELDS)
+
+
+def pixel_coords(lat, lon, zoom):
+    """Глобальні піксельні координати (int64) точок на зумі zoom."""
+    scale = TILE_SIZE * 2 ** zoom
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lon) + 180.0) / 360.0 * scale
+    y = (1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0 * scale
+    return (
+        np.clip(x.astype(np.int64), 0, scale - 1),
+        np.clip(y.astype(np.int64), 0, scale - 1),
+    )
+
+
+def pixel_keys(px, py, zoom):
+    tile_x, tile_y = px >> 8, py >> 8
+    return (((tile_x << zoom) | tile_y) << 16) | ((py & 0xFF) << 8) | (px & 0xFF)
+
+
+def tile_key_range(zoom, x, y):
+    start = ((x << zoom) | y) << 16
+    return start, start + TILE_SIZE * TILE_SIZE
+
+
+def bin_points(lat, lon):
+    """{zoom: масив CELL_DTYPE} — кількість точок у кожному пікселі кожного зуму."""
+    top = max_zoom()
+    px, py = pixel_coords(lat, lon, top)
+    cells = {}
+    for zoom in range(min_zoom(), top + 1):
+        # Піксель нижчого зуму — той самий піксель верхнього, зсунутий на різницю зумів
+        shift = top - zoom
+        keys, counts = np.unique(pixel_keys(px >> shift, py >> shift, zoom), return_counts=True)
+        cells[zoom] = _cells(keys, counts)
+    return cells
+
+
+def _empty_cells():
+    return np.zeros(0, dtype=cell_dtype())
+
+
+def _cells(keys, counts):
+    cells = np.empty(len(keys), dtype=cell_dtype())
+    cells['key'] = keys
+    cells['count'] = counts
+    return cells
+
+
+def merge_cells(left, right):
+    """Сума двох відсортованих розріджених масивів CELL_DTYPE."""
+    if not len(left):
+        return right
+    if not len(right):
+        return left
+    keys, inverse = np.unique(np.concatenate([left['key'], right['key']]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([left['count'], right['count']]))
+    return _cells(keys, counts.astype(np.uint32))
+
+
+# --- Збереження ----------------------------------------------------------------
+
+def _cells_path(directory, zoom):
+    return directory / f"z{zoom}.npy"
+
+
+def _load_cells(directory, zoom, mmap_mode=None):
+    path = _cells_path(directory, zoom)
+    if not path.exists():
+        return _empty_cells()
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def _save_cells(directory, zoom, cells):
+    path = _cells_path(directory, zoom)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        np.save(f, cells)
+    os.replace(tmp, path)
+
+
+def load_meta(user_id):
+    try:
+        return json.loads((user_dir(user_id) / 'meta.json').read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _save_meta(directory, meta):
+    path = directory / 'meta.json'
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, path)
+
+
+def _revision_name(sequence):
+    # Номер у назві впорядковує ревізії незалежно від часу зміни каталогів
+    return f"r{sequence:08d}-{uuid.uuid4().hex[:8]}"
+
+
+def _revision_sequence(name):
+    try:
+        return int(name[1:9]) if name.startswith('r') else -1
+    except ValueError:
+        return -1  # ревізії старого формату (uuid) — завжди старші
+
+
+def _remove_old_revisions(directory, meta):
+    keep = {meta['revision'], meta.get('previous_revision')}
+    current = _revision_sequence(meta['revision'] or '')
+    for child in directory.iterdir():
+        if child.is_dir() and child.name not in keep and _revision_sequence(child.name) < current:
+            shutil.rmtree(child, ignore_errors=True)
+
+
+def _load_recent_ids(directory):
+    if directory is None:
+        return np.zeros(0, dtype=np.int64)
+    try:
+        return np.load(directory / 'recent_ids.npy')
+    except FileNotFoundError:
+        return np.zeros(0, dtype=np.int64)
+
+
+# --- Оновлення ------------------------------------------------------------------
+
+def _db_points(user_id, after_id):
+    """Чанки масивів POINT_FIELDS з БД: точки користувача з id > after_id."""
+    rows = (
+        ActivityPoint.objects.using(sharding.shard_for(user_id)).filter(activity__user_id=user_id, id__gt=after_id)
+        .values_list('id', 'lat', 'lon')
+        .iterator(chunk_size=20000)
+    )
+    dtype = np.dtype(POINT_FIELDS)
+    while True:
+        chunk = np.fromiter(islice(rows, CHUNK_SIZE), dtype=dtype)
+        if not len(chunk):
+            return
+        yield chunk
+
+
+def _archived_points(user_id, after_id, archived_since):
+    """Точки з холодного архіву (лише треки, архівовані після archived_since, якщо задано)."""
+    tracks = ArchivedTrack.objects.using(sharding.shard_for(user_id)).filter(activity__user_id=user_id)
+    if archived_since is not None:
+        tracks = tracks.filter(archived_at__gte=archived_since)
+    for path in tracks.values_list('path', flat=True).iterator():
+        try:
+            records = track_archive.open_track(track_archive.archive_dir() / path)
+        except FileNotFoundError:
+            continue  # трек саме повертається в БД — точки прочитаються звідти
+        records = records[records['id'] > after_id]
+        if len(records):
+            chunk = np.empty(len(records), dtype=np.dtype(POINT_FIELDS))
+            chunk['id'] = records['id']
+            chunk['lat'] = records['lat'] / track_archive.COORD_SCALE
+            chunk['lon'] = records['lon'] / track_archive.COORD_SCALE
+            yield chunk
+
+
+def _batched(chunks):
+    """Склеює дрібні чанки (трек на активність) до CHUNK_SIZE, щоб злиття йшли рідко."""
+    pending, size = [], 0
+    for chunk in chunks:
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            yield np.concatenate(pending)
+            pending, size = [], 0
+    if pending:
+        yield np.concatenate(pending)
+
+
+_locks_guard = threading.Lock()
+_locks = {}
+
+
+def _thread_lock(user_id):
+    with _locks_guard:
+        return _locks.setdefault(user_id, threading.Lock())
+
+
+@contextmanager
+def _user_lock(user_id):
+    """Ексклюзивне оновлення карти користувача: між потоками і між процесами (flock)."""
+    with _thread_lock(user_id):
+        directory = user_dir(user_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / '.lock', 'a+b') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _zooms():
+    return [min_zoom(), max_zoom()]
+
+
+def refresh(user_id):
+    """Актуалізує карту користувача (інкрементально або з нуля) і повертає meta."""
+    # Версію беремо до читання точок: нові записи після неї помітить наступна перевірка
+    versions, _ = get_versions([ActivityPoint])
+    points_version = versions[version_name(ActivityPoint)]
+    current_generation = generation(user_id)
+    current = (current_generation, points_version, _zooms())
+
+    meta = load_meta(user_id)
+    if meta is not None and (meta['generation'], meta['points_version'], meta['zooms']) == current:
+        return meta
+    with _user_lock(user_id):
+        meta = load_meta(user_id)
+        if meta is not None and (meta['generation'], meta['points_version'], meta['zooms']) == current:
+            return meta
+        return _update(user_id, meta, current_generation, points_version)
+
+
+def _update(user_id, meta, generation, points_version):
+    directory = user_dir(user_id)
+    checked_at = timezone.now()
+    sequence = meta.get('sequence', 0) + 1 if meta else 1
+    rebuild = meta is None or meta['generation'] != generation or meta['zooms'] != _zooms()
+    if rebuild:
+        metrics.inc('heatmap_updates_total', kind='rebuild')
+        previous = meta['revision'] if meta else None
+        meta = {'revision': previous, 'watermark': 0, 'checks': [], 'point_count': 0, 'max_counts': {}}
+        old_dir = None
+        archived_since = None
+    else:
+        metrics.inc('heatmap_updates_total', kind='incremental')
+        old_dir = directory / meta['revision'] if meta['revision'] else None
+        archived_since = datetime.fromisoformat(meta['checked_at'])
+
+    # Кожне оновлення пише нову ревізію (каталог з масивами і кешем тайлів);
+    # meta.json перемикається на неї атомарно, тож читачі не бачать напівзаписаних файлів
+    revision = _revision_name(sequence)
+    new_dir = directory / revision
+    watermark = meta['watermark']
+    recent = _load_recent_ids(old_dir)
+    new_ids = []
+    zooms = range(min_zoom(), max_zoom() + 1)
+    cells = None  # масиви читаються лише якщо є нові точки
+    added = 0
+    chunks = chain(_db_points(user_id, watermark), _archived_points(user_id, watermark, archived_since))
+    for chunk in _batched(chunks):
+        # Точки вище watermark, уже враховані раніше (або трек і в БД, і в архіві)
+        _, first = np.unique(chunk['id'], return_index=True)
+        chunk = chunk[first]
+        chunk = chunk[~np.isin(chunk['id'], recent)]
+        if new_ids:
+            chunk = chunk[~np.isin(chunk['id'], np.concatenate(new_ids))]
+        if not len(chunk):
+            continue
+        if cells is None:
+            cells = {zoom: _load_cells(old_dir, zoom) if old_dir else _empty_cells() for zoom in zooms}
+        for zoom, new_cells in bin_points(chunk['lat'], chunk['lon']).items():
+            cells[zoom] = merge_cells(cells[zoom], new_cells)
+        new_ids.append(chunk['id'])
+        added += len(chunk)
+    if new_ids:
+        recent = np.union1d(recent, np.concatenate(new_ids))
+
+    # Через HEATMAP_LOOKBACK_SECONDS після перевірки всі точки з меншими id уже закомічені
+    now = time.time()
+    checks = meta.get('checks', []) + [[now, int(recent.max()) if len(recent) else watermark]]
+    horizon = now - lookback_seconds()
+    watermark = max([watermark] + [max_id for checked, max_id in checks if checked <= horizon])
+    checks = [[checked, max_id] for checked, max_id in checks if checked > horizon]
+
+    if cells is None and rebuild:
+        cells = {zoom: _empty_cells() for zoom in zooms}
+    if cells is not None:
+        new_dir.mkdir(parents=True, exist_ok=True)
+        for zoom, zoom_cells in cells.items():
+            _save_cells(new_dir, zoom, zoom_cells)
+            meta['max_counts'][str(zoom)] = int(zoom_cells['count'].max()) if len(zoom_cells) else 0
+        np.save(new_dir / 'recent_ids.npy', recent[recent > watermark])
+        meta['previous_revision'] = meta['revision']
+        meta['revision'] = revision
+        meta['sequence'] = sequence
+        meta['point_count'] += added
+
+    meta.update({
+        'generation': generation,
+        'points_version': points_version,
+        'watermark': watermark,
+        'checks': checks,
+        'checked_at': checked_at.isoformat(),
+        'zooms': _zooms(),
+    })
+    _save_meta(directory, meta)
+    _remove_old_revisions(directory, meta)
+    return meta
+
+
+# --- Тайли ---------------------------------------------------------------------
+
+def is_valid_tile(zoom, x, y):
+    return min_zoom() <= zoom <= max_zoom() and 0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom
+
+
+def density(user_id, zoom, x, y, meta=None):
+    """Масив uint32 256x256: кількість точок у кожному пікселі тайла."""
+    meta = meta or refresh(user_id)
+    grid = np.zeros(TILE_SIZE * TILE_SIZE, dtype=np.uint32)
+    if meta['point_count']:
+        cells = _load_cells(user_dir(user_id) / meta['revision'], zoom, mmap_mode='r')
+        start, end = tile_key_range(zoom, x, y)
+        keys = cells['key']
+        lo, hi = np.searchsorted(keys, [start, end])
+        grid[keys[lo:hi] - start] = cells['count'][lo:hi]
+    return grid.reshape(TILE_SIZE, TILE_SIZE)
+
+
+@functools.cache
+def _color_table():
+    positions = [position for position, _ in COLOR_STOPS]
+    levels = np.linspace(0.0, 1.0, 256)
+    table = np.stack(
+        [np.interp(levels, positions, [color[channel] for _, color in COLOR_STOPS]) for channel in range(4)],
+        axis=1,
+    ).astype(np.uint8)
+    table[0] = 0  # порожній піксель повністю прозорий
+    return table
+
+
+def colorize(grid, max_count):
+    """RGBA (256x256x4): логарифмічна шкала відносно максимуму зуму, щоб тайли не мали швів."""
+    if max_count <= 0:
+        return np.zeros((*grid.shape, 4), dtype=np.uint8)
+    levels = np.log1p(grid) / np.log1p(max_count)
+    indexes = np.where(grid > 0, np.clip(np.ceil(levels * 255), 1, 255), 0).astype(np.uint8)
+    return _color_table()[indexes]
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def encode_png(rgba):
+    """Мінімальний PNG-кодувальник (8 біт RGBA, без фільтрів) — без Pillow."""
+    height, width, _ = rgba.shape
+    rows = np.hstack([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)])
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)),
+        _png_chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)),
+        _png_chunk(b'IEND', b''),
+    ])
+
+
+def tile_png(user_id, zoom, x, y):
+    """PNG-тайл з файлового кешу ревізії (рендериться при першому запиті)."""
+    meta = refresh(user_id)
+    path = user_dir(user_id) / meta['revision'] / 'tiles' / str(zoom) / str(x) / f"{y}.png"
+    try:
+        data = path.read_bytes()
+        metrics.inc('cache_requests_total', cache='heatmap_tiles', result='hit')
+        return data
+    except FileNotFoundError:
+        metrics.inc('cache_requests_total', cache='heatmap_tiles', result='miss')
+    grid = density(user_id, zoom, x, y, meta)
+    data = encode_png(colorize(grid, meta['max_counts'].get(str(zoom), 0)))
+    try:
+        # Без parents для каталогу ревізії: видалену ревізію не створюємо заново
+        (user_dir(user_id) / meta['revision'] / 'tiles').mkdir(exist_ok=True)
+    except FileNotFoundError:
+        return data
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return data
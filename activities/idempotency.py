@@ -0,0 +1,109 @@
+"""
+Idempotency-Key для запитів на запис.
+
+Якщо клієнт надсилає заголовок `Idempotency-Key`, успішна відповідь
+зберігається в кеші Django (settings.IDEMPOTENCY_CACHE, TTL —
+settings.IDEMPOTENCY_TTL) разом з відбитком тіла запиту. Повтор з тим
+самим ключем повертає збережену відповідь без звернення до БД, а той самий
+ключ з іншим тілом — 422.
+
+Перед виконанням ключ резервується атомарним cache.add() (на
+IDEMPOTENCY_PENDING_TTL секунд): повтор, що прийшов, поки перший запит ще
+виконується, отримує 409 з Retry-After і не пише в БД вдруге. Невдала
+відповідь або виняток знімають резерв, тож клієнт може повторити запит.
+
+Повтори можуть потрапити на інший воркер, тож IDEMPOTENCY_CACHE має бути
+спільним (caching.is_shared). З LocMem ключі захищають лише від повторів
+у межах одного процесу — про це пишеться попередження в лог.
+"""
+import functools
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+PENDING = 'pending'
+
+_warned = False
+
+
+def _cache():
+    global _warned
+    alias = getattr(settings, 'IDEMPOTENCY_CACHE', 'default')
+    if not _warned and not caching.is_shared(alias):
+        _warned = True
+        logger.warning("IDEMPOTENCY_CACHE is local to this process: retries on other workers run the write again")
+    return caches[alias]
+
+
+def _cache_key(request, view_name, key):
+    # v3: резерв (відбиток, PENDING) або (відбиток, статус, дані)
+    return f"idempotency:v3:{request.user.pk}:{view_name}:{key}"
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method}|{request.get_full_path()}|{body}".encode()).hexdigest()
+
+
+def _pending_ttl():
+    return getattr(settings, 'IDEMPOTENCY_PENDING_TTL', 60)
+
+
+def _stored_response(stored, fingerprint):
+    if stored[0] != fingerprint:
+        return Response(
+            {"error": "Idempotency-Key was already used with a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if stored[1] == PENDING:
+        response = Response(
+            {"error": "A request with this Idempotency-Key is still in progress."},
+            status=status.HTTP_409_CONFLICT,
+        )
+        response['Retry-After'] = '1'
+        return response
+    _, status_code, data = stored
+    response = Response(data, status=status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """Декоратор для методів ViewSet (action'ів), що змінюють дані."""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        cache = _cache()
+        cache_key = _cache_key(request, f"{self.basename}:{view_method.__name__}", key[:128])
+        fingerprint = _fingerprint(request)
+        if not cache.add(cache_key, (fingerprint, PENDING), _pending_ttl()):
+            # Резерв міг щойно зникнути (перший запит не вдався) — тоді теж "ще виконується"
+            return _stored_response(cache.get(cache_key) or (fingerprint, PENDING), fingerprint)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except BaseException:
+            cache.delete(cache_key)
+            raise
+        if 200 <= response.status_code < 300:
+            cache.set(cache_key, (fingerprint, response.status_code, response.data),
+                      getattr(settings, 'IDEMPOTENCY_TTL', 24 * 3600))
+        else:
+            cache.delete(cache_key)
+        return response
+
+    return wrapper
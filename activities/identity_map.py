@@ -0,0 +1,186 @@
+"""
+Identity map для рядків User і Profile.
+
+У межах запиту (IdentityMapMiddleware) кожен User / Profile завантажується
+щонайбільше один раз: FK-дескриптори (activity.user, follower.followee,
+user.profile, ...) і get_by_id репозиторіїв спершу дивляться в карту
+поточного запиту. Промах іде в міжзапитний LRU (USER_CACHE_SIZE), і лише
+потім — у БД. Поза запитом (команди, outbox) поведінка стандартна.
+
+LRU інвалідується при записі (сигнали і репозиторії). Як і для
+UserSummary, запис збільшує "покоління" рядка у спільному кеші Django
+(USER_CACHE), а локальна копія валідна, поки її покоління збігається
+зі спільним, тож інші воркери не віддадуть застарілий рядок. Якщо
+USER_CACHE не спільний між процесами (LocMemCache) або недоступний, LRU
+не використовується: карта живе лише в межах запиту.
+
+Profile адресується за user_id (як у ProfileRepository), User — за pk.
+"""
+import copy
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.fields.related_descriptors import (
+    ForwardManyToOneDescriptor,
+    ForwardOneToOneDescriptor,
+    ReverseOneToOneDescriptor,
+)
+
+import logging
+
+from . import metrics
+from .caching import LRUCache, is_shared
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+KEY_FIELDS = {User: 'pk', Profile: 'user_id'}
+
+_request_map = ContextVar('identity_map', default=None)
+_lru = LRUCache(getattr(settings, 'USER_CACHE_SIZE', 10000))
+
+
+def activate():
+    return _request_map.set({})
+
+
+def deactivate(token):
+    _request_map.reset(token)
+
+
+def _key(model, value):
+    return model._meta.label_lower, value
+
+
+def _cache_alias():
+    return getattr(settings, 'USER_CACHE', 'default')
+
+
+def _shared_cache():
+    return caches[_cache_alias()]
+
+
+def _generation(key):
+    """Покоління рядка у спільному кеші або None, якщо LRU довіряти не можна."""
+    if not is_shared(_cache_alias()):
+        # Інвалідація з інших процесів сюди не дійде
+        return None
+    try:
+        return _shared_cache().get(_generation_key(key), 0)
+    except Exception:
+        logger.warning("USER_CACHE is unavailable; identity map falls back to the request scope", exc_info=True)
+        return None
+
+
+def _generation_key(key):
+    return f"identity-gen:{key[0]}:{key[1]}"
+
+
+def _detached(instance):
+    # Копія без закешованих зв'язків: кешований рядок не тягне за собою чужі об'єкти
+    instance = copy.copy(instance)
+    instance._state.fields_cache = {}
+    instance.__dict__.pop('_prefetched_objects_cache', None)
+    return instance
+
+
+def remember(instance):
+    """Кладе вже завантажений екземпляр (напр. request.user) у карту запиту."""
+    identity = _request_map.get()
+    model = type(instance)
+    if identity is None or model not in KEY_FIELDS:
+        return
+    value = getattr(instance, KEY_FIELDS[model])
+    if value is not None:
+        identity[_key(model, value)] = instance
+
+
+def get(model, value, load):
+    """Екземпляр model за ключем value: карта запиту -> LRU -> load() (None, якщо рядка немає)."""
+    identity = _request_map.get()
+    if identity is None:
+        return load()
+    key = _key(model, value)
+    if key in identity:
+        return identity[key]
+
+    generation = _generation(key)
+    cached = _lru.get(key) if generation is not None else None
+    if cached is not None and cached[0] == generation:
+        metrics.inc('cache_requests_total', cache='user_rows', result='hit')
+        instance = _detached(cached[1])
+    else:
+        metrics.inc('cache_requests_total', cache='user_rows', result='miss')
+        instance = load()
+        if instance is not None and generation is not None:
+            _lru.set(key, (generation, _detached(instance)))
+    identity[key] = instance
+    return instance
+
+
+def _bump_generation(key):
+    _lru.pop(key)
+    if not is_shared(_cache_alias()):
+        return
+    cache = _shared_cache()
+    generation_key = _generation_key(key)
+    try:
+        cache.incr(generation_key)
+    except ValueError:
+        cache.set(generation_key, 1, None)
+
+
+def invalidate(model, value):
+    """Скидає рядок у карті запиту і LRU; покоління збільшується після коміту."""
+    key = _key(model, value)
+    identity = _request_map.get()
+    if identity is not None:
+        identity.pop(key, None)
+    _lru.pop(key)
+    transaction.on_commit(lambda: _bump_generation(key))
+
+
+class IdentityMapForwardDescriptor(ForwardManyToOneDescriptor):
+    """activity.user, follower.followee, ...: через карту запиту / LRU."""
+
+    def get_object(self, instance):
+        load = super().get_object
+        return get(self.field.remote_field.model, getattr(instance, self.field.attname), lambda: load(instance))
+
+
+class IdentityMapForwardOneToOneDescriptor(ForwardOneToOneDescriptor):
+    """profile.user."""
+
+    def get_object(self, instance):
+        load = super().get_object
+        return get(self.field.remote_field.model, getattr(instance, self.field.attname), lambda: load(instance))
+
+
+class IdentityMapProfileDescriptor(ReverseOneToOneDescriptor):
+    """user.profile."""
+
+    def __get__(self, instance, cls=None):
+        if instance is None or _request_map.get() is None or self.related.is_cached(instance):
+            return super().__get__(instance, cls)
+        profile = get(Profile, instance.pk, lambda: Profile.objects.filter(user_id=instance.pk).first())
+        if profile is None:
+            return super().__get__(instance, cls)  # стандартний RelatedObjectDoesNotExist
+        self.related.set_cached_value(instance, profile)
+        return profile
+
+
+def install(app_config):
+    """Підміняє дескриптори FK на User у моделях застосунку та user.profile."""
+    for model in app_config.get_models():
+        for field in model._meta.concrete_fields:
+            if not field.is_relation or field.remote_field.model is not User:
+                continue
+            if field.target_field != User._meta.pk:
+                continue
+            descriptor = IdentityMapForwardOneToOneDescriptor if field.one_to_one else IdentityMapForwardDescriptor
+            setattr(model, field.name, descriptor(field))
+    related = Profile._meta.get_field('user').remote_field
+    setattr(User, related.get_accessor_name(), IdentityMapProfileDescriptor(related))
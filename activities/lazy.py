@@ -0,0 +1,47 @@
+"""
+Відкладений імпорт важких залежностей (numpy, pandas).
+
+lazy_import() повертає заступник модуля, який імпортує справжній модуль
+лише при першому зверненні до атрибута. Тож воркер, management-команда чи
+тест, що не торкаються аналітики / графа / архіву треків, не платять за
+імпорт numpy і pandas (разом ~0.2 с на старті). Час старту:
+manage.py import_profile.
+
+Перший імпорт іде під блокуванням через звичайний importlib.import_module
+(importlib.util.LazyLoader на 3.11 не потокобезпечний: два потоки можуть
+одночасно виконати модуль або побачити його напівзавантаженим).
+"""
+import importlib
+import importlib.util
+import sys
+import threading
+import types
+
+
+class _LazyModule(types.ModuleType):
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+        self._lazy_module = None
+
+    def _load(self):
+        with self._lazy_lock:
+            if self._lazy_module is None:
+                module = importlib.import_module(self.__name__)
+                # Далі атрибути читаються прямо з __dict__, без __getattr__
+                self.__dict__.update(module.__dict__)
+                self._lazy_module = module
+        return self._lazy_module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    return _LazyModule(name)
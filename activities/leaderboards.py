@@ -0,0 +1,197 @@
+"""
+Лідерборди за дистанцією для ковзних вікон (week, 30d, month, year, all).
+
+Для кожного вікна в пам'яті процесу тримаються відсортовані таблиці
+(RankedScores): одна по всіх типах активностей і по одній на кожен
+activity_type. Будуються вони одним агрегатним запитом до Activity
+(user, activity_type, Sum(distance_m)) від початку вікна, а далі
+оновлюються інкрементально при створенні/видаленні активності.
+Ранг користувача — бінарний пошук, O(log n).
+
+Таблиці вікна перебудовуються, коли зсувається його початок (новий
+тиждень, новий день для 30d) або минає LEADERBOARD_REBUILD_SECONDS —
+так обмежується відставання від записів, зроблених іншими процесами
+(і від активностей, закомічених саме під час перебудови). Агрегат
+виконується поза спільним блокуванням, готові таблиці підміняються під ним.
+Зміна активності через update() скидає всі таблиці.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import sharding
+from .models import Activity
+
+WINDOWS = ('week', '30d', 'month', 'year', 'all')
+
+
+class RankedScores:
+    """Рахунки користувачів, відсортовані за спаданням (ключ (-score, user_id))."""
+
+    def __init__(self, scores=None):
+        self.scores = {user_id: score for user_id, score in (scores or {}).items() if score > 0}
+        self._keys = sorted((-score, user_id) for user_id, score in self.scores.items())
+
+    def add(self, user_id, delta):
+        old = self.scores.get(user_id)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, user_id))]
+        score = (old or 0) + delta
+        if score > 1e-9:  # з урахуванням похибки float після віднімань
+            self.scores[user_id] = score
+            insort(self._keys, (-score, user_id))
+        else:
+            self.scores.pop(user_id, None)
+
+    def rank(self, user_id):
+        """(місце, рахунок) або None, якщо користувача немає в таблиці."""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return bisect_left(self._keys, (-score, user_id)) + 1, score
+
+    def top(self, limit):
+        return [(user_id, -negative) for negative, user_id in self._keys[:limit]]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def window_start(window, now=None):
+    """Початок вікна (aware datetime) або None для 'all'."""
+    now = timezone.localtime(now or timezone.now())
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == 'week':
+        return midnight - timedelta(days=midnight.weekday())
+    if window == '30d':
+        return midnight - timedelta(days=29)
+    if window == 'month':
+        return midnight.replace(day=1)
+    if window == 'year':
+        return midnight.replace(month=1, day=1)
+    if window == 'all':
+        return None
+    raise ValueError(f"Unknown leaderboard window: {window}")
+
+
+class _WindowBoards:
+    def __init__(self, start, overall, by_type):
+        self.start = start
+        self.built_at = time.monotonic()
+        self.overall = RankedScores(overall)
+        self.by_type = {activity_type: RankedScores(scores) for activity_type, scores in by_type.items()}
+
+    def add(self, user_id, activity_type, distance):
+        self.overall.add(user_id, distance)
+        self.by_type.setdefault(activity_type, RankedScores()).add(user_id, distance)
+
+    def board(self, activity_type=None):
+        if activity_type is None:
+            return self.overall
+        return self.by_type.get(activity_type, RankedScores())
+
+
+_lock = threading.RLock()
+_windows = {}
+# Будування вікна (агрегат до БД) — під окремим блокуванням вікна, не під _lock
+_build_locks = {window: threading.Lock() for window in WINDOWS}
+_generation = 0
+
+
+def _rebuild_seconds():
+    return getattr(settings, 'LEADERBOARD_REBUILD_SECONDS', 300)
+
+
+def _build(start):
+    qs = Activity.objects.all()
+    if start is not None:
+        qs = qs.filter(start_time__gte=start)
+    rows = qs.values_list('user_id', 'activity_type').annotate(total=Sum('distance_m')).order_by()
+    overall, by_type = {}, {}
+    # З шардуванням — рядки всіх шардів (користувач живе на одному шарді)
+    for user_id, activity_type, total in (sharding.scatter(rows) if sharding.is_enabled() else rows.iterator()):
+        overall[user_id] = overall.get(user_id, 0) + (total or 0)
+        by_type.setdefault(activity_type, {})[user_id] = total or 0
+    # Сортування один раз, а не вставка по одному
+    return _WindowBoards(start, overall, by_type)
+
+
+def _current(window, start):
+    with _lock:
+        boards = _windows.get(window)
+        if boards is None or boards.start != start or time.monotonic() - boards.built_at > _rebuild_seconds():
+            return None
+        return boards
+
+
+def _get_window(window):
+    start = window_start(window)
+    boards = _current(window, start)
+    if boards is not None:
+        return boards
+    with _build_locks[window]:
+        # Поки чекали, вікно міг побудувати інший потік
+        boards = _current(window, start)
+        if boards is not None:
+            return boards
+        generation = _generation
+        boards = _build(start)
+        with _lock:
+            # invalidate() під час будування: результат міг не побачити зміну, не кешуємо його
+            if generation == _generation:
+                _windows[window] = boards
+        return boards
+
+
+def invalidate():
+    global _generation
+    with _lock:
+        _generation += 1
+        _windows.clear()
+
+
+def _apply(activity, sign):
+    if activity.start_time is None:
+        return
+    with _lock:
+        for boards in _windows.values():
+            if boards.start is None or activity.start_time >= boards.start:
+                boards.add(activity.user_id, activity.activity_type, sign * activity.distance_m)
+
+
+def record_activity(activity, sign=1):
+    """Інкрементально враховує створену (sign=1) чи видалену (sign=-1) активність після коміту."""
+    transaction.on_commit(lambda: _apply(activity, sign))
+
+
+def get_leaderboard(window='all', activity_type=None, user_ids=None, limit=10, user_id=None):
+    """
+    Топ-limit користувачів вікна. user_ids обмежує таблицю колом користувачів
+    (наприклад, підписки). Для user_id додатково повертається його місце.
+    """
+    boards = _get_window(window)
+    with _lock:
+        board = boards.board(activity_type)
+        if user_ids is None:
+            top = board.top(limit)
+            total = len(board)
+            me = board.rank(user_id) if user_id is not None else None
+        else:
+            # Коло невелике: сортуємо лише його рахунки
+            circle = sorted(
+                ((uid, board.scores[uid]) for uid in set(user_ids) if uid in board.scores),
+                key=lambda item: (-item[1], item[0]),
+            )
+            top = circle[:limit]
+            total = len(circle)
+            me = next(
+                ((place, score) for place, (uid, score) in enumerate(circle, start=1) if uid == user_id),
+                None,
+            )
+    return {'start': boards.start, 'top': top, 'total': total, 'me': me}
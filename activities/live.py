@@ -0,0 +1,455 @@
+"""
+Живий трекінг: потокове завантаження точок активності через WebSocket (ASGI).
+
+    ws(s)://<host>/ws/activities/<id>/live/?token=<DRF token>
+
+Власник активності надсилає JSON {"points": [{"lat", "lon", "recorded_at", ...}, ...]}
+кожні кілька секунд і {"type": "finish"} наприкінці. Інші користувачі, що
+підписані на власника, на тому ж з'єднанні отримують
+{"type": "position", "activity_id", "point", "points_received"} з останньою
+позицією і {"type": "finished"} після завершення.
+
+Точки не пишуться по одній: вони накопичуються в пам'яті процесу, а одна
+фонова задача (LiveHub) раз на LIVE_FLUSH_SECONDS або коли в буферах
+набралося LIVE_FLUSH_POINTS точок записує їх в окремому потоці, без
+блокування event loop: кожну сесію — своїм unit of work (bulk_create).
+Точки лишаються в буфері сесії до коміту; якщо запис не вдався, вони
+пишуться з наступним скиданням, а збій однієї сесії не зачіпає інших.
+Одне з'єднання — це лише корутина, тож тисячі сесій на процес коштують
+пам'яті буферів.
+
+Повільний підписник не гальмує інших: черга кожного тримає лише останню
+позицію. Останні позиції після запису потрапляють у спільний кеш
+LIVE_CACHE, тож підписники, з'єднання яких обслуговує інший процес,
+отримують їх із затримкою до LIVE_FLUSH_SECONDS; так само, після останньої
+позиції, туди потрапляє й завершення сесії ({"type": "finished"}). Кеш, який бачить лише
+поточний процес (LocMem, як у 'default' без CACHES), не використовується:
+тоді живий трекінг працює лише в межах одного процесу ASGI-сервера.
+Точки, ще не записані на момент аварійної зупинки процесу, губляться;
+при штатній зупинці (ASGI lifespan) буфери скидаються в БД.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections
+from rest_framework.authtoken.models import Token
+
+from . import caching, metrics, sharding
+from .models import Activity, Follower
+from .serializer import UploadPointSerializer
+
+logger = logging.getLogger(__name__)
+
+PATH = re.compile(r'/ws/activities/(?P<activity_id>\d+)/live/?')
+MAX_MESSAGE_POINTS = 1000
+
+# Коди закриття WebSocket (4000-4999 — для застосунку)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+
+def flush_seconds():
+    return getattr(settings, 'LIVE_FLUSH_SECONDS', 2.0)
+
+
+def flush_points():
+    return getattr(settings, 'LIVE_FLUSH_POINTS', 5000)
+
+
+def max_session_points():
+    return getattr(settings, 'LIVE_MAX_SESSION_POINTS', 20000)
+
+
+def _shared_cache():
+    """Кеш позицій між процесами; None, якщо LIVE_CACHE видно лише поточному процесу."""
+    alias = getattr(settings, 'LIVE_CACHE', 'default')
+    return caches[alias] if caching.is_shared(alias) else None
+
+
+def _position_key(activity_id):
+    return f"live-position:{activity_id}"
+
+
+def _finished_key(activity_id):
+    return f"live-finished:{activity_id}"
+
+
+def _cache_timeout():
+    return max(60, flush_seconds() * 10)
+
+
+class LiveSession:
+    """Буфер і підписники однієї активності в цьому процесі."""
+
+    def __init__(self, activity_id, owner_id):
+        self.activity_id = activity_id
+        self.owner_id = owner_id
+        self.points = []  # ще не записані в БД
+        self.received = 0
+        self.latest = None
+        self.publishers = 0
+        self.subscribers = set()  # asyncio.Queue(maxsize=1)
+
+    def broadcast(self, message):
+        for queue in self.subscribers:
+            # Лише останнє повідомлення: попереднє, якщо підписник його не забрав, витісняється
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    def position_message(self):
+        return {
+            "type": "position",
+            "activity_id": self.activity_id,
+            "point": self.latest,
+            "points_received": self.received,
+        }
+
+
+class LiveHub:
+    """Живі сесії процесу і фонова задача пакетного запису точок."""
+
+    def __init__(self):
+        self.sessions = {}  # activity_id -> LiveSession
+        self._buffered = 0
+        self._wake = None
+        self._task = None
+        self._flush_lock = asyncio.Lock()
+
+    def _ensure_flusher(self):
+        if self._task is None or self._task.done():
+            if _shared_cache() is None:
+                logger.warning("LIVE_CACHE is local to this process: live positions reach only its subscribers")
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def session(self, activity_id, owner_id):
+        self._ensure_flusher()
+        session = self.sessions.get(activity_id)
+        if session is None:
+            session = self.sessions[activity_id] = LiveSession(activity_id, owner_id)
+        return session
+
+    def release(self, session):
+        if not (session.publishers or session.subscribers or session.points):
+            self.sessions.pop(session.activity_id, None)
+
+    def push(self, session, points):
+        """Додає точки до буфера сесії. False — буфер сесії переповнений (БД не встигає)."""
+        if len(session.points) + len(points) > max_session_points():
+            metrics.inc('live_points_total', len(points), result='rejected')
+            return False
+        session.points.extend(points)
+        session.received += len(points)
+        self._buffered += len(points)
+        metrics.inc('live_points_total', len(points), result='received')
+        session.latest = _public_point(points[-1])
+        session.broadcast(session.position_message())
+        if self._buffered >= flush_points():
+            self._wake.set()
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), flush_seconds())
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+                await self._poll_remote()
+            except Exception:
+                logger.exception("Live tracking flush failed")
+
+    async def flush(self):
+        """Записує буфери сесій (кожну окремим unit of work). Повертає кількість записаних точок."""
+        async with self._flush_lock:
+            # Копії: точки, що прийдуть під час запису, дописуються в буфер після них
+            batch = {session.activity_id: list(session.points) for session in self.sessions.values() if session.points}
+            written, positions = 0, {}
+            if batch:
+                started = time.perf_counter()
+                # Окремий потік, щоб запис не блокував перевірки нових з'єднань
+                results = await sync_to_async(_write_points, thread_sensitive=False)(batch)
+                metrics.observe('live_flush_duration_seconds', time.perf_counter() - started)
+                for activity_id, result in results.items():
+                    session, buffered = self.sessions[activity_id], len(batch[activity_id])
+                    if isinstance(result, Exception) and not isinstance(result, ValidationError):
+                        # Точки лишаються в буфері до наступного скидання
+                        logger.error("Live points of activity %s were not saved", activity_id, exc_info=result)
+                        continue
+                    del session.points[:buffered]
+                    if isinstance(result, Exception):
+                        logger.warning("Live points of activity %s dropped: %s", activity_id, result)
+                        result = 0
+                    written += result
+                    if result < buffered:
+                        metrics.inc('live_points_total', buffered - result, result='dropped')
+                    if result:
+                        positions[_position_key(activity_id)] = session.position_message()
+                metrics.inc('live_points_total', written, result='flushed')
+            self._buffered = sum(len(session.points) for session in self.sessions.values())
+            for session in list(self.sessions.values()):
+                self.release(session)
+        cache = _shared_cache()
+        if positions and cache is not None:
+            await cache.aset_many(positions, timeout=_cache_timeout())
+        return written
+
+    async def start(self, session):
+        """Власник (знову) веде сесію: завершення попередньої в LIVE_CACHE більше не діє."""
+        cache = _shared_cache()
+        if cache is not None:
+            await cache.adelete(_finished_key(session.activity_id))
+
+    async def finish(self, session):
+        """Завершення сесії: підписникам цього процесу — одразу, іншим — через LIVE_CACHE."""
+        message = {"type": "finished", "activity_id": session.activity_id}
+        session.broadcast(message)
+        cache = _shared_cache()
+        if cache is None:
+            return
+        try:
+            # Спершу остання позиція, щоб інші процеси не закрили з'єднання раніше за неї
+            await self.flush()
+        except Exception:
+            logger.exception("Live tracking flush failed")
+        await cache.aset(_finished_key(session.activity_id), message, timeout=_cache_timeout())
+
+    async def _poll_remote(self):
+        # Підписники активностей, точки яких приймає інший процес
+        remote = [session for session in self.sessions.values() if session.subscribers and not session.publishers]
+        cache = _shared_cache()
+        if not remote or cache is None:
+            return
+        stored = await cache.aget_many(
+            [key(session.activity_id) for session in remote for key in (_position_key, _finished_key)]
+        )
+        for session in remote:
+            message = stored.get(_position_key(session.activity_id))
+            if message is not None and message['points_received'] != session.received:
+                session.received, session.latest = message['points_received'], message['point']
+                session.broadcast(message)
+            finished = stored.get(_finished_key(session.activity_id))
+            if finished is not None:
+                # Підписник закриває з'єднання, отримавши його
+                session.broadcast(finished)
+
+    async def close(self):
+        """Скидає всі буфери (зупинка процесу)."""
+        if self._task is not None:
+            # Не перериваємо запис посередині: потік дописав би точки, які лишилися в буфері
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+hub = LiveHub()
+
+
+def _public_point(point):
+    return {
+        key: value.isoformat() if hasattr(value, 'isoformat') else value
+        for key, value in point.items()
+    }
+
+
+def _database_call(function):
+    """sync_to_async для запитів з корутин; з'єднання з БД закриваються, як після HTTP-запиту."""
+    def call(*args):
+        close_old_connections()
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(call)
+
+
+def _write_points(batch):
+    """
+    {activity_id: [точки]} -> {activity_id: записано точок | виняток}. Кожна активність —
+    окрема транзакція; точки видалених активностей відкидаються (0).
+    """
+    close_old_connections()
+    try:
+        existing = set(sharding.scatter(Activity.objects.filter(id__in=list(batch)).values_list('id', flat=True)))
+        results = {}
+        for activity_id, points in batch.items():
+            try:
+                results[activity_id] = _write_session(activity_id, points) if activity_id in existing else 0
+            except Exception as error:
+                results[activity_id] = error
+        return results
+    finally:
+        close_old_connections()
+
+
+def _write_session(activity_id, points):
+    from .repositories import DataAccessLayer
+    with DataAccessLayer() as db:
+        for point in points:
+            db.activity_points.add(activity_id=activity_id, **point)
+    return len(points)
+
+
+def _token(scope):
+    # Браузерний WebSocket не вміє задавати заголовки, тому й ?token=
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization' and value.startswith(b'Token '):
+            return value[6:].decode().strip()
+    return parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+
+
+def _connect(scope, activity_id):
+    """(user_id, owner_id, роль 'publisher' | 'subscriber' | None); None замість id, якщо їх не знайдено."""
+    key = _token(scope)
+    user_id = Token.objects.filter(key=key, user__is_active=True).values_list('user_id', flat=True).first() if key else None
+    if user_id is None:
+        return None, None, None
+    owner_id = (
+        Activity.objects.using(sharding.locate(Activity, activity_id))
+        .filter(id=activity_id).values_list('user_id', flat=True).first()
+    )
+    if owner_id is None:
+        return user_id, None, None
+    if owner_id == user_id:
+        return user_id, owner_id, 'publisher'
+    if Follower.objects.filter(follower_id=user_id, followee_id=owner_id).exists():
+        return user_id, owner_id, 'subscriber'
+    return user_id, owner_id, None
+
+
+def _decode(message):
+    try:
+        return json.loads(message.get('text') or message.get('bytes') or '')
+    except ValueError:
+        return None
+
+
+def _parse_points(payload):
+    """(точки, помилки) з повідомлення {"points": [...]}."""
+    if not isinstance(payload, dict) or not isinstance(payload.get('points'), list):
+        return None, {"points": "Expected a JSON object with a list of points."}
+    if len(payload['points']) > MAX_MESSAGE_POINTS:
+        return None, {"points": f"At most {MAX_MESSAGE_POINTS} points per message."}
+    serializer = UploadPointSerializer(data=payload['points'], many=True)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    return [dict(point) for point in serializer.validated_data], None
+
+
+async def _send_json(send, message):
+    await send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+
+async def _close(send, code):
+    await send({'type': 'websocket.close', 'code': code})
+
+
+async def websocket(scope, receive, send):
+    match = PATH.fullmatch(scope['path'])
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    if match is None:
+        return await _close(send, CLOSE_NOT_FOUND)
+    activity_id = int(match['activity_id'])
+    user_id, owner_id, role = await _database_call(_connect)(scope, activity_id)
+    if user_id is None:
+        return await _close(send, CLOSE_UNAUTHORIZED)
+    if owner_id is None:
+        return await _close(send, CLOSE_NOT_FOUND)
+    if role is None:
+        return await _close(send, CLOSE_FORBIDDEN)
+
+    await send({'type': 'websocket.accept'})
+    session = hub.session(activity_id, owner_id)
+    try:
+        if role == 'publisher':
+            await _publish(session, receive, send)
+        else:
+            await _subscribe(session, receive, send)
+    finally:
+        hub.release(session)
+
+
+async def _publish(session, receive, send):
+    session.publishers += 1
+    try:
+        await hub.start(session)
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            payload = _decode(message)
+            if isinstance(payload, dict) and payload.get('type') == 'finish':
+                await hub.finish(session)
+                await _close(send, 1000)
+                return
+            points, errors = _parse_points(payload)
+            if errors:
+                await _send_json(send, {"type": "error", "errors": errors})
+            elif points and not hub.push(session, points):
+                await _send_json(send, {"type": "error", "errors": {"detail": "Too many unsaved points, retry later."}})
+    finally:
+        session.publishers -= 1
+
+
+async def _subscribe(session, receive, send):
+    queue = asyncio.Queue(maxsize=1)
+    session.subscribers.add(queue)
+    if session.latest is not None:
+        queue.put_nowait(session.position_message())
+    receiving = asyncio.ensure_future(receive())
+    try:
+        while True:
+            getting = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({receiving, getting}, return_when=asyncio.FIRST_COMPLETED)
+            if getting in done:
+                message = getting.result()
+                await _send_json(send, message)
+                if message['type'] == 'finished':
+                    await _close(send, 1000)
+                    return
+            else:
+                getting.cancel()
+            if receiving in done:
+                # Від підписника чекаємо лише відключення, інші повідомлення ігноруються
+                if receiving.result()['type'] == 'websocket.disconnect':
+                    return
+                receiving = asyncio.ensure_future(receive())
+    finally:
+        receiving.cancel()
+        session.subscribers.discard(queue)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await hub.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI-застосунок для scope 'websocket' і 'lifespan' (HTTP обробляє Django, див. lab32/asgi.py)."""
+    if scope['type'] == 'websocket':
+        return await websocket(scope, receive, send)
+    return await lifespan(scope, receive, send)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from activities import track_archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносить GPS-точки старих активностей у холодний архів на диску "
+        "(файл на активність) і видаляє їх з БД. --rehydrate повертає трек назад."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=30,
+                            help="Архівувати активності, що почалися раніше, ніж N днів тому.")
+        parser.add_argument('--limit', type=int, default=None, help="Максимум активностей за запуск.")
+        parser.add_argument('--rehydrate', type=int, nargs='+', default=None, metavar='ACTIVITY_ID',
+                            help="Повернути точки вказаних активностей з архіву в БД.")
+
+    def handle(self, *args, **options):
+        if options['rehydrate']:
+            for activity_id in options['rehydrate']:
+                restored = track_archive.rehydrate(activity_id)
+                self.stdout.write(f"activity {activity_id}: {restored} points restored")
+            return
+
+        archived = track_archive.archive_older_than(options['older_than_days'], options['limit'])
+        points = sum(track.point_count for track in archived)
+        size = sum(track.size_bytes for track in archived)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {len(archived)} tracks ({points:,} points, {size / 1024:,.1f} KiB) "
+            f"to {track_archive.archive_dir()}"
+        ))
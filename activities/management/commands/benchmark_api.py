@@ -0,0 +1,181 @@
+import json
+import random
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from activities.models import Activity, Comment, Profile
+
+# name: (шлях, модель для вибору випадкового pk або None)
+ENDPOINTS = {
+    'users-list': ('/api/users/', None),
+    'profiles-list': ('/api/profiles/', None),
+    'profile-detail': ('/api/profiles/{pk}/', Profile),
+    'activities-list': ('/api/activities/', None),
+    'activity-detail': ('/api/activities/{pk}/', Activity),
+    'comments-list': ('/api/comments/', None),
+    'comment-detail': ('/api/comments/{pk}/', Comment),
+    'kudos-list': ('/api/kudos/', None),
+    'followers-list': ('/api/followers/', None),
+    'analytics-leaderboard': ('/api/analytics/leaderboard/', None),
+    'analytics-social-engagement': ('/api/analytics/social_engagement/', None),
+    'analytics-monthly-trends': ('/api/analytics/monthly_trends/', None),
+    'analytics-influencers': ('/api/analytics/influencers/', None),
+    'analytics-activity-performance': ('/api/analytics/activity_performance/', None),
+    'analytics-user-levels': ('/api/analytics/user_levels/', None),
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Навантажувальний бенчмарк REST API проти запущеного сервера: "
+        "p50/p95/p99, throughput і кількість SQL-запитів на запит; результат у JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help="Список через кому. Доступні: " + ", ".join(ENDPOINTS))
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=100, help="Запитів на ендпоінт.")
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default=None,
+                            help="Куди зберегти JSON (за замовчуванням benchmarks/results-<commit>.json).")
+        parser.add_argument('--compare', default=None, help="Попередній JSON для порівняння.")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(unknown)}")
+
+        rng = random.Random(options['seed'])
+        user, _ = User.objects.get_or_create(username='benchmark')
+        token, _ = Token.objects.get_or_create(user=user)
+        headers = {'Authorization': f"Token {token.key}", 'Accept': 'application/json'}
+
+        results = {}
+        for name in names:
+            path, model = ENDPOINTS[name]
+            urls = self._build_urls(options['base_url'], path, model, options['requests'], rng)
+            if not urls:
+                self.stdout.write(self.style.WARNING(f"{name}: no data, skipped"))
+                continue
+            for url in urls[:options['warmup']]:
+                self._request(url, headers, options['timeout'])
+            results[name] = self._run(urls, headers, options['concurrency'], options['timeout'])
+            self._print_row(name, results[name])
+
+        report = {
+            'commit': git_commit(),
+            'created_at': datetime.now(dt_timezone.utc).isoformat(),
+            'config': {
+                key: options[key] for key in ('base_url', 'concurrency', 'requests', 'warmup', 'seed')
+            },
+            'endpoints': results,
+        }
+        output = Path(options['output'] or f"benchmarks/results-{report['commit'] or 'local'}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Saved {output}"))
+
+        if options['compare']:
+            self._compare(json.loads(Path(options['compare']).read_text()), report)
+
+    def _build_urls(self, base_url, path, model, count, rng):
+        if model is None:
+            return [base_url + path] * count
+        pk_field = 'user_id' if model is Profile else 'id'
+        pks = list(model.objects.order_by('?').values_list(pk_field, flat=True)[:200])
+        if not pks:
+            return []
+        return [base_url + path.format(pk=rng.choice(pks)) for _ in range(count)]
+
+    def _request(self, url, headers, timeout):
+        request = urllib.request.Request(url, headers=headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                body = response.read()
+                status, response_headers = response.status, response.headers
+        except urllib.error.HTTPError as error:
+            body, status, response_headers = error.read(), error.code, error.headers
+        except (urllib.error.URLError, OSError):
+            return {'latency': time.perf_counter() - start, 'status': None, 'queries': None, 'bytes': 0}
+        queries = response_headers.get('X-DB-Query-Count')
+        return {
+            'latency': time.perf_counter() - start,
+            'status': status,
+            'queries': int(queries) if queries is not None else None,
+            'bytes': len(body),
+        }
+
+    def _run(self, urls, headers, concurrency, timeout):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(lambda url: self._request(url, headers, timeout), urls))
+        wall = time.perf_counter() - start
+
+        latencies = sorted(sample['latency'] * 1000 for sample in samples)
+        queries = [sample['queries'] for sample in samples if sample['queries'] is not None]
+        errors = sum(1 for sample in samples if sample['status'] is None or sample['status'] >= 400)
+        return {
+            'requests': len(samples),
+            'errors': errors,
+            'throughput_rps': round(len(samples) / wall, 2) if wall else None,
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies), 2),
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'max': round(latencies[-1], 2),
+            },
+            'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+            'avg_response_bytes': round(sum(sample['bytes'] for sample in samples) / len(samples)),
+        }
+
+    def _print_row(self, name, result):
+        latency = result['latency_ms']
+        self.stdout.write(
+            f"{name:32} p50={latency['p50']:>8}ms p95={latency['p95']:>8}ms p99={latency['p99']:>8}ms "
+            f"rps={result['throughput_rps']:>8} queries={result['queries_per_request']} errors={result['errors']}"
+        )
+
+    def _compare(self, previous, current):
+        self.stdout.write(f"\nCompare {previous.get('commit')} -> {current.get('commit')}")
+        for name, result in current['endpoints'].items():
+            old = previous.get('endpoints', {}).get(name)
+            if not old:
+                continue
+            old_p95, new_p95 = old['latency_ms']['p95'], result['latency_ms']['p95']
+            change = (new_p95 - old_p95) / old_p95 * 100 if old_p95 else 0.0
+            self.stdout.write(
+                f"{name:32} p95 {old_p95:>8} -> {new_p95:>8} ms ({change:+.1f}%) "
+                f"queries {old.get('queries_per_request')} -> {result.get('queries_per_request')}"
+            )
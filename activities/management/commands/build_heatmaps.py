@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from activities import heatmap
+from activities.models import Activity
+
+
+class Command(BaseCommand):
+    help = (
+        "Будує або інкрементально оновлює теплові карти користувачів (напр. після generate_data, "
+        "щоб перший запит тайла не чекав на повну побудову)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, nargs='+', default=None, metavar='USER_ID',
+                            help="Лише вказані користувачі (за замовчуванням — усі, хто має активності).")
+        parser.add_argument('--rebuild', action='store_true', help="Перебудувати з нуля.")
+
+    def handle(self, *args, **options):
+        user_ids = options['user'] or list(
+            Activity.objects.order_by().values_list('user_id', flat=True).distinct()
+        )
+        if options['rebuild']:
+            for user_id in user_ids:
+                heatmap.bump_generation(user_id)
+
+        total_points = 0
+        start = time.perf_counter()
+        for user_id in user_ids:
+            meta = heatmap.refresh(user_id)
+            total_points += meta['point_count']
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(user_ids)} heatmaps ({total_points:,} points) up to date in "
+            f"{time.perf_counter() - start:.1f}s at {heatmap.heatmap_dir()}"
+        ))
@@ -0,0 +1,53 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from activities import summaries
+from activities.models import UserSummary
+
+
+class Command(BaseCommand):
+    help = "Перевіряє узгодженість UserSummary з реальними даними (Activity / Follower / Kudos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help="Перерахувати та зберегти підсумки для неузгоджених користувачів."
+        )
+
+    def handle(self, *args, **options):
+        expected = summaries.compute_all_summaries()
+        stored = {
+            row['user_id']: row
+            for row in UserSummary.objects.values('user_id', *summaries.SUMMARY_FIELDS)
+        }
+
+        mismatched = []
+        for user_id in User.objects.values_list('id', flat=True).iterator():
+            actual = stored.get(user_id)
+            if actual is None:
+                # Рядок буде побудований ліниво при першому читанні
+                continue
+            wanted = expected.get(user_id, dict.fromkeys(summaries.SUMMARY_FIELDS, 0))
+            diff = {
+                field: (actual[field], wanted[field])
+                for field in summaries.SUMMARY_FIELDS
+                if abs(actual[field] - wanted[field]) > 1e-6
+            }
+            if diff:
+                mismatched.append(user_id)
+                self.stdout.write(f"user {user_id}: " + ", ".join(
+                    f"{field} {got} != {want}" for field, (got, want) in diff.items()
+                ))
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS(f"OK: {len(stored)} summaries are consistent."))
+            return
+
+        if options['fix']:
+            for user_id in mismatched:
+                summaries.rebuild_summary(user_id)
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatched)} summaries."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{len(mismatched)} inconsistent summaries (run with --fix to repair)."
+            ))
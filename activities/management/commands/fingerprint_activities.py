@@ -0,0 +1,55 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from activities import dedup, track_archive
+from activities.models import Activity, ActivityPoint, ArchivedTrack
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Будує відбитки (ActivityFingerprint) для пошуку дублікатів: для активностей без відбитка "
+        "(напр. після generate_data) або, з --all, для всіх. Підпис треку рахується з точок у БД і з архіву."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Перерахувати і наявні відбитки.")
+
+    def handle(self, *args, **options):
+        activities = Activity.objects.exclude(start_time=None).order_by('id')
+        if not options['all']:
+            activities = activities.filter(fingerprint__isnull=True)
+
+        recorded = duplicates = 0
+        ids = list(activities.values_list('id', flat=True))
+        for offset in range(0, len(ids), BATCH_SIZE):
+            batch = Activity.objects.in_bulk(ids[offset:offset + BATCH_SIZE])
+            tracks = self._tracks(list(batch))
+            for activity_id, activity in batch.items():
+                lat, lon = tracks.get(activity_id, ((), ()))
+                wanted = dedup.fingerprint(activity.start_time, activity.duration_sec, activity.distance_m, lat, lon)
+                if dedup.find_duplicate(activity.user_id, wanted, exclude_activity_id=activity_id) is not None:
+                    duplicates += 1
+                dedup.record(activity, wanted.track_minhash)
+                recorded += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Fingerprinted {recorded} activities."))
+        if duplicates:
+            self.stdout.write(self.style.WARNING(f"{duplicates} of them look like duplicates of other activities."))
+
+    def _tracks(self, activity_ids):
+        """{activity_id: (lat, lon)} з БД і холодного архіву."""
+        rows = (
+            ActivityPoint.objects.filter(activity_id__in=activity_ids)
+            .order_by('activity_id').values_list('activity_id', 'lat', 'lon')
+        )
+        tracks = {}
+        for activity_id, points in groupby(rows.iterator(), key=lambda row: row[0]):
+            points = list(points)
+            tracks[activity_id] = ([lat for _, lat, _ in points], [lon for _, _, lon in points])
+        for activity_id, path in ArchivedTrack.objects.filter(activity_id__in=activity_ids).values_list('activity_id', 'path'):
+            records = track_archive.open_track(track_archive.archive_dir() / path)
+            tracks[activity_id] = (records['lat'] / track_archive.COORD_SCALE, records['lon'] / track_archive.COORD_SCALE)
+        return tracks
@@ -0,0 +1,143 @@
+import multiprocessing
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from activities import (
+    bulkload, follow_graph, leaderboards, materialized, recompute, search, sharding, sketches, synthetic,
+)
+from activities.conditional import bump_version
+from activities.models import Activity, ActivityPoint, Comment, Follower, Kudos, Profile
+
+# Таблиці в порядку завантаження
+TABLE_MODELS = (
+    ('user', User),
+    ('profile', Profile),
+    ('follower', Follower),
+    ('activity', Activity),
+    ('point', ActivityPoint),
+    ('comment', Comment),
+    ('kudos', Kudos),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерує синтетичні дані (users, profiles, follows, activities, points, comments, kudos). "
+        "Генерація йде в пулі процесів, завантаження — через COPY (PostgreSQL) або bulk_create. "
+        "Результат детермінований від --seed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--activities-per-user', type=float, default=10.0,
+                            help="Середня кількість активностей на користувача.")
+        parser.add_argument('--activity-distribution', choices=('fixed', 'exponential', 'lognormal'),
+                            default='exponential')
+        parser.add_argument('--avg-follows', type=float, default=15.0,
+                            help="Середня кількість підписок на користувача (степеневий розподіл).")
+        parser.add_argument('--comments-per-activity', type=float, default=1.0)
+        parser.add_argument('--kudos-per-activity', type=float, default=3.0)
+        parser.add_argument('--point-interval', type=int, default=10,
+                            help="Інтервал між GPS-точками, секунд (0 — без треків).")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Користувачів на одну задачу пулу.")
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+        parser.add_argument('--no-copy', action='store_true', help="Не використовувати COPY навіть на PostgreSQL.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if sharding.is_enabled():
+            # COPY / bulk_create пишуть усе в default з id поза діапазонами шардів
+            raise CommandError(
+                "generate_data loads only into 'default'; run it with SHARD_DATABASES empty, "
+                "then enable sharding and run init_shards and rebalance_shards."
+            )
+        use_copy = bulkload.supports_copy() and not options['no_copy']
+        user_start = (User.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        activity_start = (Activity.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        user_count = options['users']
+        chunk_size = max(1, options['chunk_size'])
+        password = make_password('password')
+
+        tasks = [
+            {
+                'seed': options['seed'],
+                'chunk': chunk,
+                'user_start': user_start + offset,
+                'user_count': min(chunk_size, user_count - offset),
+                'all_user_start': user_start,
+                'all_user_count': user_count,
+                'activities_per_user': options['activities_per_user'],
+                'activity_distribution': options['activity_distribution'],
+                'avg_follows': options['avg_follows'],
+                'comments_per_activity': options['comments_per_activity'],
+                'kudos_per_activity': options['kudos_per_activity'],
+                'point_interval': options['point_interval'],
+                'password': password,
+                'format': 'copy' if use_copy else 'rows',
+            }
+            for chunk, offset in enumerate(range(0, user_count, chunk_size))
+        ]
+
+        started = time.perf_counter()
+        totals = {table: 0 for table, _ in TABLE_MODELS}
+        with multiprocessing.Pool(max(1, options['workers'])) as pool:
+            # Прохід 1: скільки активностей у кожному шматку -> діапазони id
+            activity_id = activity_start
+            for task, count in zip(tasks, pool.map(synthetic.chunk_activity_total, tasks)):
+                task['activity_id_base'] = activity_id
+                activity_id += count
+
+            # Прохід 2: генерація паралельно, завантаження по порядку в одній транзакції
+            with transaction.atomic():
+                for index, result in enumerate(pool.imap(synthetic.generate_chunk, tasks), start=1):
+                    for table, model in TABLE_MODELS:
+                        columns = synthetic.TABLE_COLUMNS[table]
+                        if use_copy:
+                            bulkload.copy_text(model, columns, result[table])
+                            totals[table] += result[table].count('\n')
+                        else:
+                            bulkload.insert_rows(model, columns, result[table])
+                            totals[table] += len(result[table])
+                    self.stdout.write(f"chunk {index}/{len(tasks)} loaded", ending='\r')
+
+                if use_copy:
+                    bulkload.reset_sequences(User, Activity)
+                # COPY / bulk_create не викликають сигнали: скидаємо ETag'и вручну
+                bump_version(*(model for _, model in TABLE_MODELS))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write("")
+        self._rebuild_derived(user_start, user_start + user_count)
+        for table, count in totals.items():
+            self.stdout.write(f"{table:10} {count:>12,} rows")
+        total_rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {total_rows:,} rows in {elapsed:.1f}s ({total_rows / elapsed:,.0f} rows/s, "
+            f"{'COPY' if use_copy else 'bulk_create'})"
+        ))
+
+    def _rebuild_derived(self, user_start, user_end):
+        """Похідні дані, які при звичайних записах оновлюють сигнали."""
+        # Нові рядки належать лише новим користувачам, тож перераховуємо їхні діапазони
+        for task in recompute.TASKS:
+            pending = [
+                (start, end) for start, end in recompute.shards(recompute.SHARD_SIZE)
+                if start < user_end and end > user_start
+            ]
+            for _ in recompute.run(task, pending):
+                pass
+        call_command('fingerprint_activities', stdout=self.stdout)
+        sketches.rebuild_all()
+        if materialized.is_supported():
+            list(materialized.refresh_due(force=True))
+        # Кеші в пам'яті цього процесу; інші воркери перебудують свої за таймером
+        search.invalidate()
+        leaderboards.invalidate()
+        follow_graph.invalidate()
+        self.stdout.write("Derived data rebuilt: summaries, monthly stats, fingerprints, sketches, search.")
@@ -0,0 +1,102 @@
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from .benchmark_api import git_commit
+
+# import time: self [us] | cumulative | imported package
+_LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def parse_importtime(output):
+    """[(module, self_us, cumulative_us, depth), ...] з виводу python -X importtime."""
+    rows = []
+    for line in output.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Час старту воркера: у свіжому процесі (python -X importtime) виконує django.setup() "
+        "та імпорт ROOT_URLCONF; показує найдовші імпорти і дописує результат в історію."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Кількість запусків (береться медіана).")
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--module', default=None,
+                            help="Що імпортувати після django.setup() (за замовчуванням ROOT_URLCONF).")
+        parser.add_argument('--history', default='benchmarks/import-times.jsonl',
+                            help="JSONL-файл історії; порожній рядок — не зберігати.")
+
+    def _run_once(self, module):
+        code = f"import django; django.setup(); import {module}"
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+        wall_ms = (time.perf_counter() - start) * 1000
+        return wall_ms, parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        module = options['module'] or settings.ROOT_URLCONF
+        runs = [self._run_once(module) for _ in range(max(options['runs'], 1))]
+
+        wall_ms = statistics.median(wall for wall, _ in runs)
+        import_ms = statistics.median(
+            sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000 for _, rows in runs
+        )
+        # Медіана cumulative по кожному модулю верхнього рівня
+        per_module = {}
+        for _, rows in runs:
+            for name, _, cumulative, depth in rows:
+                if depth == 0:
+                    per_module.setdefault(name, []).append(cumulative / 1000)
+        slowest = sorted(
+            ((name, statistics.median(values)) for name, values in per_module.items()),
+            key=lambda item: item[1], reverse=True,
+        )[:options['top']]
+        heavy = sorted({name.split('.')[0] for _, rows in runs for name, *_ in rows} & {'numpy', 'pandas'})
+
+        self.stdout.write(f"{module}: imports {import_ms:.1f} ms, process wall {wall_ms:.1f} ms "
+                          f"(median of {len(runs)})")
+        self.stdout.write(f"numpy/pandas loaded at startup: {', '.join(heavy) or 'no'}")
+        for name, ms in slowest:
+            self.stdout.write(f"  {ms:8.1f} ms  {name}")
+
+        record = {
+            'timestamp': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'module': module,
+            'runs': len(runs),
+            'import_ms': round(import_ms, 1),
+            'wall_ms': round(wall_ms, 1),
+            'heavy_modules': heavy,
+            'slowest': [[name, round(ms, 1)] for name, ms in slowest],
+        }
+        if options['history']:
+            path = Path(options['history'])
+            previous = None
+            if path.exists():
+                lines = [line for line in path.read_text().splitlines() if line.strip()]
+                previous = json.loads(lines[-1]) if lines else None
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+            if previous and previous.get('module') == module:
+                delta = import_ms - previous['import_ms']
+                self.stdout.write(f"vs {previous.get('commit') or previous['timestamp']}: {delta:+.1f} ms")
+            self.stdout.write(self.style.SUCCESS(f"Saved to {path}"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from activities import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Готує шарди з SHARD_DATABASES: зсуває лічильники id до діапазону шарду і створює "
+        "заглушки auth_user для всіх користувачів (після migrate --database і масового імпорту)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', nargs='+', default=None, help="Лише ці шарди.")
+
+    def handle(self, *args, **options):
+        if not sharding.is_enabled():
+            raise CommandError("Sharding is disabled (SHARD_DATABASES is empty).")
+        unknown = set(options['database'] or ()) - set(sharding.aliases())
+        if unknown:
+            raise CommandError(f"Not in SHARD_DATABASES: {', '.join(sorted(unknown))}.")
+        for alias in options['database'] or sharding.aliases():
+            sharding.init_shard(alias)
+            self.stdout.write(f"{alias}: ids from {sharding.aliases().index(alias) << sharding.SHARD_ID_BITS}")
+        self.stdout.write(self.style.SUCCESS("Shards initialized."))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from activities import partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Керує помісячними партиціями ActivityPoint (PostgreSQL): "
+        "створює партиції наперед, від'єднує/архівує старі."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3,
+                            help="Скільки місяців наперед мають існувати партиції.")
+        parser.add_argument('--detach-older-than', type=int, default=None, metavar='MONTHS',
+                            help="Від'єднати партиції, старші за MONTHS місяців.")
+        parser.add_argument('--archive-dir', default=None,
+                            help="Зберегти від'єднані партиції у <dir>/<name>.copy.gz і видалити таблиці.")
+        parser.add_argument('--list', action='store_true', help="Показати партиції.")
+
+    def handle(self, *args, **options):
+        if not partitioning.is_partitioned():
+            self.stdout.write(self.style.WARNING(
+                "activities_activitypoint is not partitioned (PostgreSQL only); nothing to do."
+            ))
+            return
+
+        created = partitioning.ensure_partitions(months_ahead=options['ahead'])
+        for name in created:
+            self.stdout.write(f"created {name}")
+
+        if options['detach_older_than'] is not None:
+            for name in partitioning.detach_older_than(options['detach_older_than'], options['archive_dir']):
+                archived = f" -> {options['archive_dir']}" if options['archive_dir'] else ""
+                self.stdout.write(f"detached {name}{archived}")
+
+        if options['list']:
+            for name, bounds in partitioning.list_partitions():
+                self.stdout.write(f"{name:45} {bounds}")
+
+        self.stdout.write(self.style.SUCCESS("Done."))
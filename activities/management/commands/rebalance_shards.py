@@ -0,0 +1,48 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from activities import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Вирівнює шарди за кількістю активностей: переносить користувачів з найзавантаженішого "
+        "шарду на найменш завантажений (або одного користувача: --user ID --to ALIAS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, default=None, help="Перенести лише цього користувача.")
+        parser.add_argument('--to', default=None, help="Цільовий шард для --user.")
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help="Допустима різниця між шардами (частка від середнього навантаження).")
+        parser.add_argument('--dry-run', action='store_true', help="Лише показати план.")
+
+    def handle(self, *args, **options):
+        if not sharding.is_enabled():
+            raise CommandError("Sharding is disabled (SHARD_DATABASES is empty).")
+        if (options['user'] is None) != (options['to'] is None):
+            raise CommandError("--user and --to must be given together.")
+
+        if options['user'] is not None:
+            if options['to'] not in sharding.aliases():
+                raise CommandError(f"{options['to']} is not in SHARD_DATABASES.")
+            if not User.objects.filter(id=options['user']).exists():
+                raise CommandError(f"User {options['user']} does not exist.")
+            moves = [(options['user'], sharding.shard_for(options['user']), options['to'], None)]
+        else:
+            loads = sharding.shard_loads()
+            for alias, users in loads.items():
+                self.stdout.write(f"{alias}: {len(users):,} users, {sum(users.values()):,} activities")
+            moves = sharding.rebalance_plan(options['tolerance'], loads)
+
+        for user_id, source, target, activities in moves:
+            planned = f"user {user_id}: {source} -> {target}" + (f" ({activities:,} activities)" if activities else "")
+            if options['dry_run']:
+                self.stdout.write(planned)
+                continue
+            started = time.perf_counter()
+            rows = sharding.move_user(user_id, target)
+            self.stdout.write(f"{planned}: {rows:,} rows in {time.perf_counter() - started:.2f}s")
+        self.stdout.write(self.style.SUCCESS(f"{len(moves)} users {'to move' if options['dry_run'] else 'moved'}."))
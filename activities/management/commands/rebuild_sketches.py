@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from activities import sketches
+
+
+class Command(BaseCommand):
+    help = (
+        "Перебудовує скетчі наближеної аналітики (HyperLogLog / KLL) з таблиці Activity. "
+        "Потрібно після масового завантаження, змін і видалень активностей."
+    )
+
+    def handle(self, *args, **options):
+        count = sketches.rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} sketches."))
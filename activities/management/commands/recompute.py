@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from activities import recompute
+
+
+class Command(BaseCommand):
+    help = (
+        "Пакетний перерахунок похідних даних (UserMonthlyStats, UserSummary) по всіх користувачах: "
+        "шарди за user_id у пулі процесів, upsert'и, чекпойнти для продовження (--resume)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task', nargs='+', default=list(recompute.TASKS), choices=list(recompute.TASKS))
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Кількість процесів (за замовчуванням — ядра CPU; у SQLite — 1).")
+        parser.add_argument('--shard-size', type=int, default=recompute.SHARD_SIZE,
+                            help="Ширина шарда в діапазоні user_id.")
+        parser.add_argument('--resume', action='store_true',
+                            help="Пропустити шарди, готові в попередньому (перерваному) запуску.")
+
+    def handle(self, *args, **options):
+        if options['shard_size'] < 1:
+            raise CommandError("--shard-size must be positive.")
+        for task in options['task']:
+            self._run_task(task, options)
+
+    def _run_task(self, task, options):
+        pending = recompute.plan(task, options['shard_size'], options['resume'])
+        self.stdout.write(f"{task}: {len(pending)} shards to process")
+        start = time.perf_counter()
+        users = rows = 0
+        for done, result in enumerate(recompute.run(task, pending, options['workers']), 1):
+            users += result.users
+            rows += result.rows
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{task} [{done}/{len(pending)}] users {result.start}-{result.end - 1}: "
+                f"{result.users} users, {result.rows} rows in {result.seconds:.2f}s | "
+                f"{users / elapsed:,.0f} users/s, {rows / elapsed:,.0f} rows/s"
+            )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"{task}: {len(pending)} shards, {users:,} users, {rows:,} rows in {elapsed:.1f}s "
+            f"({users / elapsed if elapsed else 0:,.0f} users/s)"
+        ))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from activities import materialized
+
+
+class Command(BaseCommand):
+    help = (
+        "Оновлює матеріалізовані представлення аналітики (PostgreSQL), коли в таблицях-джерелах "
+        "набралося ANALYTICS_VIEW_REFRESH_WRITES записів або дані старші за ANALYTICS_VIEW_MAX_STALENESS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', nargs='+', default=None, choices=list(materialized.VIEWS))
+        parser.add_argument('--force', action='store_true', help="Оновити незалежно від кількості записів.")
+        parser.add_argument('--once', action='store_true', help="Одна перевірка й завершення.")
+        parser.add_argument('--interval', type=float, default=30.0,
+                            help="Пауза між перевірками (секунди).")
+
+    def handle(self, *args, **options):
+        if not materialized.is_supported():
+            raise CommandError("Materialized views require PostgreSQL.")
+
+        while True:
+            for name, pending, refresh in materialized.refresh_due(options['view'], options['force']):
+                self.stdout.write(f"{name}: refreshed after {pending:,} writes in {refresh.duration_ms} ms")
+            if options['once'] or options['force']:
+                break
+            time.sleep(options['interval'])
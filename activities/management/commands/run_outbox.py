@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from activities import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Диспетчер transactional outbox: передає нові події OutboxEvent споживачам "
+        "з settings.OUTBOX_CONSUMERS пачками, зсуваючи checkpoint після кожної пачки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Обробити чергу й завершитися.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Пауза між опитуваннями, коли нових подій немає (секунди).")
+        parser.add_argument('--prune', action='store_true',
+                            help="Після обробки видалити події, які обробили всі споживачі.")
+
+    def handle(self, *args, **options):
+        if not outbox.consumers():
+            self.stdout.write(self.style.WARNING("OUTBOX_CONSUMERS is empty; nothing to dispatch."))
+            return
+
+        while True:
+            processed = outbox.dispatch_all(options['batch_size'])
+            for name, count in processed.items():
+                if count:
+                    self.stdout.write(f"{name}: {count} events")
+            if any(processed.values()):
+                continue
+            if options['prune']:
+                pruned = outbox.prune()
+                if pruned:
+                    self.stdout.write(f"pruned {pruned} events")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
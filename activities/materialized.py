@@ -0,0 +1,159 @@
+"""
+Матеріалізовані представлення для аналітики (PostgreSQL, міграція 0012).
+
+Звіти monthly_trends, activity_performance і user_levels агрегують усю
+таблицю Activity. Представлення зберігають готові агрегати з унікальними
+індексами, тож оновлюються REFRESH MATERIALIZED VIEW CONCURRENTLY без
+блокування читачів. AnalyticsRepository читає представлення, лише коли
+воно вже наповнене (є запис MaterializedViewRefresh); інакше, а також на
+SQLite і з шардуванням (представлення бачать лише основну БД) — живі таблиці.
+
+Оновлення керується обсягом записів: лічильники вставок / оновлень /
+видалень таблиць-джерел з pg_stat_user_tables порівнюються зі знімком на
+момент останнього оновлення. Представлення оновлюється, коли записів
+набралося ANALYTICS_VIEW_REFRESH_WRITES або минуло
+ANALYTICS_VIEW_MAX_STALENESS секунд і хоч один запис був, але не частіше
+ніж раз на ANALYTICS_VIEW_MIN_INTERVAL секунд (manage.py refresh_analytics_views).
+"""
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+
+from . import sharding
+from .conditional import bump_version
+from .models import (
+    Activity, ActivityTypePerformanceView, MaterializedViewRefresh, MonthlyActivityStatsView,
+    UserActivityLevelView,
+)
+
+
+@dataclass(frozen=True)
+class View:
+    model: type
+    sources: tuple  # моделі, записи в які застарюють представлення
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+
+VIEWS = {
+    'monthly_activity_stats': View(MonthlyActivityStatsView, (Activity,)),
+    'activity_type_performance': View(ActivityTypePerformanceView, (Activity,)),
+    'user_activity_levels': View(UserActivityLevelView, (User, Activity)),
+}
+_BY_MODEL = {view.model: name for name, view in VIEWS.items()}
+
+
+def refresh_writes():
+    return getattr(settings, 'ANALYTICS_VIEW_REFRESH_WRITES', 1000)
+
+
+def max_staleness():
+    return getattr(settings, 'ANALYTICS_VIEW_MAX_STALENESS', 3600)
+
+
+def min_interval():
+    return getattr(settings, 'ANALYTICS_VIEW_MIN_INTERVAL', 60)
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def last_refresh(name):
+    if not is_supported():
+        return None
+    return MaterializedViewRefresh.objects.filter(name=name).first()
+
+
+def is_ready(model):
+    """Чи можна читати представлення моделі (PostgreSQL без шардування і воно вже наповнене)."""
+    return not sharding.is_enabled() and last_refresh(_BY_MODEL[model]) is not None
+
+
+def freshness(queryset):
+    """
+    {"source", "as_of"} для відповіді: час останнього оновлення представлення або
+    поточний для живих таблиць (і для списків, злитих з шардів).
+    """
+    name = _BY_MODEL.get(getattr(queryset, 'model', None))
+    refresh = last_refresh(name) if name else None
+    if refresh is None:
+        return {"source": "live", "as_of": timezone.now()}
+    return {"source": "materialized_view", "as_of": refresh.refreshed_at}
+
+
+def write_counter(models):
+    """Сумарна кількість вставок, оновлень і видалень у таблицях моделей від скидання статистики."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0) FROM pg_stat_user_tables "
+            "WHERE relname = ANY(%s)",
+            [[model._meta.db_table for model in models]],
+        )
+        return int(cursor.fetchone()[0])
+
+
+def pending_writes(name, refresh=None, counter=None):
+    refresh = refresh if refresh is not None else last_refresh(name)
+    counter = counter if counter is not None else write_counter(VIEWS[name].sources)
+    if refresh is None:
+        return counter
+    # Лічильник менший за знімок — статистику скинуто (pg_stat_reset, аварійний рестарт)
+    return counter - refresh.write_counter if counter >= refresh.write_counter else counter
+
+
+def _is_populated(table):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT ispopulated FROM pg_matviews WHERE matviewname = %s", [table])
+        row = cursor.fetchone()
+        return bool(row and row[0])
+
+
+def refresh(name):
+    """Оновлює представлення і записує знімок лічильника записів. Повертає MaterializedViewRefresh."""
+    view = VIEWS[name]
+    # Знімок до оновлення: записи, що прийдуть під час REFRESH, зарахуються наступному
+    counter = write_counter(view.sources)
+    refreshed_at = timezone.now()
+    started = time.perf_counter()
+    # CONCURRENTLY неможливе для ще не наповненого представлення
+    concurrently = 'CONCURRENTLY ' if _is_populated(view.table) else ''
+    with connection.cursor() as cursor:
+        cursor.execute(f"REFRESH MATERIALIZED VIEW {concurrently}{connection.ops.quote_name(view.table)}")
+    row, _ = MaterializedViewRefresh.objects.update_or_create(name=name, defaults={
+        'refreshed_at': refreshed_at,
+        'write_counter': counter,
+        'duration_ms': round((time.perf_counter() - started) * 1000),
+    })
+    bump_version(MaterializedViewRefresh)
+    return row
+
+
+def is_due(name, now=None):
+    """(чи треба оновлювати, кількість записів з останнього оновлення)."""
+    refresh_row = last_refresh(name)
+    pending = pending_writes(name, refresh_row)
+    if refresh_row is None:
+        return True, pending
+    age = ((now or timezone.now()) - refresh_row.refreshed_at).total_seconds()
+    if age < min_interval() or not pending:
+        return False, pending
+    return pending >= refresh_writes() or age >= max_staleness(), pending
+
+
+def refresh_due(names=None, force=False):
+    """Оновлює представлення, яким час; [(назва, записів з попереднього оновлення, MaterializedViewRefresh)]."""
+    if not is_supported():
+        return []
+    refreshed = []
+    for name in names or VIEWS:
+        due, pending = is_due(name)
+        if due or force:
+            refreshed.append((name, pending, refresh(name)))
+    return refreshed
@@ -0,0 +1,298 @@
+"""
+Метрики у форматі Prometheus (GET /api/metrics/prometheus/).
+
+Значення накопичуються в словнику поточного потоку (threading.local), тож
+запис метрики — це оновлення власного dict без блокувань. Під час
+експорту словники всіх потоків процесу сумуються; словники завершених
+потоків зливаються в один, щоб не накопичуватися і не губити значення.
+
+Між процесами (воркери gunicorn) агрегація йде через файли: якщо задано
+METRICS_DIR, кожен процес не частіше ніж раз на METRICS_FLUSH_SECONDS
+записує свій знімок у <METRICS_DIR>/<pid>-<token>.json (token випадковий
+на процес, тож повторно виданий pid не перезапише файл попередника), а
+експорт сумує всі файли. Файли завершених процесів лишаються, щоб
+лічильники не спадали; каталог варто очищати при деплої.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections
+
+from .models import Activity, ActivityPoint, Comment, Follower, Kudos, OutboxEvent
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (тип, опис)
+METRICS = {
+    'api_request_duration_seconds': ('histogram', 'API request latency by view and action.'),
+    'api_db_queries_total': ('counter', 'SQL queries executed while handling API requests.'),
+    'api_db_query_seconds_total': ('counter', 'Time spent in SQL queries while handling API requests.'),
+    'api_serializer_duration_seconds': ('histogram', 'Time spent building serializer output.'),
+    'repository_call_duration_seconds': ('histogram', 'Repository method call latency.'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result (hit/miss).'),
+    'heatmap_updates_total': ('counter', 'Heatmap refreshes by kind (incremental/rebuild).'),
+    'live_points_total': ('counter', 'Live tracking points by result (received/rejected/flushed/dropped).'),
+    'live_flush_duration_seconds': ('histogram', 'Time spent writing buffered live tracking points.'),
+}
+TABLE_METRICS = {
+    'table_rows': ('gauge', 'Estimated number of rows in key tables.'),
+    'table_size_bytes': ('gauge', 'Total size of key tables including indexes (PostgreSQL only).'),
+}
+
+_local = threading.local()
+_stores = []  # [(потік, його dict)]
+_retired = {}  # сума значень завершених потоків
+_stores_lock = threading.Lock()
+_last_flush = 0.0
+_token = uuid.uuid4().hex
+
+
+def _after_fork():
+    # Дочірній процес (воркер після preload) починає з нуля і зі своїм файлом
+    global _local, _stores, _retired, _stores_lock, _last_flush, _token
+    _local = threading.local()
+    _stores, _retired, _stores_lock = [], {}, threading.Lock()
+    _last_flush = 0.0
+    _token = uuid.uuid4().hex
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _store():
+    store = getattr(_local, 'store', None)
+    if store is None:
+        store = _local.store = {}
+        with _stores_lock:
+            _stores.append((threading.current_thread(), store))
+    return store
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    store = _store()
+    key = _key(name, labels)
+    store[key] = store.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Гістограма: лічильники по бакетах (останній — +Inf) і сума значень."""
+    store = _store()
+    key = _key(name, labels)
+    histogram = store.get(key)
+    if histogram is None:
+        histogram = store[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+    histogram[bisect_left(DEFAULT_BUCKETS, value)] += 1
+    histogram[-1] += value
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def instrument(repository):
+    """Декоратор класу: гістограма часу для кожного публічного методу репозиторію."""
+    def decorate(cls):
+        for attr, method in list(vars(cls).items()):
+            if attr.startswith('_') or not callable(method):
+                continue
+            setattr(cls, attr, _timed_method(method, repository, attr))
+        return cls
+    return decorate
+
+
+def _timed_method(method, repository, name):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with timer('repository_call_duration_seconds', repository=repository, method=name):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def _merge(target, values):
+    for key, value in values:
+        current = target.get(key)
+        if current is None:
+            target[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(current, list):
+            for i, item in enumerate(value):
+                current[i] += item
+        else:
+            target[key] = current + value
+
+
+def snapshot():
+    """Сума значень усіх потоків поточного процесу."""
+    with _stores_lock:
+        alive = []
+        for thread, store in _stores:
+            if thread.is_alive():
+                alive.append((thread, store))
+            else:
+                # Потік більше не пише: його значення переходять у _retired
+                _merge(_retired, store.items())
+        _stores[:] = alive
+        merged = {}
+        _merge(merged, _retired.items())
+    for _, store in alive:
+        # dict.copy() атомарний під GIL: потік-власник може писати паралельно
+        _merge(merged, store.copy().items())
+    return merged
+
+
+def metrics_dir():
+    path = getattr(settings, 'METRICS_DIR', None)
+    return Path(path) if path else None
+
+
+def flush():
+    """Записує знімок процесу у METRICS_DIR (атомарно)."""
+    global _last_flush
+    directory = metrics_dir()
+    if directory is None:
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{os.getpid()}-{_token}.json"
+    tmp = path.with_suffix('.tmp')
+    data = [[name, labels, value] for (name, labels), value in snapshot().items()]
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+    _last_flush = time.monotonic()
+
+
+def maybe_flush():
+    if time.monotonic() - _last_flush >= getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+        flush()
+
+
+def collect():
+    """Значення всіх процесів (або лише поточного, якщо METRICS_DIR не задано)."""
+    directory = metrics_dir()
+    if directory is None:
+        return snapshot()
+    flush()
+    merged = {}
+    for path in directory.glob('*.json'):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # файл інший процес саме замінює
+        _merge(merged, (((name, tuple(map(tuple, labels))), value) for name, labels, value in data))
+    return merged
+
+
+class MetricsMixin:
+    """
+    Домішка для ViewSet'ів: латентність запиту, кількість і час SQL-запитів
+    з мітками view / action / method / status.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        db = {'count': 0, 'time': 0.0}
+
+        def count_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db['count'] += 1
+                db['time'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            # Усі БД, не лише default: з шардуванням запити йдуть на шарди
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(count_query))
+            response = super().dispatch(request, *args, **kwargs)
+        duration = time.perf_counter() - start
+
+        labels = {'view': type(self).__name__, 'action': getattr(self, 'action', None) or 'unknown'}
+        observe('api_request_duration_seconds', duration,
+                method=request.method, status=str(response.status_code), **labels)
+        inc('api_db_queries_total', db['count'], **labels)
+        inc('api_db_query_seconds_total', db['time'], **labels)
+        maybe_flush()
+        return response
+
+
+def table_stats():
+    """{table: (rows, size_bytes або None)} для ключових таблиць; оцінка з pg_class у PostgreSQL."""
+    models = (User, Activity, ActivityPoint, Comment, Kudos, Follower, OutboxEvent)
+    tables = [model._meta.db_table for model in models]
+    if connection.vendor != 'postgresql':
+        return {model._meta.db_table: (model.objects.count(), None) for model in models}
+    with connection.cursor() as cursor:
+        # Для секціонованих таблиць сумуються секції (pg_inherits)
+        cursor.execute(
+            """
+            SELECT parent.relname, SUM(GREATEST(c.reltuples, 0)), SUM(pg_total_relation_size(c.oid))
+            FROM pg_class parent
+            LEFT JOIN pg_inherits i ON i.inhparent = parent.oid
+            JOIN pg_class c ON c.oid = COALESCE(i.inhrelid, parent.oid)
+            WHERE parent.relname = ANY(%s) AND pg_table_is_visible(parent.oid)
+            GROUP BY parent.relname
+            """,
+            [tables],
+        )
+        return {name: (int(rows), int(size)) for name, rows, size in cursor.fetchall()}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Текстовий формат Prometheus 0.0.4."""
+    values = collect()
+    by_name = {}
+    for (name, labels), value in values.items():
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        for labels, value in sorted(by_name.get(name, [])):
+            if kind != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*DEFAULT_BUCKETS, '+Inf'), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    tables = table_stats()
+    for index, (name, (kind, description)) in enumerate(TABLE_METRICS.items()):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        for table, stats in sorted(tables.items()):
+            if stats[index] is not None:
+                lines.append(f"{name}{_format_labels((('table', table),))} {stats[index]}")
+    return '\n'.join(lines) + '\n'
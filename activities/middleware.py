@@ -0,0 +1,99 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from . import identity_map, profiling
+
+
+class QueryCountMiddleware:
+    """
+    Додає до відповіді заголовки X-DB-Query-Count і X-DB-Query-Time-Ms
+    (кількість і сумарний час SQL-запитів). Використовується бенчмарком.
+    Вмикається settings.QUERY_COUNT_HEADERS (за замовчуванням = DEBUG).
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_COUNT_HEADERS', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = {'count': 0, 'time': 0.0}
+
+        def count_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['count'] += 1
+                stats['time'] += time.perf_counter() - start
+
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+
+        response['X-DB-Query-Count'] = str(stats['count'])
+        response['X-DB-Query-Time-Ms'] = f"{stats['time'] * 1000:.2f}"
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Вибіркове профілювання (activities/profiling.py): частка запитів
+    PROFILING_SAMPLE_RATE і всі запити, довші за PROFILING_SLOW_MS.
+    Профіль позначається в'юхою і дією DRF. Якщо обидва параметри вимкнені,
+    middleware не підключається.
+    """
+
+    def __init__(self, get_response):
+        if not profiling.is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = profiling.sample_rate()
+        self.slow_ms = profiling.slow_ms()
+
+    def __call__(self, request):
+        start = time.monotonic()
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_ms is None:
+            return self.get_response(request)
+
+        # Повільні запити озброюються на половині порогу, щоб профіль покрив і їхній початок
+        armed_at = start if sampled else start + self.slow_ms / 2000
+        sampler = profiling.get_sampler()
+        request._profile = sampler.start(armed_at)
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop(request._profile)
+
+        duration_ms = (time.monotonic() - start) * 1000
+        if sampled or duration_ms >= self.slow_ms:
+            profiling.save(request._profile, 'sampled' if sampled else 'slow', duration_ms)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, '_profile', None)
+        if profile is None:
+            return None
+        view_class = getattr(view_func, 'cls', None)
+        profile.view = view_class.__name__ if view_class else view_func.__name__
+        actions = getattr(view_func, 'actions', None) or {}
+        profile.action = actions.get(request.method.lower(), request.method.lower())
+        return None
+
+
+class IdentityMapMiddleware:
+    """Карта User / Profile на час запиту (activities/identity_map.py)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = identity_map.activate()
+        try:
+            return self.get_response(request)
+        finally:
+            identity_map.deactivate(token)
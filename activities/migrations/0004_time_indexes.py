@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-19 18:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0003_usersummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['start_time'], name='activity_start_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'start_time'], name='activity_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitypoint',
+            index=models.Index(fields=['activity', 'recorded_at'], name='point_activity_recorded_idx'),
+        ),
+    ]
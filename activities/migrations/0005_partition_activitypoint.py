@@ -0,0 +1,126 @@
+"""
+Перетворює activities_activitypoint на таблицю, партиціоновану помісячно
+за recorded_at (тільки PostgreSQL; на інших БД нічого не робить).
+
+PostgreSQL вимагає, щоб ключ партиціонування входив у PRIMARY KEY, тому
+на батьківській таблиці замість PK — звичайний індекс по id (id і далі
+генерується послідовністю). Інші індекси, CHECK- і FK-обмеження переносяться
+з тими самими іменами.
+"""
+from datetime import date
+
+from django.db import migrations
+
+TABLE = 'activities_activitypoint'
+OLD = TABLE + '_old'
+SEQUENCE = TABLE + '_id_seq'
+
+
+def _month(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _index_and_fk_definitions(cursor, table):
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s "
+        "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE contype IN ('p', 'u'))",
+        [table],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _recreate(cursor, source, target, indexes, foreign_keys):
+    for name, definition in indexes:
+        cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+        cursor.execute(definition.replace(f' ON public.{source} ', f' ON public.{target} ')
+                       .replace(f' ON {source} ', f' ON {target} '))
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE "{source}" DROP CONSTRAINT IF EXISTS "{name}"')
+        cursor.execute(f'ALTER TABLE "{target}" ADD CONSTRAINT "{name}" {definition}')
+
+
+def partition_points(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{OLD}"')
+        indexes, foreign_keys = _index_and_fk_definitions(cursor, OLD)
+
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{OLD}"')
+        max_id = cursor.fetchone()[0]
+        cursor.execute(f'ALTER TABLE "{OLD}" ALTER COLUMN id DROP IDENTITY IF EXISTS')
+        cursor.execute(f'ALTER TABLE "{OLD}" ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'DROP SEQUENCE IF EXISTS "{SEQUENCE}"')
+
+        cursor.execute(
+            f'CREATE TABLE "{TABLE}" (LIKE "{OLD}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE (recorded_at)'
+        )
+        cursor.execute(f'CREATE SEQUENCE "{SEQUENCE}" OWNED BY "{TABLE}".id')
+        cursor.execute("SELECT setval(%s, %s, %s)", [SEQUENCE, max(max_id, 1), max_id > 0])
+        cursor.execute(f"""ALTER TABLE "{TABLE}" ALTER COLUMN id SET DEFAULT nextval('"{SEQUENCE}"')""")
+        cursor.execute(f'CREATE INDEX "{TABLE}_id_idx" ON "{TABLE}" (id)')
+        _recreate(cursor, OLD, TABLE, indexes, foreign_keys)
+
+        cursor.execute(f'CREATE TABLE "{TABLE}_default" PARTITION OF "{TABLE}" DEFAULT')
+        cursor.execute(f'SELECT MIN(recorded_at), MAX(recorded_at) FROM "{OLD}"')
+        first, last = cursor.fetchone()
+        today = date.today()
+        month = _month(first) if first else _month(today)
+        last_month = max(_month(last) if last else month, _month(today))
+        while month <= last_month:
+            end = _next_month(month)
+            cursor.execute(
+                f'CREATE TABLE "{TABLE}_p{month:%Y_%m}" PARTITION OF "{TABLE}" '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [month.isoformat(), end.isoformat()],
+            )
+            month = end
+
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{OLD}"')
+        cursor.execute(f'DROP TABLE "{OLD}"')
+
+
+def unpartition_points(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _index_and_fk_definitions(cursor, TABLE)
+        indexes = [(name, definition) for name, definition in indexes if name != f'{TABLE}_id_idx']
+
+        cursor.execute(f'CREATE TABLE "{OLD}" (LIKE "{TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(f'INSERT INTO "{OLD}" SELECT * FROM "{TABLE}"')
+        cursor.execute(f'ALTER SEQUENCE "{SEQUENCE}" OWNED BY "{OLD}".id')
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+        for name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{TABLE}" DROP CONSTRAINT IF EXISTS "{name}"')
+        cursor.execute(f'DROP TABLE "{TABLE}" CASCADE')
+
+        cursor.execute(f'ALTER TABLE "{OLD}" RENAME TO "{TABLE}"')
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY (id)')
+        for name, definition in indexes:
+            cursor.execute(definition.replace(f' ON ONLY ', ' ON '))
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{name}" {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0004_time_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_points, unpartition_points),
+    ]
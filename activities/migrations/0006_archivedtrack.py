@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-19 18:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0005_partition_activitypoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTrack',
+            fields=[
+                ('activity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archived_track', serialize=False, to='activities.activity')),
+                ('path', models.CharField(max_length=255)),
+                ('point_count', models.IntegerField(default=0)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
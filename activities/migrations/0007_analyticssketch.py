@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-19 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0006_archivedtrack'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('active_users', 'Distinct active users (HyperLogLog)'), ('distance', 'Distance quantiles (KLL)'), ('duration', 'Duration quantiles (KLL)')], max_length=20)),
+                ('bucket', models.DateField()),
+                ('dimension', models.CharField(max_length=50)),
+                ('data', models.BinaryField()),
+                ('item_count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('kind', 'bucket', 'dimension')},
+            },
+        ),
+    ]
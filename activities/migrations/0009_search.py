@@ -0,0 +1,51 @@
+"""
+Повнотекстовий пошук (тільки PostgreSQL; на інших БД нічого не робить):
+згенеровані tsvector-колонки search_vector з GIN-індексами для коментарів
+і профілів та індекси для префіксного пошуку за username / display_name.
+Колонки не оголошені в моделях — їх читає лише activities/search.py.
+"""
+from django.db import migrations
+
+FORWARD = [
+    """ALTER TABLE activities_comment ADD COLUMN search_vector tsvector
+       GENERATED ALWAYS AS (to_tsvector('simple', coalesce(body, ''))) STORED""",
+    "CREATE INDEX comment_search_vector_idx ON activities_comment USING GIN (search_vector)",
+    """ALTER TABLE activities_profile ADD COLUMN search_vector tsvector
+       GENERATED ALWAYS AS (
+           setweight(to_tsvector('simple', coalesce(display_name, '')), 'A') ||
+           setweight(to_tsvector('simple', coalesce(city, '')), 'B') ||
+           setweight(to_tsvector('simple', coalesce(bio, '')), 'C')
+       ) STORED""",
+    "CREATE INDEX profile_search_vector_idx ON activities_profile USING GIN (search_vector)",
+    # istartswith -> UPPER(col) LIKE 'X%'
+    "CREATE INDEX auth_user_username_upper_idx ON auth_user (UPPER(username) varchar_pattern_ops)",
+    "CREATE INDEX profile_display_name_upper_idx ON activities_profile (UPPER(display_name) varchar_pattern_ops)",
+]
+
+BACKWARD = [
+    "DROP INDEX IF EXISTS profile_display_name_upper_idx",
+    "DROP INDEX IF EXISTS auth_user_username_upper_idx",
+    "ALTER TABLE activities_profile DROP COLUMN IF EXISTS search_vector",
+    "ALTER TABLE activities_comment DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0008_outbox'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(FORWARD), _run(BACKWARD)),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-19 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0009_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecomputeCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=50)),
+                ('shard_start', models.BigIntegerField()),
+                ('shard_end', models.BigIntegerField()),
+                ('users', models.IntegerField(default=0)),
+                ('rows_written', models.IntegerField(default=0)),
+                ('duration_ms', models.IntegerField(default=0)),
+                ('completed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('task', 'shard_start', 'shard_end')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-19 19:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0010_recomputecheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityFingerprint',
+            fields=[
+                ('activity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='activities.activity')),
+                ('start_bucket', models.BigIntegerField()),
+                ('start_ts', models.BigIntegerField()),
+                ('duration_sec', models.FloatField()),
+                ('distance_m', models.FloatField()),
+                ('track_minhash', models.BinaryField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'start_bucket'], name='fingerprint_user_bucket_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,114 @@
+"""
+Матеріалізовані представлення для аналітики (тільки PostgreSQL; на інших БД
+створюється лише таблиця MaterializedViewRefresh). Представлення створюються
+порожніми (WITH NO DATA) — перше наповнення робить manage.py
+refresh_analytics_views, до того AnalyticsRepository читає живі таблиці.
+Унікальні індекси потрібні для REFRESH MATERIALIZED VIEW CONCURRENTLY.
+Місяць рахується в UTC (settings.TIME_ZONE), як TruncMonth у живому запиті.
+"""
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+FORWARD = [
+    """CREATE MATERIALIZED VIEW analytics_monthly_activity_stats AS
+       SELECT date_trunc('month', start_time AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS month,
+              COUNT(*)::integer AS total_activities,
+              SUM(distance_m) AS total_distance,
+              AVG(duration_sec) AS avg_duration
+       FROM activities_activity
+       GROUP BY 1
+       WITH NO DATA""",
+    "CREATE UNIQUE INDEX analytics_monthly_activity_stats_month_idx ON analytics_monthly_activity_stats (month)",
+    """CREATE MATERIALIZED VIEW analytics_activity_type_performance AS
+       SELECT activity_type,
+              AVG(distance_m) AS avg_distance,
+              MAX(elevation_gain_m) AS max_elevation,
+              COUNT(*)::integer AS record_count
+       FROM activities_activity
+       GROUP BY activity_type
+       WITH NO DATA""",
+    """CREATE UNIQUE INDEX analytics_activity_type_performance_type_idx
+       ON analytics_activity_type_performance (activity_type)""",
+    """CREATE MATERIALIZED VIEW analytics_user_activity_levels AS
+       SELECT u.id AS user_id, u.username, COUNT(a.id)::integer AS activities_count
+       FROM auth_user u
+       LEFT JOIN activities_activity a ON a.user_id = u.id
+       GROUP BY u.id, u.username
+       WITH NO DATA""",
+    "CREATE UNIQUE INDEX analytics_user_activity_levels_user_idx ON analytics_user_activity_levels (user_id)",
+]
+
+BACKWARD = [
+    "DROP MATERIALIZED VIEW IF EXISTS analytics_user_activity_levels",
+    "DROP MATERIALIZED VIEW IF EXISTS analytics_activity_type_performance",
+    "DROP MATERIALIZED VIEW IF EXISTS analytics_monthly_activity_stats",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0011_activityfingerprint'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityTypePerformanceView',
+            fields=[
+                ('activity_type', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('avg_distance', models.FloatField(null=True)),
+                ('max_elevation', models.IntegerField(null=True)),
+                ('record_count', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'analytics_activity_type_performance',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyActivityStatsView',
+            fields=[
+                ('month', models.DateTimeField(primary_key=True, serialize=False)),
+                ('total_activities', models.IntegerField()),
+                ('total_distance', models.FloatField(null=True)),
+                ('avg_duration', models.FloatField(null=True)),
+            ],
+            options={
+                'db_table': 'analytics_monthly_activity_stats',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UserActivityLevelView',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('username', models.CharField(max_length=150)),
+                ('activities_count', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'analytics_user_activity_levels',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MaterializedViewRefresh',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('refreshed_at', models.DateTimeField()),
+                ('write_counter', models.BigIntegerField(default=0)),
+                ('duration_ms', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(_run(FORWARD), _run(BACKWARD)),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-19 19:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0012_analytics_views'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follower',
+            index=models.Index(fields=['followee', 'created_at', 'id', 'follower'], name='follower_followee_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follower',
+            index=models.Index(fields=['follower', 'created_at', 'id', 'followee'], name='follower_follower_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+# Лічильники версій, які збільшує bump_version (activities/conditional.py)
+VERSIONED = (
+    'auth.user', 'activities.profile', 'activities.activity', 'activities.comment', 'activities.kudos',
+    'activities.follower', 'activities.activitypoint', 'activities.usermonthlystats', 'activities.usersummary',
+    'activities.analyticssketch', 'activities.materializedviewrefresh',
+)
+
+
+def create_rows(apps, schema_editor):
+    DataVersion = apps.get_model('activities', 'DataVersion')
+    db_alias = schema_editor.connection.alias
+    for name in VERSIONED:
+        DataVersion.objects.using(db_alias).get_or_create(name=name, defaults={'version': 0})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0014_usershard'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0015_dataversion_rows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxcheckpoint',
+            name='gaps',
+            field=models.JSONField(default=list),
+        ),
+    ]
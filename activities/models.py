@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from django.db.models import F
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class Profile(models.Model):
@@ -113,6 +114,11 @@ class Activity(models.Model):
         super().save(*args, **kwargs)
 
     class Meta:
+        indexes = [
+            # Діапазонні запити по часу (місячна статистика, лідерборди)
+            models.Index(fields=['start_time'], name='activity_start_time_idx'),
+            models.Index(fields=['user', 'start_time'], name='activity_user_start_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=models.Q(duration_sec__gte=0),
@@ -162,6 +168,10 @@ class ActivityPoint(models.Model):
     )
 
     class Meta:
+        # У PostgreSQL таблиця помісячно партиціонована за recorded_at (див. partitioning.py)
+        indexes = [
+            models.Index(fields=['activity', 'recorded_at'], name='point_activity_recorded_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=models.Q(speed__gte=0),
@@ -214,6 +224,11 @@ class Follower(models.Model):
 
     class Meta:
         unique_together = ('follower', 'followee')
+        indexes = [
+            # Сторінки /api/users/<id>/followers/ і /following/ (keyset за (created_at, id)) читаються лише з індексу
+            models.Index(fields=['followee', 'created_at', 'id', 'follower'], name='follower_followee_keyset_idx'),
+            models.Index(fields=['follower', 'created_at', 'id', 'followee'], name='follower_follower_keyset_idx'),
+        ]
 
     def __str__(self):
         return f"{self.follower.username} follows {self.followee.username}"
@@ -247,4 +262,231 @@ class UserMonthlyStats(models.Model):
         ]
 
     def __str__(self):
-        return f"Stats for {self.user.username} - {self.year}/{self.month}"
\ No newline at end of file
+        return f"Stats for {self.user.username} - {self.year}/{self.month}"
+
+class DataVersion(models.Model):
+    """
+    Лічильник версій даних для однієї моделі (наприклад 'activities.activity').
+    Збільшується при кожному записі й використовується для ETag / Last-Modified.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class UserSummary(models.Model):
+    """
+    Денормалізовані підсумки користувача для сторінки профілю.
+    Оновлюються інкрементально з записів Activity / Follower / Kudos
+    (див. activities/summaries.py).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="summary")
+
+    activities_count = models.IntegerField(default=0)
+    total_distance_m = models.FloatField(default=0.0)
+    total_duration_sec = models.FloatField(default=0.0)
+    followers_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+    kudos_received = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Summary for {self.user.username}"
+
+
+class ArchivedTrack(models.Model):
+    """
+    Трек активності, винесений з ActivityPoint у файл холодного архіву
+    (див. activities/track_archive.py). Поки запис існує, точок у БД немає.
+    """
+    activity = models.OneToOneField(Activity, on_delete=models.CASCADE, primary_key=True, related_name="archived_track")
+    path = models.CharField(max_length=255)
+    point_count = models.IntegerField(default=0)
+    size_bytes = models.BigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived track of Activity {self.activity_id}"
+
+
+class AnalyticsSketch(models.Model):
+    """
+    Серіалізований скетч (HyperLogLog / KLL) для пари (місяць, тип активності).
+    Див. activities/sketches.py.
+    """
+    ACTIVE_USERS = 'active_users'
+    DISTANCE = 'distance'
+    DURATION = 'duration'
+    KIND_CHOICES = [
+        (ACTIVE_USERS, 'Distinct active users (HyperLogLog)'),
+        (DISTANCE, 'Distance quantiles (KLL)'),
+        (DURATION, 'Duration quantiles (KLL)'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    bucket = models.DateField()  # перший день місяця
+    dimension = models.CharField(max_length=50)  # activity_type
+    data = models.BinaryField()
+    item_count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'bucket', 'dimension')
+
+    def __str__(self):
+        return f"{self.kind} {self.bucket:%Y-%m} {self.dimension}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Подія про зміну доменних даних (transactional outbox). Записується в тій
+    самій транзакції, що й зміна, і потім доставляється споживачам
+    (див. activities/outbox.py).
+    """
+    id = models.BigAutoField(primary_key=True)
+    topic = models.CharField(max_length=50)  # напр. 'activity.created'
+    aggregate_id = models.BigIntegerField()
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.topic} {self.aggregate_id}"
+
+
+class OutboxCheckpoint(models.Model):
+    """Остання оброблена споживачем подія OutboxEvent."""
+    consumer = models.CharField(max_length=100, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    # [[id, unix-час], ...] — id нижче checkpoint'а, яких ще не було видно (транзакція не закомічена)
+    gaps = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.consumer} @ {self.last_event_id}"
+
+
+class RecomputeCheckpoint(models.Model):
+    """
+    Готовий шард пакетного перерахунку (див. activities/recompute.py).
+    Комітиться разом з результатами шарда (з шардуванням БД — після їхнього коміту),
+    тож --resume пропускає лише повністю записані.
+    """
+    task = models.CharField(max_length=50)
+    shard_start = models.BigIntegerField()  # user_id, включно
+    shard_end = models.BigIntegerField()  # user_id, не включно
+    users = models.IntegerField(default=0)
+    rows_written = models.IntegerField(default=0)
+    duration_ms = models.IntegerField(default=0)
+    completed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('task', 'shard_start', 'shard_end')
+
+    def __str__(self):
+        return f"{self.task} [{self.shard_start}, {self.shard_end})"
+
+
+class ActivityFingerprint(models.Model):
+    """
+    Відбиток активності для пошуку дублікатів при завантаженні
+    (див. activities/dedup.py): час старту, тривалість, дистанція і MinHash
+    по клітинках geohash треку, якщо трек відомий.
+    """
+    activity = models.OneToOneField(Activity, on_delete=models.CASCADE, primary_key=True, related_name="fingerprint")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    start_bucket = models.BigIntegerField()  # start_time (unix-секунди) // DEDUP_START_BUCKET_SEC
+    start_ts = models.BigIntegerField()
+    duration_sec = models.FloatField()
+    distance_m = models.FloatField()
+    track_minhash = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start_bucket'], name='fingerprint_user_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"Fingerprint of Activity {self.activity_id}"
+
+
+class MaterializedViewRefresh(models.Model):
+    """
+    Останнє оновлення матеріалізованого представлення аналітики
+    (див. activities/materialized.py). write_counter — сума вставок, оновлень
+    і видалень у таблицях-джерелах (pg_stat_user_tables) на момент оновлення.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    refreshed_at = models.DateTimeField()
+    write_counter = models.BigIntegerField(default=0)
+    duration_ms = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} @ {self.refreshed_at}"
+
+
+class MonthlyActivityStatsView(models.Model):
+    """Матеріалізоване представлення: активності по місяцях start_time (тільки PostgreSQL, міграція 0012)."""
+    month = models.DateTimeField(primary_key=True)
+    total_activities = models.IntegerField()
+    total_distance = models.FloatField(null=True)
+    avg_duration = models.FloatField(null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'analytics_monthly_activity_stats'
+
+
+class ActivityTypePerformanceView(models.Model):
+    """Матеріалізоване представлення: показники по типах активності."""
+    activity_type = models.CharField(max_length=50, primary_key=True)
+    avg_distance = models.FloatField(null=True)
+    max_elevation = models.IntegerField(null=True)
+    record_count = models.IntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'analytics_activity_type_performance'
+
+
+class UserActivityLevelView(models.Model):
+    """Матеріалізоване представлення: кількість активностей кожного користувача."""
+    user = models.OneToOneField(
+        User, on_delete=models.DO_NOTHING, primary_key=True, db_constraint=False, related_name='+'
+    )
+    username = models.CharField(max_length=150)
+    activities_count = models.IntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'analytics_user_activity_levels'
+
+
+class UserShard(models.Model):
+    """
+    Шард (alias з SHARD_DATABASES), на якому лежать активності, точки,
+    коментарі і статистика користувача (див. activities/sharding.py).
+    Користувачі без запису — на першому шарді. Таблиця живе в основній БД.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="shard")
+    alias = models.CharField(max_length=100, db_index=True)
+    assigned_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"User {self.user_id} -> {self.alias}"
+
+
+class HeatmapGeneration(models.Model):
+    """
+    Покоління теплової карти користувача (див. activities/heatmap.py): збільшується
+    після зміни чи видалення його точок, і всі воркери перебудовують карту з нуля.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="heatmap_generation")
+    generation = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Heatmap of user {self.user_id} gen {self.generation}"
@@ -0,0 +1,164 @@
+"""
+Transactional outbox для змін Activity / Comment / Kudos / Follower.
+
+Кожен запис у ці моделі додає компактну подію OutboxEvent у тій самій
+транзакції (сигнали + атомарні методи репозиторіїв), тож подія
+з'являється тоді й лише тоді, коли зміна закомічена. Диспетчер
+(manage.py run_outbox) читає події пачками по зростанню id і передає їх
+споживачам з settings.OUTBOX_CONSUMERS (кожен може обмежитися своїми
+TOPICS). Для кожного споживача зберігається checkpoint (OutboxCheckpoint).
+Він зсувається лише після успішної обробки пачки, тож доставка
+at-least-once: споживачі мають бути ідемпотентними.
+
+id видаються при INSERT, а не при коміті: подія з меншим id може стати
+видимою вже після того, як checkpoint її перейшов. Тому пропущені id нижче
+checkpoint'а запам'ятовуються (OutboxCheckpoint.gaps) і перечитуються
+на кожному проході; така подія доставляється пізніше за сусідні. Пропуск
+забувається через OUTBOX_GAP_TIMEOUT секунд — це id відкоченої транзакції.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Activity, Comment, Kudos, Follower, OutboxEvent, OutboxCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# Поля, що потрапляють у payload події
+PAYLOAD_FIELDS = {
+    Activity: ('user_id', 'activity_type', 'distance_m', 'duration_sec', 'start_time'),
+    Comment: ('activity_id', 'user_id', 'parent_comment_id'),
+    Kudos: ('activity_id', 'user_id'),
+    Follower: ('follower_id', 'followee_id'),
+}
+
+
+def topic_for(model, action):
+    return f"{model._meta.model_name}.{action}"
+
+
+def payload_for(instance):
+    return {field: getattr(instance, field) for field in PAYLOAD_FIELDS[type(instance)]}
+
+
+def emit(model, action, aggregate_id, payload):
+    """Додає подію; викликати всередині транзакції, що робить зміну."""
+    return OutboxEvent.objects.create(
+        topic=topic_for(model, action), aggregate_id=aggregate_id, payload=payload
+    )
+
+
+def emit_instance(instance, action):
+    return emit(type(instance), action, instance.pk, payload_for(instance))
+
+
+def emit_many(model, action, instances):
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(topic=topic_for(model, action), aggregate_id=instance.pk, payload=payload_for(instance))
+        for instance in instances
+    ])
+
+
+def emit_updated(model, model_id):
+    """Для QuerySet.update(), який не відправляє сигналів: payload — стан після оновлення."""
+    payload = model.objects.filter(pk=model_id).values(*PAYLOAD_FIELDS[model]).first()
+    if payload is not None:
+        emit(model, 'updated', model_id, payload)
+
+
+def consumers():
+    """{name: (handler, topics або None)} з settings.OUTBOX_CONSUMERS."""
+    configured = getattr(settings, 'OUTBOX_CONSUMERS', {})
+    return {
+        name: (import_string(config['HANDLER']), config.get('TOPICS'))
+        for name, config in configured.items()
+    }
+
+
+# Скільки пропущених id пам'ятати на споживача (решта вважається відкоченими)
+MAX_GAPS = 10000
+
+
+def _gap_timeout():
+    return getattr(settings, 'OUTBOX_GAP_TIMEOUT', 600)
+
+
+def _track_gaps(gaps, last_event_id, scanned, now):
+    """Додає в gaps id між last_event_id і подіями scanned, яких немає серед них."""
+    # Новий споживач починає з першої видимої події, а не з id 1
+    expected = last_event_id + 1 if last_event_id else None
+    for event in scanned:
+        # Величезний стрибок послідовності — не транзакції в польоті, а її кеш/відкат
+        if expected is not None:
+            for missing in range(max(expected, event.id - MAX_GAPS), event.id):
+                gaps[missing] = now
+        expected = event.id + 1
+
+
+def dispatch(name, handler, topics=None, batch_size=500):
+    """
+    Передає споживачу одну пачку нових подій разом із подіями, що закомітилися
+    в уже пройдених пропусках. Повертає кількість переглянутих подій
+    (0 — споживач наздогнав чергу або його вже обробляє інший процес).
+    """
+    now = time.time()
+    with transaction.atomic():
+        OutboxCheckpoint.objects.get_or_create(consumer=name)
+        # skip_locked: два диспетчери не оброблятимуть одного споживача одночасно
+        checkpoint = OutboxCheckpoint.objects.select_for_update(skip_locked=True).filter(consumer=name).first()
+        if checkpoint is None:
+            return 0
+        gaps = {event_id: seen for event_id, seen in checkpoint.gaps}
+        late = list(OutboxEvent.objects.filter(id__in=list(gaps)).order_by('id')) if gaps else []
+        for event in late:
+            del gaps[event.id]
+        scanned = list(OutboxEvent.objects.filter(id__gt=checkpoint.last_event_id).order_by('id')[:batch_size])
+        _track_gaps(gaps, checkpoint.last_event_id, scanned, now)
+        horizon = now - _gap_timeout()
+        gaps = sorted((event_id, seen) for event_id, seen in gaps.items() if seen > horizon)[-MAX_GAPS:]
+        batch = late + scanned
+        events = [event for event in batch if not topics or event.topic in topics]
+        if events:
+            # Виняток у handler відкочує транзакцію: checkpoint не зсувається, пачка прийде знову
+            handler(events)
+        gaps = [list(gap) for gap in gaps]
+        if not batch and gaps == checkpoint.gaps:
+            return 0
+        if scanned:
+            # Checkpoint зсувається і через чужі топіки, інакше prune() не зможе чистити таблицю
+            checkpoint.last_event_id = scanned[-1].id
+        checkpoint.gaps = gaps
+        checkpoint.save(update_fields=['last_event_id', 'gaps', 'updated_at'])
+    return len(batch)
+
+
+def dispatch_all(batch_size=500):
+    """Один прохід по всіх споживачах; повертає {name: кількість оброблених подій}."""
+    processed = {}
+    for name, (handler, topics) in consumers().items():
+        try:
+            processed[name] = dispatch(name, handler, topics, batch_size)
+        except Exception:
+            logger.exception("Outbox consumer %s failed", name)
+            processed[name] = 0
+    return processed
+
+
+def prune():
+    """Видаляє події, які вже обробили всі налаштовані споживачі."""
+    names = list(consumers())
+    if not names:
+        return 0
+    checkpoints = list(OutboxCheckpoint.objects.filter(consumer__in=names))
+    if len(checkpoints) < len(names):
+        return 0
+    # Події в пропусках ще можуть закомітитися — їх (і все вище) не чіпаємо
+    oldest = min(
+        min([checkpoint.last_event_id] + [event_id - 1 for event_id, _ in checkpoint.gaps])
+        for checkpoint in checkpoints
+    )
+    count, _ = OutboxEvent.objects.filter(id__lte=oldest).delete()
+    return count
@@ -0,0 +1,148 @@
+"""
+Помісячне range-партиціонування таблиці ActivityPoint за recorded_at (PostgreSQL).
+
+Таблиця перетворюється на партиціоновану міграцією 0005; точки з
+recorded_at = NULL або поза створеними місяцями потрапляють у DEFAULT-партицію.
+На інших БД (SQLite у тестах) таблиця лишається звичайною, а всі функції
+тут нічого не роблять.
+"""
+import gzip
+import re
+from datetime import date
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from .models import ActivityPoint
+
+PARENT_TABLE = ActivityPoint._meta.db_table
+PARTITION_KEY = 'recorded_at'
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+_NAME_RE = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned():
+    if not is_supported():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s",
+            [PARENT_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARENT_TABLE}_p{month:%Y_%m}"
+
+
+def partition_month(name):
+    match = _NAME_RE.search(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def list_partitions():
+    """[(назва, межі), ...] для всіх партицій таблиці точок."""
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s ORDER BY child.relname",
+            [PARENT_TABLE],
+        )
+        return cursor.fetchall()
+
+
+def create_month_partition(month):
+    """
+    Створює партицію для місяця, якщо її ще немає. Рядки цього місяця,
+    що вже лежать у DEFAULT-партиції, переносяться в нову (інакше ATTACH не пройде).
+    Повертає True, якщо партицію створено.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    if name in {row[0] for row in list_partitions()}:
+        return False
+
+    qn = connection.ops.quote_name
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {qn(name)} (LIKE {qn(PARENT_TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {qn(DEFAULT_PARTITION)} "
+            f"WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *) "
+            f"INSERT INTO {qn(name)} SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(PARENT_TABLE)} ATTACH PARTITION {qn(name)} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+    return True
+
+
+def ensure_partitions(months_ahead=3, months_back=0, today=None):
+    """Гарантує наявність партицій від (сьогодні - months_back) до (сьогодні + months_ahead)."""
+    current = month_start(today or date.today())
+    return [
+        partition_name(add_months(current, offset))
+        for offset in range(-months_back, months_ahead + 1)
+        if create_month_partition(add_months(current, offset))
+    ]
+
+
+def detach_partition(name, archive_dir=None):
+    """
+    Від'єднує партицію від таблиці точок. Якщо задано archive_dir, її рядки
+    зберігаються у <archive_dir>/<name>.copy.gz (формат COPY), а таблиця видаляється.
+    """
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(PARENT_TABLE)} DETACH PARTITION {qn(name)}")
+        if archive_dir is None:
+            return None
+        path = Path(archive_dir) / f"{name}.copy.gz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        sql = f"COPY {qn(name)} TO STDOUT"
+        with gzip.open(path, 'wt', encoding='utf-8') as archive:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                raw.copy_expert(sql, archive)
+            else:  # psycopg 3
+                with raw.copy(sql) as copy:
+                    for block in copy:
+                        archive.write(bytes(block).decode('utf-8'))
+        cursor.execute(f"DROP TABLE {qn(name)}")
+    return path
+
+
+def detach_older_than(months, archive_dir=None, today=None):
+    cutoff = add_months(month_start(today or date.today()), -months)
+    detached = []
+    for name, _ in list_partitions():
+        month = partition_month(name)
+        if month is not None and month < cutoff:
+            detach_partition(name, archive_dir)
+            detached.append(name)
+    return detached
@@ -0,0 +1,185 @@
+"""
+Вибіркове профілювання запитів.
+
+Один фоновий потік (StackSampler) раз на PROFILING_INTERVAL_MS знімає стек
+(sys._current_frames) потоків, що обробляють "озброєні" запити, і рахує
+однакові стеки. Запит озброюється одразу, якщо потрапив у вибірку
+PROFILING_SAMPLE_RATE, або коли триває довше половини PROFILING_SLOW_MS —
+тоді профіль зберігається, лише якщо запит таки перевищив поріг.
+
+Поки жоден запит не озброєний, потік спить до найближчого дедлайну, тож
+звичайний запит коштує лише вставку/видалення у словник.
+
+Профілі пишуться у PROFILING_DIR у форматі folded stacks
+("frame;frame;frame count"), який напряму приймають flamegraph.pl та
+speedscope. У каталозі зберігаються останні PROFILING_MAX_FILES файлів.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+EXTENSION = '.folded'
+# <unix_ms>-<reason>-<View>-<action>-<duration>ms
+_NAME_RE = re.compile(r'^(?P<ts>\d+)-(?P<reason>sampled|slow)-(?P<view>\w+)-(?P<action>\w+)-(?P<ms>\d+)ms$')
+_UNSAFE_RE = re.compile(r'\W+')
+
+
+def sample_rate():
+    return getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+
+
+def slow_ms():
+    return getattr(settings, 'PROFILING_SLOW_MS', None)
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+def max_files():
+    return getattr(settings, 'PROFILING_MAX_FILES', 200)
+
+
+def is_enabled():
+    return bool(sample_rate()) or slow_ms() is not None
+
+
+_PATH_PREFIXES = sorted({str(Path(p).resolve()) + os.sep for p in sys.path if p}, key=len, reverse=True)
+_labels = {}
+
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in _PATH_PREFIXES:
+            if filename.startswith(prefix):
+                filename = filename[len(prefix):]
+                break
+        label = _labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+    return label
+
+
+def _stack(frame):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class RequestProfile:
+    def __init__(self, thread_id, armed_at):
+        self.thread_id = thread_id
+        self.armed_at = armed_at  # time.monotonic(), з якого знімати стеки
+        self.stacks = Counter()
+        self.view = 'unknown'
+        self.action = 'unknown'
+
+
+class StackSampler:
+    """Фоновий потік, що знімає стеки потоків озброєних запитів."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._profiles = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self, armed_at):
+        profile = RequestProfile(threading.get_ident(), armed_at)
+        with self._condition:
+            self._profiles[profile.thread_id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return profile
+
+    def stop(self, profile):
+        with self._condition:
+            self._profiles.pop(profile.thread_id, None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                armed = [p for p in self._profiles.values() if p.armed_at <= now]
+                if not armed:
+                    deadlines = [p.armed_at for p in self._profiles.values()]
+                    self._condition.wait(min(deadlines) - now if deadlines else None)
+                    continue
+            frames = sys._current_frames()
+            samples = [(p, _stack(frames[p.thread_id])) for p in armed if p.thread_id in frames]
+            del frames
+            with self._condition:
+                # Після stop() профіль уже читає запит — туди більше не пишемо
+                for profile, stack in samples:
+                    if self._profiles.get(profile.thread_id) is profile:
+                        profile.stacks[stack] += 1
+            time.sleep(self.interval)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = StackSampler(getattr(settings, 'PROFILING_INTERVAL_MS', 5) / 1000)
+        return _sampler
+
+
+def _safe(value):
+    return _UNSAFE_RE.sub('_', value) or 'unknown'
+
+
+def save(profile, reason, duration_ms):
+    """Пише профіль у PROFILING_DIR і видаляє найстаріші файли понад PROFILING_MAX_FILES."""
+    if not profile.stacks:
+        return None
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{int(time.time() * 1000)}-{reason}-{_safe(profile.view)}-{_safe(profile.action)}-{int(duration_ms)}ms"
+    path = directory / f"{name}{EXTENSION}"
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(''.join(f"{stack} {count}\n" for stack, count in profile.stacks.most_common()))
+    os.replace(tmp, path)
+    for old in sorted(directory.glob(f'*{EXTENSION}'))[:-max_files()]:
+        old.unlink(missing_ok=True)
+    return name
+
+
+def list_profiles():
+    """Метадані збережених профілів, найновіші першими."""
+    profiles = []
+    for path in sorted(profile_dir().glob(f'*{EXTENSION}'), reverse=True):
+        match = _NAME_RE.match(path.stem)
+        if match is None:
+            continue
+        profiles.append({
+            'id': path.stem,
+            'captured_at': int(match['ts']) / 1000,
+            'reason': match['reason'],
+            'view': match['view'],
+            'action': match['action'],
+            'duration_ms': int(match['ms']),
+            'size_bytes': path.stat().st_size,
+        })
+    return profiles
+
+
+def profile_path(profile_id):
+    """Шлях до профілю або None (id перевіряється, щоб не вийти за межі каталогу)."""
+    if not _NAME_RE.match(profile_id):
+        return None
+    path = profile_dir() / f"{profile_id}{EXTENSION}"
+    return path if path.is_file() else None
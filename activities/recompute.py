@@ -0,0 +1,210 @@
+"""
+Пакетний перерахунок похідних даних по всіх користувачах (manage.py recompute).
+
+Користувачі діляться на шарди — фіксовані діапазони user_id ширини
+shard_size, тож межі шардів не зсуваються між запусками. Шарди
+обробляються пулом процесів (за замовчуванням по процесу на ядро).
+Воркер читає свій шард згрупованими запитами через QuerySet.iterator()
+(у PostgreSQL — серверний курсор, рядки не накопичуються в пам'яті) і
+пише результати пакетними upsert'ами (bulk_create(update_conflicts=True)).
+
+Результати шарда і його RecomputeCheckpoint комітяться в одній
+транзакції: перерваний запуск продовжується з resume=True без повторної
+обробки готових шардів і без напівзаписаних. З шардуванням БД
+(activities/sharding.py) статистика пишеться на шарди БД у їхніх власних
+транзакціях, а чекпойнт — у default, тож спільного коміту немає. Тоді
+чекпойнт пишеться лише після коміту всіх шардів БД, а перерахунок
+ідемпотентний (upsert + видалення зайвих рядків): збій між комітами
+лишає діапазон без чекпойнта, і --resume просто перерахує його ще раз.
+
+SQLite не витримує паралельних записів з кількох процесів, тож там шарди
+обробляються послідовно в поточному процесі.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from . import sharding, summaries
+from .conditional import bump_version
+from .models import Activity, RecomputeCheckpoint, UserMonthlyStats, UserSummary
+
+SHARD_SIZE = 1000
+BATCH_SIZE = 2000
+
+
+def _users_in(start, end):
+    return User.objects.filter(id__gte=start, id__lt=end)
+
+
+def recompute_monthly_stats(start, end):
+    """UserMonthlyStats з Activity (місяць за start_time). Повертає кількість записаних рядків."""
+    written = 0
+    # З шардуванням статистика лежить на шарді користувача поряд з його активностями
+    for alias in sharding.all_databases():
+        with sharding.writing(alias):
+            written += _recompute_monthly_stats(start, end)
+    return written
+
+
+def _recompute_monthly_stats(start, end):
+    rows = (
+        Activity.objects.filter(user_id__gte=start, user_id__lt=end, start_time__isnull=False)
+        .annotate(year=ExtractYear('start_time'), month=ExtractMonth('start_time'))
+        .values('user_id', 'year', 'month')
+        .annotate(distance=Sum('distance_m'), duration=Sum('duration_sec'))
+        .order_by()
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    seen = set()
+    batch = []
+    written = 0
+    for row in rows:
+        seen.add((row['user_id'], row['year'], row['month']))
+        batch.append(UserMonthlyStats(
+            user_id=row['user_id'], year=row['year'], month=row['month'],
+            total_distance_m=row['distance'] or 0.0, total_duration_sec=round(row['duration'] or 0),
+        ))
+        if len(batch) >= BATCH_SIZE:
+            written += _upsert_monthly_stats(batch)
+            batch = []
+    written += _upsert_monthly_stats(batch)
+
+    # Місяці, в яких активностей більше немає
+    stale = [
+        stats_id
+        for stats_id, *key in UserMonthlyStats.objects.filter(user_id__gte=start, user_id__lt=end)
+        .values_list('id', 'user_id', 'year', 'month').iterator(chunk_size=BATCH_SIZE)
+        if tuple(key) not in seen
+    ]
+    for offset in range(0, len(stale), BATCH_SIZE):
+        UserMonthlyStats.objects.filter(id__in=stale[offset:offset + BATCH_SIZE]).delete()
+    return written + len(stale)
+
+
+def _upsert_monthly_stats(batch):
+    if batch:
+        UserMonthlyStats.objects.bulk_create(
+            batch, update_conflicts=True,
+            unique_fields=['user', 'year', 'month'],
+            update_fields=['total_distance_m', 'total_duration_sec'],
+        )
+    return len(batch)
+
+
+def recompute_summaries(start, end):
+    """UserSummary для всіх користувачів шарда (нулі для тих, у кого даних немає)."""
+    computed = summaries.compute_all_summaries(user_range=(start, end))
+    empty = dict.fromkeys(summaries.SUMMARY_FIELDS, 0)
+    batch = []
+    written = 0
+    for user_id in _users_in(start, end).values_list('id', flat=True).iterator(chunk_size=BATCH_SIZE):
+        batch.append(UserSummary(user_id=user_id, **computed.get(user_id, empty)))
+        if len(batch) >= BATCH_SIZE:
+            written += _upsert_summaries(batch)
+            batch = []
+    written += _upsert_summaries(batch)
+    return written
+
+
+def _upsert_summaries(batch):
+    if batch:
+        UserSummary.objects.bulk_create(
+            batch, update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=[*summaries.SUMMARY_FIELDS, 'updated_at'],
+        )
+        user_ids = [summary.user_id for summary in batch]
+        transaction.on_commit(lambda: [summaries.invalidate(user_id) for user_id in user_ids])
+    return len(batch)
+
+
+# name -> (функція шарда, моделі, версії яких збільшуються після запуску)
+TASKS = {
+    'monthly_stats': (recompute_monthly_stats, (UserMonthlyStats,)),
+    'summaries': (recompute_summaries, (UserSummary,)),
+}
+
+
+@dataclass
+class ShardResult:
+    task: str
+    start: int
+    end: int
+    users: int
+    rows: int
+    seconds: float
+
+
+def shards(shard_size):
+    """[(start, end), ...] — непорожні діапазони user_id ширини shard_size."""
+    indexes = sorted({user_id // shard_size for user_id in User.objects.values_list('id', flat=True).iterator()})
+    return [(index * shard_size, (index + 1) * shard_size) for index in indexes]
+
+
+def recompute_shard(task, start, end):
+    """Перераховує один шард і записує чекпойнт (після коміту записів на шардах БД)."""
+    recompute, _ = TASKS[task]
+    started = time.perf_counter()
+    with transaction.atomic():
+        users = _users_in(start, end).count()
+        # Записи на шардах БД комітяться вже на виході з sharding.writing() усередині recompute(),
+        # записи в default — разом з чекпойнтом нижче
+        rows = recompute(start, end)
+        seconds = time.perf_counter() - started
+        RecomputeCheckpoint.objects.update_or_create(
+            task=task, shard_start=start, shard_end=end,
+            defaults={'users': users, 'rows_written': rows, 'duration_ms': round(seconds * 1000)},
+        )
+    return ShardResult(task, start, end, users, rows, seconds)
+
+
+def _init_worker():
+    # При spawn / forkserver процес стартує без налаштованого Django
+    import django
+    django.setup()
+
+
+def default_workers():
+    return 1 if connection.vendor == 'sqlite' else os.cpu_count() or 1
+
+
+def plan(task, shard_size=SHARD_SIZE, resume=False):
+    """
+    Шарди, які треба обробити. Без resume чекпойнти задачі скидаються
+    і перераховуються всі шарди.
+    """
+    if resume:
+        done = set(RecomputeCheckpoint.objects.filter(task=task).values_list('shard_start', 'shard_end'))
+    else:
+        RecomputeCheckpoint.objects.filter(task=task).delete()
+        done = set()
+    return [shard for shard in shards(shard_size) if shard not in done]
+
+
+def run(task, pending, workers=None):
+    """Генератор ShardResult у порядку завершення шардів."""
+    workers = workers or default_workers()
+    _, models = TASKS[task]
+    try:
+        if workers == 1 or len(pending) <= 1:
+            for start, end in pending:
+                yield recompute_shard(task, start, end)
+            return
+        # Дочірні процеси не повинні успадкувати відкрите з'єднання з БД
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        try:
+            futures = [pool.submit(recompute_shard, task, start, end) for start, end in pending]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            pool.shutdown(cancel_futures=True)
+    finally:
+        # Навіть після перерваного запуску: готові шарди вже закомічені
+        bump_version(*models)
@@ -1,16 +1,36 @@
-# from typing import List, Optional
+import datetime
+import operator
+import sys
+from collections import Counter
+from functools import reduce
+from operator import itemgetter
+from typing import List, Optional
 from django.contrib.auth.models import User
-# from django.db import IntegrityError
+from django.db import connections, router, transaction
+from django.db.models.signals import post_delete
+from django.utils import timezone
 from .models import (
-    Activity, Profile, Comment, Kudos, Follower, ActivityPoint, UserMonthlyStats
+    Activity, Profile, Comment, Kudos, Follower, ActivityPoint, UserMonthlyStats,
+    ActivityTypePerformanceView, MonthlyActivityStatsView, UserActivityLevelView,
 )
-from django.db.models import Sum, Count, Avg, Max, F  # For aggregation
+from django.db.models import Sum, Count, Avg, Max, F, Q  # For aggregation
 
 from django.db.models import Case, When, Value, CharField
 from django.db.models.functions import TruncMonth
 
-class BaseRepository:
+from .conditional import batch_version_bumps, bump_version
+from . import (
+    dedup, follow_graph, heatmap, identity_map, leaderboards, materialized, metrics, outbox, search, sharding, sketches,
+    summaries, track_archive,
+)
 
+class BaseRepository:
+    # Модель репозиторію і поле, за яким get_by_id / update / delete шукають рядок
+    # (для unit of work у DataAccessLayer)
+    model = None
+    lookup_field = 'pk'
+    # Які записи unit of work може відкладати до пакетного flush (delete — завжди)
+    batch_writes = ()
 
     def get_by_id(self, model_id: int):
         raise NotImplementedError
@@ -27,310 +47,763 @@ class BaseRepository:
     def delete(self, **kwargs) -> bool:
         raise NotImplementedError
 
+    def _delete_filter(self, **kwargs) -> Q:
+        """Умова, за якою delete(**kwargs) вибирає рядки."""
+        return Q(**{self.lookup_field: kwargs.get('id')})
+
+    def _shard(self, **kwargs):
+        """Шард рядків, які вибирає delete(**kwargs) (None без шардування)."""
+        return sharding.locate(self.model, kwargs.get('id'))
+
+    def _create(self, **kwargs):
+        """model.objects.create() на шарді власника рядка (див. activities/sharding.py)."""
+        instance = self.model(**kwargs)
+        with sharding.writing(sharding.owner_alias(instance)):
+            instance.save(force_insert=True)
+        return instance
+
+    def _updated(self, ids: List[int]):
+        """Похідні дані після update() рядків ids (версії, outbox, кеші)."""
+        bump_version(self.model)
+
+    def _created(self, instances: list):
+        """Похідні дані після пакетної вставки instances у unit of work (bulk_create не шле post_save)."""
+        bump_version(self.model)
+
+
+class UserRepository(BaseRepository):
+    model = User
+
+    def get_by_id(self, model_id: int) -> Optional[User]:
+        return identity_map.get(User, model_id, lambda: User.objects.filter(id=model_id).first())
+
+    def get_all(self) -> List[User]:
+        return User.objects.all()
+
+    def add(self, **kwargs) -> User:
+        # Ваш UserSerializer.create() подбає про хешування
+        return User.objects.create_user(**kwargs)
+
+    def update(self, model_id: int, **kwargs) -> bool:
+        if 'password' in kwargs and kwargs['password'] is None:
+            del kwargs['password']
+
+        # Оновлюємо звичайні поля
+        count = User.objects.filter(id=model_id).update(**kwargs)
+        if count:
+            bump_version(User)
+            identity_map.invalidate(User, model_id)
+
+        if 'password' in kwargs and kwargs['password'] is not None:
+            user = self.get_by_id(model_id)
+            if user:
+                user.set_password(kwargs['password'])
+                user.save()
+        return count > 0
+
+    def delete(self, **kwargs) -> bool:
+        count, _ = User.objects.filter(self._delete_filter(**kwargs)).delete()
+        return count > 0
+
+    def get_user_stats_report(self):
+        """Звіт: Агрегована статистика по користувачам"""
+        return User.objects.aggregate(
+            total_users=Count('id'),
+            users_with_profiles=Count('profile')
+        )
+
+
+class ProfileRepository(BaseRepository):
+    model = Profile
+    lookup_field = 'user_id'
+    batch_writes = ('add', 'update')
+
+    def get_by_id(self, model_id: int) -> Optional[Profile]:
+        """
+        ВИПРАВЛЕНО: Profile.id - це user.id, оскільки це OneToOneField.
+        Тому ми шукаємо по 'user_id', а не 'id'.
+        """
+        return identity_map.get(Profile, model_id, lambda: Profile.objects.filter(user_id=model_id).first())
+
+    def get_all(self) -> List[Profile]:
+        return Profile.objects.all()
+
+    def add(self, **kwargs) -> Profile:
+        # kwargs має містити 'user' або 'user_id'
+        return Profile.objects.create(**kwargs)
+
+    def update(self, model_id: int, **kwargs) -> bool:
+        # 'model_id' тут - це user_id
+        count = Profile.objects.filter(user_id=model_id).update(**kwargs)
+        if count:
+            self._updated([model_id])
+        return count > 0
+
+    def _updated(self, ids: List[int]):
+        bump_version(Profile)
+        for user_id in ids:
+            search.refresh('profiles', user_id)
+            identity_map.invalidate(Profile, user_id)
+
+    def _created(self, instances: list):
+        self._updated([profile.user_id for profile in instances])
+
+    def delete(self, **kwargs) -> bool:
+        count, _ = Profile.objects.filter(self._delete_filter(**kwargs)).delete()
+        return count > 0
+
+    def get_global_profiles_stats_report(self):
+        """
+        Звіт: Агрегована статистика по профілях.
+        """
+        return Profile.objects.aggregate(
+            total_profiles=Count('user'),
+            average_age=Avg('age'),
+            average_weight_kg=Avg('weight_kg'),
+            average_height_cm=Avg('height_cm')
+        )
+
+
+class ActivityRepository(BaseRepository):
+    model = Activity
+    batch_writes = ('add', 'update')
+
+    def get_by_id(self, model_id: int) -> Optional[Activity]:
+        try:
+            return Activity.objects.using(sharding.locate(Activity, model_id)).get(id=model_id)
+        except Activity.DoesNotExist:
+            return None
+
+    def get_all(self) -> List[Activity]:
+        return sharding.scatter(Activity.objects.all())
+
+    @transaction.atomic
+    def add(self, **kwargs) -> Activity:
+        return self._create(**kwargs)
+
+    @transaction.atomic
+    def update(self, model_id: int, **kwargs) -> bool:
+        with sharding.writing(sharding.locate(Activity, model_id)):
+            count = Activity.objects.filter(id=model_id).update(**kwargs)
+            if count:
+                self._updated([model_id])
+        return count > 0
+
+    def _updated(self, ids: List[int]):
+        bump_version(Activity)
+        for activity_id in ids:
+            outbox.emit_updated(Activity, activity_id)
+        for activity in Activity.objects.filter(id__in=ids):
+            dedup.record(activity)
+        for user_id in set(Activity.objects.filter(id__in=ids).values_list('user_id', flat=True)):
+            summaries.rebuild_summary(user_id)
+        sketches.mark_stale()
+        leaderboards.invalidate()
+
+    def _created(self, instances: list):
+        bump_version(Activity)
+        outbox.emit_many(Activity, 'created', instances)
+        totals = {}
+        for activity in instances:
+            count, distance, duration = totals.get(activity.user_id, (0, 0, 0))
+            totals[activity.user_id] = (count + 1, distance + activity.distance_m, duration + activity.duration_sec)
+        for user_id, (count, distance, duration) in totals.items():
+            summaries.apply_delta(
+                user_id, activities_count=count, total_distance_m=distance, total_duration_sec=duration
+            )
+        sketches.record_activities(instances)
+        dedup.record_new(instances)
+        for activity in instances:
+            leaderboards.record_activity(activity)
+
+    @transaction.atomic
+    def delete(self, **kwargs) -> bool:
+        with sharding.writing(self._shard(**kwargs)):
+            count, _ = Activity.objects.filter(self._delete_filter(**kwargs)).delete()
+        return count > 0
+
+    def get_global_stats_report(self):
+        """Звіт: Агрегована статистика по всіх активностях"""
+        if sharding.is_enabled():
+            # Середнє зливається з сум і кількостей шардів
+            parts = sharding.gather(lambda alias: Activity.objects.using(alias).aggregate(
+                total_activities=Count('id'),
+                total_distance_meters=Sum('distance_m'),
+                total_duration_seconds=Sum('duration_sec'),
+                elevation_sum=Sum('elevation_gain_m'),
+                elevation_count=Count('elevation_gain_m'),
+            ))
+            report = {key: _sum(part[key] for part in parts) for key in parts[0]}
+            elevation_sum, elevation_count = report.pop('elevation_sum'), report.pop('elevation_count')
+            report['average_elevation_gain'] = elevation_sum / elevation_count if elevation_count else None
+            return report
+        return Activity.objects.aggregate(
+            total_activities=Count('id'),
+            total_distance_meters=Sum('distance_m'),
+            total_duration_seconds=Sum('duration_sec'),
+            average_elevation_gain=Avg('elevation_gain_m')
+        )
+
+
+class CommentRepository(BaseRepository):
+    model = Comment
+    batch_writes = ('add', 'update')
+
+    def get_by_id(self, model_id: int) -> Optional[Comment]:
+        try:
+            return Comment.objects.using(sharding.locate(Comment, model_id)).get(id=model_id)
+        except Comment.DoesNotExist:
+            return None
+
+    def get_all(self) -> List[Comment]:
+        return sharding.scatter(Comment.objects.all())
+
+    @transaction.atomic
+    def add(self, **kwargs) -> Comment:
+        return self._create(**kwargs)
+
+    @transaction.atomic
+    def update(self, model_id: int, **kwargs) -> bool:
+        with sharding.writing(sharding.locate(Comment, model_id)):
+            count = Comment.objects.filter(id=model_id).update(**kwargs)
+            if count:
+                self._updated([model_id])
+        return count > 0
+
+    def _updated(self, ids: List[int]):
+        bump_version(Comment)
+        for comment_id in ids:
+            outbox.emit_updated(Comment, comment_id)
+            search.refresh('comments', comment_id)
+
+    def _created(self, instances: list):
+        bump_version(Comment)
+        outbox.emit_many(Comment, 'created', instances)
+        for comment in instances:
+            search.refresh('comments', comment.pk)
+
+    @transaction.atomic
+    def delete(self, **kwargs) -> bool:
+        with sharding.writing(self._shard(**kwargs)):
+            count, _ = Comment.objects.filter(self._delete_filter(**kwargs)).delete()
+        return count > 0
+
+    def get_comment_stats_report(self):
+        """Звіт: Найбільш коментовані активності"""
+        return sharding.scatter(Comment.objects.values('activity_id').annotate(
+            comment_count=Count('id')
+        ).order_by('-comment_count'), key=itemgetter('comment_count'), reverse=True)
+
+
+class KudosRepository(BaseRepository):
+    model = Kudos
+    batch_writes = ('add', 'update')
+
+    def get_by_id(self, model_id: int) -> Optional[Kudos]:
+        try:
+            return Kudos.objects.using(sharding.locate(Kudos, model_id)).get(id=model_id)
+        except Kudos.DoesNotExist:
+            return None
+
+    def get_all(self) -> List[Kudos]:
+        return sharding.scatter(Kudos.objects.all())
+
+    @transaction.atomic
+    def add(self, **kwargs) -> Kudos:
+        return self._create(**kwargs)
+
+    @transaction.atomic
+    def update(self, model_id: int, **kwargs) -> bool:
+        with sharding.writing(sharding.locate(Kudos, model_id)):
+            count = Kudos.objects.filter(id=model_id).update(**kwargs)
+            if count:
+                self._updated([model_id])
+        return count > 0
+
+    def _updated(self, ids: List[int]):
+        bump_version(Kudos)
+        for kudos_id in ids:
+            outbox.emit_updated(Kudos, kudos_id)
+
+    def _created(self, instances: list):
+        bump_version(Kudos)
+        outbox.emit_many(Kudos, 'created', instances)
+        # Kudos лежить на тому ж шарді, що й активність
+        owners = dict(Activity.objects.using(instances[0]._state.db).filter(
+            id__in=[kudos.activity_id for kudos in instances]
+        ).values_list('id', 'user_id'))
+        received = Counter(owners.get(kudos.activity_id) for kudos in instances)
+        for user_id, count in received.items():
+            summaries.apply_delta(user_id, kudos_received=count)
+
+    @transaction.atomic
+    def delete(self, **kwargs) -> bool:
+        with sharding.writing(self._shard(**kwargs)):
+            count, _ = Kudos.objects.filter(self._delete_filter(**kwargs)).delete()
+        return count > 0
+
+    def add_many(self, user_id: int, activity_ids: List[int]) -> dict:
+        """
+        Дає kudos багатьом активностям одним INSERT на шард (дублікати ігноруються БД).
+        Повертає {activity_id: 'created' | 'exists' | 'not_found'} у порядку activity_ids.
+        """
+        activity_ids = list(dict.fromkeys(activity_ids))
+        created, existing = set(), set()
+        for alias, candidates in sharding.locate_many(Activity, activity_ids).items():
+            with transaction.atomic(), sharding.writing(alias):
+                shard_created, shard_existing = self._add_many(user_id, candidates)
+            created |= shard_created
+            existing |= shard_existing
+
+        return {
+            activity_id: 'created' if activity_id in created
+            else 'exists' if activity_id in existing
+            else 'not_found'
+            for activity_id in activity_ids
+        }
+
+    def _add_many(self, user_id: int, activity_ids: List[int]):
+        found = set(Activity.objects.filter(id__in=activity_ids).values_list('id', flat=True))
+        existing = set(Kudos.objects.filter(
+            user_id=user_id, activity_id__in=found
+        ).values_list('activity_id', flat=True))
+
+        Kudos.objects.bulk_create(
+            [Kudos(user_id=user_id, activity_id=activity_id) for activity_id in found - existing],
+            ignore_conflicts=True
+        )
+        # bulk_create не викликає сигнали, тому похідні дані оновлюємо тут
+        created = set(Kudos.objects.filter(
+            user_id=user_id, activity_id__in=found
+        ).values_list('activity_id', flat=True)) - existing
+        if created:
+            bump_version(Kudos)
+            outbox.emit_many(Kudos, 'created', Kudos.objects.filter(user_id=user_id, activity_id__in=created))
+            owners = Activity.objects.filter(id__in=created).values('user_id').annotate(
+                count=Count('id')
+            ).order_by()
+            for owner in owners:
+                summaries.apply_delta(owner['user_id'], kudos_received=owner['count'])
+        return created, existing
+
+    def get_kudos_stats_report(self):
+        """Звіт: Активності з найбільшою кількістю 'kudos'"""
+        return sharding.scatter(Kudos.objects.values('activity_id').annotate(
+            kudos_count=Count('id')
+        ).order_by('-kudos_count'), key=itemgetter('kudos_count'), reverse=True)
+
+
+class FollowerRepository(BaseRepository):
+    model = Follower
+    batch_writes = ('add',)
+    # Поля, за якими можна видаляти підписку
+    delete_keys = ('id', 'follower_id', 'followee_id')
+
+    def get_by_id(self, model_id: int) -> Optional[Follower]:
+        return Follower.objects.filter(pk=model_id).first()
+
+    def get_by_composite_key(self, follower_id: int, followee_id: int) -> Optional[Follower]:
+        try:
+            return Follower.objects.get(follower_id=follower_id, followee_id=followee_id)
+        except Follower.DoesNotExist:
+            return None
+
+    def get_all(self) -> List[Follower]:
+        return Follower.objects.all()
+
+    @transaction.atomic
+    def add(self, **kwargs) -> Follower:
+        # kwargs: {'follower': User_obj, 'followee': User_obj}
+        return Follower.objects.create(**kwargs)
+
+    def update(self, model_id: int, **kwargs) -> bool:
+        raise NotImplementedError("Follower не оновлюється, а видаляється/створюється")
+
+    def _created(self, instances: list):
+        bump_version(Follower)
+        outbox.emit_many(Follower, 'created', instances)
+        for user_id, count in Counter(follow.follower_id for follow in instances).items():
+            summaries.apply_delta(user_id, following_count=count)
+        for user_id, count in Counter(follow.followee_id for follow in instances).items():
+            summaries.apply_delta(user_id, followers_count=count)
+        follow_graph.record_follows((follow.follower_id, follow.followee_id) for follow in instances)
+
+    def add_many(self, follower_id: int, followee_ids: List[int]) -> dict:
+        """
+        Підписує follower_id на багатьох користувачів одним INSERT.
+        Повертає {followee_id: 'created' | 'exists' | 'not_found' | 'self'} у порядку followee_ids.
+        """
+        followee_ids = list(dict.fromkeys(followee_ids))
+        with transaction.atomic():
+            found = set(User.objects.filter(id__in=followee_ids).values_list('id', flat=True))
+            found.discard(follower_id)
+            existing = set(Follower.objects.filter(
+                follower_id=follower_id, followee_id__in=found
+            ).values_list('followee_id', flat=True))
+            Follower.objects.bulk_create(
+                [Follower(follower_id=follower_id, followee_id=followee_id) for followee_id in found - existing],
+                ignore_conflicts=True
+            )
+            created = set(Follower.objects.filter(
+                follower_id=follower_id, followee_id__in=found
+            ).values_list('followee_id', flat=True)) - existing
+            if created:
+                bump_version(Follower)
+                outbox.emit_many(
+                    Follower, 'created', Follower.objects.filter(follower_id=follower_id, followee_id__in=created)
+                )
+                summaries.apply_delta(follower_id, following_count=len(created))
+                for followee_id in created:
+                    summaries.apply_delta(followee_id, followers_count=1)
+                # bulk_create не відправляє post_save
+                follow_graph.record_follows((follower_id, followee_id) for followee_id in created)
+
+        result = {}
+        for followee_id in followee_ids:
+            if followee_id == follower_id:
+                result[followee_id] = 'self'
+            elif followee_id in created:
+                result[followee_id] = 'created'
+            elif followee_id in existing:
+                result[followee_id] = 'exists'
+            else:
+                result[followee_id] = 'not_found'
+        return result
+
+    @transaction.atomic
+    def delete(self, **kwargs) -> bool:
+        """
+        kwargs: {'follower_id': 1, 'followee_id': 2} (або id, можна разом з follower_id).
+        Один DELETE ... RETURNING за індексом, без попереднього SELECT; post_delete
+        (версії, outbox, підсумки, граф) надсилається для кожного видаленого рядка.
+        """
+        key = self._delete_key(**kwargs)
+        using = router.db_for_write(Follower)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        where = ' AND '.join(f"{qn(name)} = %s" for name in key)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {qn(Follower._meta.db_table)} WHERE {where} RETURNING id, follower_id, followee_id",
+                list(key.values()),
+            )
+            rows = cursor.fetchall()
+        for pk, follower_id, followee_id in rows:
+            instance = Follower(id=pk, follower_id=follower_id, followee_id=followee_id)
+            post_delete.send(sender=Follower, instance=instance, using=using, origin=instance)
+        return bool(rows)
+
+    def _delete_filter(self, **kwargs) -> Q:
+        return Q(**self._delete_key(**kwargs))
+
+    def _delete_key(self, **kwargs) -> dict:
+        key = {name: kwargs[name] for name in self.delete_keys if name in kwargs}
+        if not key:
+            raise ValueError("Follower delete requires id or follower_id / followee_id.")
+        return key
 
-# class UserRepository(BaseRepository):
-#
-#     def get_by_id(self, model_id: int) -> Optional[User]:
-#         try:
-#             return User.objects.get(id=model_id)
-#         except User.DoesNotExist:
-#             return None
-#
-#     def get_all(self) -> List[User]:
-#         return User.objects.all()
-#
-#     def add(self, **kwargs) -> User:
-#         # Ваш UserSerializer.create() подбає про хешування
-#         return User.objects.create_user(**kwargs)
-#
-#     def update(self, model_id: int, **kwargs) -> bool:
-#         if 'password' in kwargs and kwargs['password'] is None:
-#             del kwargs['password']
-#
-#         # Оновлюємо звичайні поля
-#         count = User.objects.filter(id=model_id).update(**kwargs)
-#
-#         if 'password' in kwargs and kwargs['password'] is not None:
-#             user = self.get_by_id(model_id)
-#             if user:
-#                 user.set_password(kwargs['password'])
-#                 user.save()
-#         return count > 0
-#
-#     def delete(self, **kwargs) -> bool:
-#         count, _ = User.objects.filter(id=kwargs.get('id')).delete()
-#         return count > 0
-#
-#     def get_user_stats_report(self):
-#         """Звіт: Агрегована статистика по користувачам"""
-#         return User.objects.aggregate(
-#             total_users=Count('id'),
-#             users_with_profiles=Count('profile')
-#         )
-#
-#
-# class ProfileRepository(BaseRepository):
-#
-#     def get_by_id(self, model_id: int) -> Optional[Profile]:
-#         """
-#         ВИПРАВЛЕНО: Profile.id - це user.id, оскільки це OneToOneField.
-#         Тому ми шукаємо по 'user_id', а не 'id'.
-#         """
-#         try:
-#             return Profile.objects.get(user_id=model_id)
-#         except Profile.DoesNotExist:
-#             return None
-#
-#     def get_all(self) -> List[Profile]:
-#         return Profile.objects.all()
-#
-#     def add(self, **kwargs) -> Profile:
-#         # kwargs має містити 'user' або 'user_id'
-#         return Profile.objects.create(**kwargs)
-#
-#     def update(self, model_id: int, **kwargs) -> bool:
-#         # 'model_id' тут - це user_id
-#         count = Profile.objects.filter(user_id=model_id).update(**kwargs)
-#         return count > 0
-#
-#     def delete(self, **kwargs) -> bool:
-#         count, _ = Profile.objects.filter(user_id=kwargs.get('id')).delete()
-#         return count > 0
-#
-#     def get_global_profiles_stats_report(self):
-#         """
-#         Звіт: Агрегована статистика по профілях.
-#         """
-#         return Profile.objects.aggregate(
-#             total_profiles=Count('user'),
-#             average_age=Avg('age'),
-#             average_weight_kg=Avg('weight_kg'),
-#             average_height_cm=Avg('height_cm')
-#         )
-#
-#
-# class ActivityRepository(BaseRepository):
-#
-#     def get_by_id(self, model_id: int) -> Optional[Activity]:
-#         try:
-#             return Activity.objects.get(id=model_id)
-#         except Activity.DoesNotExist:
-#             return None
-#
-#     def get_all(self) -> List[Activity]:
-#         return Activity.objects.all()
-#
-#     def add(self, **kwargs) -> Activity:
-#         return Activity.objects.create(**kwargs)
-#
-#     def update(self, model_id: int, **kwargs) -> bool:
-#         count = Activity.objects.filter(id=model_id).update(**kwargs)
-#         return count > 0
-#
-#     def delete(self, **kwargs) -> bool:
-#         count, _ = Activity.objects.filter(id=kwargs.get('id')).delete()
-#         return count > 0
-#
-#     def get_global_stats_report(self):
-#         """Звіт: Агрегована статистика по всіх активностях"""
-#         return Activity.objects.aggregate(
-#             total_activities=Count('id'),
-#             total_distance_meters=Sum('distance_m'),
-#             total_duration_seconds=Sum('duration_sec'),
-#             average_elevation_gain=Avg('elevation_gain_m')
-#         )
-
-#
-# class CommentRepository(BaseRepository):
-#
-#     def get_by_id(self, model_id: int) -> Optional[Comment]:
-#         try:
-#             return Comment.objects.get(id=model_id)
-#         except Comment.DoesNotExist:
-#             return None
-#
-#     def get_all(self) -> List[Comment]:
-#         return Comment.objects.all()
-#
-#     def add(self, **kwargs) -> Comment:
-#         return Comment.objects.create(**kwargs)
-#
-#     def update(self, model_id: int, **kwargs) -> bool:
-#         count = Comment.objects.filter(id=model_id).update(**kwargs)
-#         return count > 0
-#
-#     def delete(self, **kwargs) -> bool:
-#         count, _ = Comment.objects.filter(id=kwargs.get('id')).delete()
-#         return count > 0
-#
-#     def get_comment_stats_report(self):
-#         """Звіт: Найбільш коментовані активності"""
-#         return Comment.objects.values('activity_id').annotate(
-#             comment_count=Count('id')
-#         ).order_by('-comment_count')
-#
-#
-# class KudosRepository(BaseRepository):
-#
-#     def get_by_id(self, model_id: int) -> Optional[Kudos]:
-#         try:
-#             return Kudos.objects.get(id=model_id)
-#         except Kudos.DoesNotExist:
-#             return None
-#
-#     def get_all(self) -> List[Kudos]:
-#         return Kudos.objects.all()
-#
-#     def add(self, **kwargs) -> Kudos:
-#         return Kudos.objects.create(**kwargs)
-#
-#     def update(self, model_id: int, **kwargs) -> bool:
-#         count = Kudos.objects.filter(id=model_id).update(**kwargs)
-#         return count > 0
-#
-#     def delete(self, **kwargs) -> bool:
-#         count, _ = Kudos.objects.filter(id=kwargs.get('id')).delete()
-#         return count > 0
-#
-#     def get_kudos_stats_report(self):
-#         """Звіт: Активності з найбільшою кількістю 'kudos'"""
-#         return Kudos.objects.values('activity_id').annotate(
-#             kudos_count=Count('id')
-#         ).order_by('-kudos_count')
-#
-#
-# class FollowerRepository(BaseRepository):
-#
-#     def get_by_id(self, model_id: int):
-#         raise NotImplementedError("Використовуйте get_by_composite_key")
-#
-#     def get_by_composite_key(self, follower_id: int, followee_id: int) -> Optional[Follower]:
-#         try:
-#             return Follower.objects.get(follower_id=follower_id, followee_id=followee_id)
-#         except Follower.DoesNotExist:
-#             return None
-#
-#     def get_all(self) -> List[Follower]:
-#         return Follower.objects.all()
-#
-#     def add(self, **kwargs) -> Follower:
-#         # kwargs: {'follower': User_obj, 'followee': User_obj}
-#         return Follower.objects.create(**kwargs)
-#
-#     def update(self, model_id: int, **kwargs) -> bool:
-#         raise NotImplementedError("Follower не оновлюється, а видаляється/створюється")
-#
-#     def delete(self, **kwargs) -> bool:
-#         # kwargs: {'follower_id': 1, 'followee_id': 2}
-#         count, _ = Follower.objects.filter(
-#             follower_id=kwargs.get('follower_id'),
-#             followee_id=kwargs.get('followee_id')
-#         ).delete()
-#         return count > 0
-#
-#     def get_follower_stats_report(self):
-#         """Звіт: Топ-10 найпопулярніших користувачів (кого найбільше фоловлять)"""
-#         return Follower.objects.values('followee_id').annotate(
-#             follower_count=Count('id')
-#         ).order_by('-follower_count')[:10]
-#
-#
-# class ActivityPointRepository(BaseRepository):
-#
-#     def get_by_id(self, model_id: int) -> Optional[ActivityPoint]:
-#         try:
-#             return ActivityPoint.objects.get(id=model_id)
-#         except ActivityPoint.DoesNotExist:
-#             return None
-#
-#     def get_all(self) -> List[ActivityPoint]:
-#         return ActivityPoint.objects.all()
-#
-#     def add(self, **kwargs) -> ActivityPoint:
-#         return ActivityPoint.objects.create(**kwargs)
-#
-#     def update(self, model_id: int, **kwargs) -> bool:
-#         count = ActivityPoint.objects.filter(id=model_id).update(**kwargs)
-#         return count > 0
-#
-#     def delete(self, **kwargs) -> bool:
-#         count, _ = ActivityPoint.objects.filter(id=kwargs.get('id')).delete()
-#         return count > 0
-#
-#
-# class UserMonthlyStatsRepository(BaseRepository):
-#
-#     def get_by_id(self, model_id: int):
-#         raise NotImplementedError("Використовуйте get_by_composite_key")
-#
-#     def get_by_composite_key(self, user_id: int, year: int, month: int) -> Optional[UserMonthlyStats]:
-#         try:
-#             return UserMonthlyStats.objects.get(user_id=user_id, year=year, month=month)
-#         except UserMonthlyStats.DoesNotExist:
-#             return None
-#
-#     def get_all(self) -> List[UserMonthlyStats]:
-#         return UserMonthlyStats.objects.all()
-#
-#     def add(self, **kwargs) -> UserMonthlyStats:
-#         return UserMonthlyStats.objects.create(**kwargs)
-#
-#     def update(self, model_id, **kwargs):
-#         user = kwargs.get('user')
-#         year = kwargs.get('year')
-#         month = kwargs.get('month')
-#
-#         if not all([user, year, month]):
-#             raise ValueError("Для оновлення UserMonthlyStats потрібні user, year, month")
-#
-#         stats, created = UserMonthlyStats.objects.update_or_create(
-#             user=user,
-#             year=year,
-#             month=month,
-#             defaults=kwargs
-#         )
-#         return not created
-#
-#     def delete(self, **kwargs) -> bool:
-#         count, _ = UserMonthlyStats.objects.filter(
-#             user_id=kwargs.get('user_id'),
-#             year=kwargs.get('year'),
-#             month=kwargs.get('month')
-#         ).delete()
-#         return count > 0
-#
-#     def get_distance_leaderboard_report(self):
-#         """Звіт: Глобальний лідерборд по загальній дистанції"""
-#         return UserMonthlyStats.objects.values('user__username').annotate(
-#             total_distance=Sum('total_distance_m')
-#         ).order_by('-total_distance')
-#
+    def get_followers_page(self, user_id: int, after=None, limit: int = 50):
+        """Підписники user_id, новіші першими; after — (created_at, id) останнього рядка попередньої сторінки."""
+        return self._keyset_page(Follower.objects.filter(followee_id=user_id), 'follower_id', after, limit)
+
+    def get_following_page(self, user_id: int, after=None, limit: int = 50):
+        """Підписки user_id, новіші першими."""
+        return self._keyset_page(Follower.objects.filter(follower_id=user_id), 'followee_id', after, limit)
+
+    def _keyset_page(self, qs, user_field, after, limit):
+        """
+        ([{user_id, username, followed_at}], (created_at, id) для наступної сторінки або None).
+        Умова created_at <= x задає межу діапазону в індексі (followee|follower, created_at, id, ...),
+        тож сторінка читає лише limit + 1 записів індексу незалежно від глибини.
+        """
+        if after is not None:
+            created_at, pk = after
+            qs = qs.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(id__lt=pk))
+        rows = list(qs.order_by('-created_at', '-id').values_list('id', 'created_at', user_field)[:limit + 1])
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_id, last_created_at, _ = rows[-1]
+            next_key = (last_created_at, last_id)
+        usernames = dict(User.objects.filter(id__in=[row[2] for row in rows]).values_list('id', 'username'))
+        return [
+            {"user_id": user_id, "username": usernames.get(user_id), "followed_at": created_at}
+            for _, created_at, user_id in rows
+        ], next_key
+
+    def get_suggestions(self, user_id: int, limit: int = 10) -> List[dict]:
+        """"Люди, яких ви можете знати" (друзі друзів) з графа в пам'яті."""
+        suggestions = follow_graph.get_graph().suggestions(user_id, limit)
+        usernames = dict(User.objects.filter(id__in=[uid for uid, _ in suggestions]).values_list('id', 'username'))
+        return [
+            {"user_id": uid, "username": usernames.get(uid), "mutual_count": mutual}
+            for uid, mutual in suggestions
+        ]
+
+    def get_mutual_followers(self, user_id: int, other_id: int) -> List[int]:
+        return follow_graph.get_graph().mutual_followers(user_id, other_id).tolist()
+
+    def get_counts(self, user_ids: List[int]) -> dict:
+        return follow_graph.get_graph().counts(user_ids)
+
+    def get_follower_stats_report(self):
+        """Звіт: Топ-10 найпопулярніших користувачів (кого найбільше фоловлять)"""
+        return Follower.objects.values('followee_id').annotate(
+            follower_count=Count('id')
+        ).order_by('-follower_count')[:10]
+
+
+class ActivityPointRepository(BaseRepository):
+    model = ActivityPoint
+    batch_writes = ('add', 'update')
+
+    def _updated(self, ids: List[int]):
+        bump_version(ActivityPoint)
+        heatmap.invalidate_activities(
+            set(ActivityPoint.objects.filter(id__in=ids).values_list('activity_id', flat=True))
+        )
+
+    def get_by_id(self, model_id: int) -> Optional[ActivityPoint]:
+        try:
+            return ActivityPoint.objects.using(sharding.locate(ActivityPoint, model_id)).get(id=model_id)
+        except ActivityPoint.DoesNotExist:
+            return None
+
+    def get_all(self) -> List[ActivityPoint]:
+        return sharding.scatter(ActivityPoint.objects.all())
+
+    def get_for_activity(self, activity: Activity):
+        """
+        Точки однієї активності. Лише за activity_id: точки можуть бути записані поза
+        start/end активності, тож межі recorded_at відкинули б справжні дані
+        (PostgreSQL перевіряє індекс activity_id у кожній партиції).
+        Архівований трек читається з файлу без запису в БД і доповнюється точками,
+        доданими після архівації.
+        """
+        qs = ActivityPoint.objects.using(sharding.owner_alias(activity)).filter(activity_id=activity.id)
+        qs = qs.order_by('recorded_at', 'id')
+        archived = track_archive.read_points(activity.id)
+        if archived is None:
+            return qs
+        points = {point['id']: ActivityPoint(activity_id=activity.id, **point) for point in archived}
+        # Якщо паралельний rehydrate встиг закомітитися, ті самі id є і в БД
+        points.update((point.id, point) for point in qs)
+        return sorted(points.values(), key=lambda point: (
+            point.recorded_at is None, point.recorded_at or track_archive.EPOCH, point.id
+        ))
+
+    def get_in_range(self, since=None, until=None):
+        """Точки за проміжок часу (з відсіканням партицій за recorded_at)."""
+        qs = ActivityPoint.objects.all()
+        if since:
+            qs = qs.filter(recorded_at__gte=since)
+        if until:
+            qs = qs.filter(recorded_at__lt=until)
+        return sharding.scatter(qs)
+
+    def add(self, **kwargs) -> ActivityPoint:
+        return self._create(**kwargs)
+
+    def update(self, model_id: int, **kwargs) -> bool:
+        with sharding.writing(sharding.locate(ActivityPoint, model_id)):
+            count = ActivityPoint.objects.filter(id=model_id).update(**kwargs)
+            if count:
+                self._updated([model_id])
+        return count > 0
+
+    def delete(self, **kwargs) -> bool:
+        with sharding.writing(self._shard(**kwargs)):
+            count, _ = ActivityPoint.objects.filter(self._delete_filter(**kwargs)).delete()
+        return count > 0
+
+
+class UserMonthlyStatsRepository(BaseRepository):
+    model = UserMonthlyStats
+
+    def get_by_id(self, model_id: int) -> Optional[UserMonthlyStats]:
+        return UserMonthlyStats.objects.using(sharding.locate(UserMonthlyStats, model_id)).filter(pk=model_id).first()
+
+    def get_by_composite_key(self, user_id: int, year: int, month: int) -> Optional[UserMonthlyStats]:
+        try:
+            return UserMonthlyStats.objects.using(sharding.shard_for(user_id)).get(user_id=user_id, year=year, month=month)
+        except UserMonthlyStats.DoesNotExist:
+            return None
+
+    def get_all(self) -> List[UserMonthlyStats]:
+        return sharding.scatter(UserMonthlyStats.objects.all())
+
+    def add(self, **kwargs) -> UserMonthlyStats:
+        return self._create(**kwargs)
+
+    def update(self, model_id, **kwargs):
+        user = kwargs.get('user')
+        year = kwargs.get('year')
+        month = kwargs.get('month')
+
+        if not all([user, year, month]):
+            raise ValueError("Для оновлення UserMonthlyStats потрібні user, year, month")
+
+        stats, created = UserMonthlyStats.objects.using(sharding.shard_for(getattr(user, 'pk', user))).update_or_create(
+            user=user,
+            year=year,
+            month=month,
+            defaults=kwargs
+        )
+        return not created
+
+    def delete(self, **kwargs) -> bool:
+        with sharding.writing(self._shard(**kwargs)):
+            count, _ = UserMonthlyStats.objects.filter(self._delete_filter(**kwargs)).delete()
+        return count > 0
+
+    def _delete_filter(self, **kwargs) -> Q:
+        return Q(user_id=kwargs.get('user_id'), year=kwargs.get('year'), month=kwargs.get('month'))
+
+    def _shard(self, **kwargs):
+        return sharding.shard_for(kwargs.get('user_id'))
+
+    def get_distance_leaderboard_report(self):
+        """Звіт: Глобальний лідерборд по загальній дистанції"""
+        if sharding.is_enabled():
+            # На шардах лише заглушки користувачів, тож імена — з основної БД
+            totals = Counter()
+            for row in sharding.scatter(UserMonthlyStats.objects.values('user_id').annotate(
+                total_distance=Sum('total_distance_m')
+            ).order_by()):
+                totals[row['user_id']] += row['total_distance'] or 0
+            usernames = _usernames(totals)
+            return [
+                {'user__username': usernames.get(user_id), 'total_distance': total}
+                for user_id, total in totals.most_common()
+            ]
+        return UserMonthlyStats.objects.values('user__username').annotate(
+            total_distance=Sum('total_distance_m')
+        ).order_by('-total_distance')
+
+
+def _sum(values):
+    values = [value for value in values if value is not None]
+    return sum(values) if values else None
+
+
+def _usernames(user_ids):
+    return dict(User.objects.filter(id__in=list(user_ids)).values_list('id', 'username'))
+
+
+# (мінімум активностей, рівень) для user_levels, від найвищого
+ACTIVITY_LEVELS = ((10, 'Pro Athlete'), (3, 'Active'))
+DEFAULT_ACTIVITY_LEVEL = 'Beginner'
+
+
+def _activity_level(activities_count):
+    return next((level for minimum, level in ACTIVITY_LEVELS if activities_count >= minimum), DEFAULT_ACTIVITY_LEVEL)
+
+
+def _is_month_start(value):
+    # Місяці представлення — у поточній часовій зоні (як TruncMonth)
+    if value is None:
+        return True
+    value = timezone.localtime(value)
+    return value.day == 1 and value.time() == datetime.time.min
+
+
+@metrics.instrument('analytics')
 class AnalyticsRepository:
 
+    # З шардуванням (activities/sharding.py) звіти по Activity рахуються на кожному
+    # шарді паралельно і зливаються тут; імена користувачів — з основної БД
+
     def get_top_distance_users(self):
 
+        if sharding.is_enabled():
+            # Користувач живе на одному шарді, тож топ-10 шардів містять загальний топ-10
+            rows = sharding.scatter(
+                Activity.objects.values('user_id').annotate(total_distance=Sum('distance_m'))
+                .filter(total_distance__gt=0).order_by('-total_distance')[:10],
+                key=itemgetter('total_distance'), reverse=True,
+            )[:10]
+            usernames = _usernames(row['user_id'] for row in rows)
+            return [
+                {'username': usernames.get(row['user_id']), 'total_distance': row['total_distance']}
+                for row in rows
+            ]
+
         return User.objects.annotate(
             total_distance=Sum('activities__distance_m')
         ).filter(total_distance__gt=0).order_by('-total_distance')[:10]
 
     def get_social_activities(self):
 
-        return Activity.objects.annotate(
+        qs = Activity.objects.annotate(
             comments_count=Count('comments', distinct=True),
             kudos_count=Count('kudos', distinct=True)
         ).annotate(
             engagement_score=F('comments_count') + F('kudos_count')
         ).filter(engagement_score__gt=0).order_by('-engagement_score')
+        if not sharding.is_enabled():
+            return qs
+
+        # Коментарі і kudos лежать на шарді своєї активності
+        rows = sharding.scatter(
+            qs.values('id', 'user_id', 'comments_count', 'kudos_count', 'engagement_score'),
+            key=itemgetter('engagement_score'), reverse=True,
+        )
+        usernames = _usernames({row['user_id'] for row in rows})
+        return [
+            {
+                'id': row['id'],
+                'user__username': usernames.get(row['user_id']),
+                'comments_count': row['comments_count'],
+                'kudos_count': row['kudos_count'],
+                'engagement_score': row['engagement_score'],
+            }
+            for row in rows
+        ]
+
+    def get_monthly_activity_stats(self, since=None, until=None):
+        # Матеріалізоване представлення зберігає цілі місяці, тож межі посеред місяця — з живої таблиці
+        if materialized.is_ready(MonthlyActivityStatsView) and _is_month_start(since) and _is_month_start(until):
+            qs = MonthlyActivityStatsView.objects.all()
+            if since:
+                qs = qs.filter(month__gte=since)
+            if until:
+                qs = qs.filter(month__lt=until)
+            return qs.values('month', 'total_activities', 'total_distance', 'avg_duration').order_by('-month')
 
-    def get_monthly_activity_stats(self):
+        qs = Activity.objects.all()
+        if since:
+            qs = qs.filter(start_time__gte=since)
+        if until:
+            qs = qs.filter(start_time__lt=until)
+        qs = qs.annotate(month=TruncMonth('start_time')).values('month')
+        if not sharding.is_enabled():
+            return qs.annotate(
+                total_activities=Count('id'),
+                total_distance=Sum('distance_m'),
+                avg_duration=Avg('duration_sec')
+            ).order_by('-month')
 
-        return Activity.objects.annotate(
-            month=TruncMonth('start_time')
-        ).values('month').annotate(
+        months = {}
+        for row in sharding.scatter(qs.annotate(
             total_activities=Count('id'),
             total_distance=Sum('distance_m'),
-            avg_duration=Avg('duration_sec')
-        ).order_by('-month')
+            total_duration=Sum('duration_sec'),
+            duration_count=Count('duration_sec'),
+        ).order_by()):
+            merged = months.setdefault(row['month'], Counter())
+            merged.update({key: row[key] or 0 for key in (
+                'total_activities', 'total_distance', 'total_duration', 'duration_count'
+            )})
+        return [
+            {
+                'month': month,
+                'total_activities': merged['total_activities'],
+                'total_distance': merged['total_distance'],
+                'avg_duration': merged['total_duration'] / merged['duration_count'] if merged['duration_count'] else None,
+            }
+            # Як ORDER BY month DESC у PostgreSQL: активності без start_time — першими
+            for month, merged in sorted(months.items(), key=lambda item: (item[0] is not None, item[0]), reverse=True)
+        ]
 
     def get_influential_users(self):
 
@@ -340,39 +813,341 @@ class AnalyticsRepository:
 
     def get_activity_type_performance(self):
 
-        return Activity.objects.values('activity_type').annotate(
-            avg_distance=Avg('distance_m'),
+        if materialized.is_ready(ActivityTypePerformanceView):
+            return ActivityTypePerformanceView.objects.values(
+                'activity_type', 'avg_distance', 'max_elevation', 'record_count'
+            ).order_by('-avg_distance')
+
+        if not sharding.is_enabled():
+            return Activity.objects.values('activity_type').annotate(
+                avg_distance=Avg('distance_m'),
+                max_elevation=Max('elevation_gain_m'),
+                record_count=Count('id')
+            ).order_by('-avg_distance')
+
+        types = {}
+        for row in sharding.scatter(Activity.objects.values('activity_type').annotate(
+            total_distance=Sum('distance_m'),
+            distance_count=Count('distance_m'),
             max_elevation=Max('elevation_gain_m'),
-            record_count=Count('id')
-        ).order_by('-avg_distance')
+            record_count=Count('id'),
+        ).order_by()):
+            merged = types.setdefault(row['activity_type'], {
+                'total_distance': 0, 'distance_count': 0, 'max_elevation': None, 'record_count': 0,
+            })
+            merged['total_distance'] += row['total_distance'] or 0
+            merged['distance_count'] += row['distance_count']
+            merged['record_count'] += row['record_count']
+            merged['max_elevation'] = max(
+                (value for value in (merged['max_elevation'], row['max_elevation']) if value is not None), default=None
+            )
+        rows = [
+            {
+                'activity_type': activity_type,
+                'avg_distance': merged['total_distance'] / merged['distance_count'] if merged['distance_count'] else None,
+                'max_elevation': merged['max_elevation'],
+                'record_count': merged['record_count'],
+            }
+            for activity_type, merged in types.items()
+        ]
+        return sorted(rows, key=lambda row: (row['avg_distance'] is not None, row['avg_distance']), reverse=True)
 
     def get_user_activity_levels(self):
 
-        return User.objects.annotate(
-            activities_count=Count('activities')
-        ).annotate(
+        if sharding.is_enabled():
+            counts = Counter()
+            for row in sharding.scatter(Activity.objects.values('user_id').annotate(activities_count=Count('id')).order_by()):
+                counts[row['user_id']] += row['activities_count']
+            return [
+                {'username': username, 'activities_count': counts[user_id], 'status': _activity_level(counts[user_id])}
+                for user_id, username in User.objects.values_list('id', 'username').iterator()
+            ]
+
+        if materialized.is_ready(UserActivityLevelView):
+            qs = UserActivityLevelView.objects.all()
+        else:
+            qs = User.objects.annotate(activities_count=Count('activities'))
+        return qs.annotate(
             status=Case(
-                When(activities_count__gte=10, then=Value('Pro Athlete')),
-                When(activities_count__gte=3, then=Value('Active')),
-                default=Value('Beginner'),
+                *[When(activities_count__gte=minimum, then=Value(level)) for minimum, level in ACTIVITY_LEVELS],
+                default=Value(DEFAULT_ACTIVITY_LEVEL),
                 output_field=CharField(),
             )
         ).values('username', 'activities_count', 'status')
 
+    def get_window_leaderboard(self, window='all', activity_type=None, limit=10, user_id=None, circle_of=None):
+        """
+        Лідерборд за дистанцією для вікна (див. leaderboards.WINDOWS).
+        circle_of=<user_id> обмежує таблицю цим користувачем і його підписками.
+        """
+        user_ids = None
+        if circle_of is not None:
+            user_ids = list(Follower.objects.filter(follower_id=circle_of).values_list('followee_id', flat=True))
+            user_ids.append(circle_of)
+        board = leaderboards.get_leaderboard(window, activity_type, user_ids, limit, user_id)
+        usernames = dict(User.objects.filter(id__in=[uid for uid, _ in board['top']]).values_list('id', 'username'))
+        me = board['me']
+        return {
+            "window": window,
+            "since": board['start'],
+            "activity_type": activity_type,
+            "total_users": board['total'],
+            "results": [
+                {"rank": place, "user_id": uid, "username": usernames.get(uid), "total_distance": score}
+                for place, (uid, score) in enumerate(board['top'], start=1)
+            ],
+            "me": {"rank": me[0], "total_distance": me[1]} if me else None,
+        }
+
+    def get_approx_active_users(self, since=None, until=None, activity_type=None):
+        """Унікальні активні користувачі по місяцях (HyperLogLog) і за весь проміжок."""
+        rows = sketches.load_sketches(sketches.ACTIVE_USERS, since, until, activity_type)
+        by_month = {}
+        for bucket, _, sketch in rows:
+            by_month.setdefault(bucket, sketches.HyperLogLog()).merge(sketch)
+        total = sketches.merge_all(sketches.ACTIVE_USERS, (sketch for _, _, sketch in rows))
+        estimate = total.estimate()
+        return {
+            "months": [
+                {"month": bucket.strftime('%Y-%m'), "active_users": round(sketch.estimate())}
+                for bucket, sketch in sorted(by_month.items())
+            ],
+            "total_active_users": round(estimate),
+            "relative_std_error": total.relative_error,
+            "stale_since": sketches.stale_since(),
+            "confidence_95": [
+                round(estimate * (1 - 2 * total.relative_error)),
+                round(estimate * (1 + 2 * total.relative_error)),
+            ],
+        }
+
+    def get_approx_quantiles(self, kind, quantiles, since=None, until=None, activity_type=None):
+        """Квантилі distance / duration (KLL) по типах активності і загалом."""
+        by_type = {}
+        for _, dimension, sketch in sketches.load_sketches(kind, since, until, activity_type):
+            by_type.setdefault(dimension, sketches.KLLSketch()).merge(sketch)
+        overall = sketches.merge_all(kind, by_type.values())
+
+        def describe(sketch):
+            return {"count": sketch.n, "quantiles": {str(q): sketch.quantile(q) for q in quantiles}}
+
+        return {
+            "metric": kind,
+            "rank_error": overall.rank_error,
+            "stale_since": sketches.stale_since(),
+            "all": describe(overall),
+            "by_activity_type": {dimension: describe(sketch) for dimension, sketch in sorted(by_type.items())},
+        }
+
+class SearchRepository:
+
+    def search_comments(self, query: str, offset: int = 0, limit: int = 20) -> List[dict]:
+        ranked = search.search_ids('comments', query, offset, limit)
+        comments = {}
+        for alias, pks in sharding.locate_many(Comment, [pk for pk, _ in ranked]).items():
+            comments.update(Comment.objects.using(alias).in_bulk(pks))
+        return [
+            {
+                "id": pk,
+                "activity_id": comments[pk].activity_id,
+                "user_id": comments[pk].user_id,
+                "body": comments[pk].body,
+                "rank": rank,
+            }
+            for pk, rank in ranked if pk in comments
+        ]
+
+    def search_profiles(self, query: str, offset: int = 0, limit: int = 20) -> List[dict]:
+        ranked = search.search_ids('profiles', query, offset, limit)
+        profiles = Profile.objects.in_bulk([pk for pk, _ in ranked], field_name='user_id')
+        return [
+            {
+                "user_id": pk,
+                "display_name": profiles[pk].display_name,
+                "city": profiles[pk].city,
+                "bio": profiles[pk].bio,
+                "rank": rank,
+            }
+            for pk, rank in ranked if pk in profiles
+        ]
+
+    def search_users(self, prefix: str, offset: int = 0, limit: int = 20) -> List[dict]:
+        """Префіксний пошук за username або display_name (індекси UPPER(...) у PostgreSQL)."""
+        # OR через JOIN не йде по індексах: два префіксні запити, кожен по своєму індексу, і UNION
+        fields = ('id', 'username', 'profile__display_name')
+        branches = [
+            User.objects.filter(username__istartswith=prefix).values(*fields),
+            User.objects.filter(profile__display_name__istartswith=prefix).values(*fields),
+        ]
+        if connections[router.db_for_read(User)].features.supports_slicing_ordering_in_compound:
+            # Кожній гілці достатньо перших offset + limit рядків
+            branches = [branch.order_by('username')[:offset + limit] for branch in branches]
+        return list(branches[0].union(branches[1]).order_by('username')[offset:offset + limit])
+
+
+class UnitOfWork:
+    """
+    Відкладені записи та identity map для `with DataAccessLayer() as db:`.
+
+    add/update/delete лише запам'ятовуються і на flush() пишуться пакетами
+    по моделях у порядку: DELETE, bulk_create, bulk_update (по одному на
+    набір полів) — відписка і повторна підписка в одному блоці не впаде на
+    унікальному ключі. Видалення, зареєстровані після add() тієї ж моделі,
+    виконуються вже після вставок. Нові екземпляри проходять full_clean()
+    ще в add(). Похідні дані оновлюються так само, як при звичайних записах,
+    але пакетно: _created() / _updated() репозиторію, QuerySet.delete()
+    шле сигнали сам; версії DataVersion збільшуються один раз на модель.
+    """
+
+    def __init__(self):
+        self.identity_map = {}  # (model, pk) -> екземпляр або None
+        self._new = {}  # repository -> [екземпляри]
+        self._dirty = {}  # repository -> {pk: {поле: значення}}
+        self._deleted = {}  # repository -> {шард: [Q]}
+        self._deleted_after_new = {}  # те саме, для delete() після add() тієї ж моделі
+
+    def get(self, repository, model_id):
+        key = (repository.model, model_id)
+        if key not in self.identity_map:
+            self.identity_map[key] = repository.get_by_id(model_id)
+        return self.identity_map[key]
+
+    def register_new(self, repository, instance):
+        # Як save(): clean() моделі (Activity перевіряє start/end) і валідація полів.
+        # FK і унікальність перевіряє БД на flush, інакше це запит на кожен рядок
+        relations = [field.name for field in instance._meta.concrete_fields if field.is_relation]
+        instance.full_clean(exclude=relations, validate_unique=False, validate_constraints=False)
+        self._new.setdefault(repository, []).append(instance)
+        return instance
+
+    def register_dirty(self, repository, model_id, fields):
+        self._dirty.setdefault(repository, {}).setdefault(model_id, {}).update(fields)
+        instance = self.identity_map.get((repository.model, model_id))
+        if instance is not None:
+            # Читання всередині блоку бачать власні зміни
+            for name, value in fields.items():
+                setattr(instance, name, value)
+
+    def register_deleted(self, repository, **kwargs):
+        deleted = self._deleted_after_new if repository in self._new else self._deleted
+        deleted.setdefault(repository, {}).setdefault(repository._shard(**kwargs), []).append(
+            repository._delete_filter(**kwargs)
+        )
+        if 'id' in kwargs:
+            self.identity_map[(repository.model, kwargs['id'])] = None
+
+    def flush(self):
+        # З шардуванням кожна група пишеться на свій шард (див. activities/sharding.py)
+        with transaction.atomic(), batch_version_bumps():
+            self._flush_deleted(self._deleted)
+            # Вставки в порядку першого add() по моделях: FK на щойно створені рядки вже матимуть pk
+            for repository, instances in self._new.items():
+                for alias, group in sharding.group_by_shard(instances).items():
+                    with sharding.writing(alias):
+                        repository.model.objects.bulk_create(group, batch_size=1000)
+                        repository._created(group)
+            for repository, changes in self._dirty.items():
+                for alias, model_ids in sharding.locate_many(repository.model, changes).items():
+                    with sharding.writing(alias):
+                        self._flush_dirty(repository, {model_id: changes[model_id] for model_id in model_ids})
+            self._flush_deleted(self._deleted_after_new)
+        self._new, self._dirty, self._deleted, self._deleted_after_new = {}, {}, {}, {}
+
+    @staticmethod
+    def _flush_deleted(deleted):
+        for repository, shards in deleted.items():
+            for alias, filters in shards.items():
+                with sharding.writing(alias):
+                    repository.model.objects.filter(reduce(operator.or_, filters)).delete()
+
+    def _flush_dirty(self, repository, changes):
+        pks = {model_id: model_id for model_id in changes}
+        if repository.lookup_field != 'pk':
+            pks = dict(repository.model.objects.filter(
+                **{f"{repository.lookup_field}__in": list(changes)}
+            ).values_list(repository.lookup_field, 'pk'))
+        groups = {}
+        for model_id, fields in changes.items():
+            if model_id in pks:
+                groups.setdefault(tuple(sorted(fields)), []).append(
+                    repository.model(pk=pks[model_id], **fields)
+                )
+        for fields, instances in groups.items():
+            repository.model.objects.bulk_update(instances, fields, batch_size=1000)
+        repository._updated(list(changes))
+
+
+class UnitOfWorkRepository:
+    """Обгортка репозиторію на час unit of work; решта методів — без змін."""
+
+    def __init__(self, repository, unit_of_work):
+        self._repository = repository
+        self._unit_of_work = unit_of_work
+
+    def __getattr__(self, name):
+        return getattr(self._repository, name)
+
+    def get_by_id(self, model_id: int):
+        return self._unit_of_work.get(self._repository, model_id)
+
+    def add(self, **kwargs):
+        if 'add' not in self._repository.batch_writes:
+            return self._repository.add(**kwargs)
+        return self._unit_of_work.register_new(self._repository, self._repository.model(**kwargs))
+
+    def update(self, model_id: int, **kwargs) -> bool:
+        """Відкладене оновлення; рядки, яких немає в БД, при flush просто не зміняться."""
+        if 'update' not in self._repository.batch_writes:
+            return self._repository.update(model_id, **kwargs)
+        self._unit_of_work.register_dirty(self._repository, model_id, kwargs)
+        return True
+
+    def delete(self, **kwargs) -> bool:
+        self._unit_of_work.register_deleted(self._repository, **kwargs)
+        return True
+
+
 class DataAccessLayer:
+    """
+    Доступ до всіх репозиторіїв. Як контекстний менеджер працює в режимі
+    unit of work: блок виконується в одній транзакції, get_by_id повторно
+    не ходить у БД, а add/update/delete пишуться пакетами на виході
+    (після винятку — відкочуються). Помилки обмежень БД (IntegrityError)
+    для відкладених записів виникають на виході з блоку.
+    """
+    REPOSITORIES = ('users', 'profiles', 'activities', 'activity_points', 'comments', 'followers', 'kudos', 'user_stats')
+
     def __init__(self):
-#         self.users = UserRepository()
-#         self.profiles = ProfileRepository()
-#         self.activities = ActivityRepository()
-#         self.activity_points = ActivityPointRepository()
-#         self.comments = CommentRepository()
-#         self.followers = FollowerRepository()
-#         self.kudos = KudosRepository()
-#         self.user_stats = UserMonthlyStatsRepository()
+        self.users = UserRepository()
+        self.profiles = ProfileRepository()
+        self.activities = ActivityRepository()
+        self.activity_points = ActivityPointRepository()
+        self.comments = CommentRepository()
+        self.followers = FollowerRepository()
+        self.kudos = KudosRepository()
+        self.user_stats = UserMonthlyStatsRepository()
         self.analytics = AnalyticsRepository()
+        self.search = SearchRepository()
+        self.unit_of_work = None
 
     def __enter__(self):
+        if self.unit_of_work is not None:
+            raise RuntimeError("DataAccessLayer unit of work is already active.")
+        self._atomic = transaction.atomic()
+        self._atomic.__enter__()
+        self.unit_of_work = UnitOfWork()
+        for name in self.REPOSITORIES:
+            setattr(self, name, UnitOfWorkRepository(getattr(self, name), self.unit_of_work))
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
\ No newline at end of file
+        unit_of_work, self.unit_of_work = self.unit_of_work, None
+        for name in self.REPOSITORIES:
+            setattr(self, name, getattr(self, name)._repository)
+        try:
+            if exc_type is None:
+                unit_of_work.flush()
+        except BaseException:
+            self._atomic.__exit__(*sys.exc_info())
+            raise
+        return self._atomic.__exit__(exc_type, exc_val, exc_tb)
@@ -0,0 +1,220 @@
+"""
+Повнотекстовий пошук по коментарях і профілях.
+
+PostgreSQL: згенеровані колонки search_vector (tsvector, конфігурація
+'simple' — тексти змішані українською/англійською, стемінг не потрібен)
+з GIN-індексами створює міграція 0009. Запит будується як префіксний
+tsquery ('бі:* & км:*') і ранжується ts_rank, тож пошук читає лише
+знайдені рядки з індексу.
+
+Інші БД (SQLite у розробці): інвертований індекс у пам'яті процесу
+(InvertedIndex) з BM25-ранжуванням і префіксним пошуком по відсортованому
+словнику. Будується ліниво при першому запиті і оновлюється сигналами.
+Записи інших процесів сигналів тут не шлють, тож індекс перебудовується,
+якщо DataVersion моделі змінилася і він старший за SEARCH_INDEX_REBUILD_SECONDS.
+"""
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from . import sharding
+from .conditional import get_versions, version_name
+from .models import Comment, Profile
+
+SEARCH_CONFIG = 'simple'
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def profile_text(display_name, city, bio):
+    # Ім'я важить більше за місто, місто — більше за біо (як setweight A/B/C у PostgreSQL)
+    return ' '.join([display_name or ''] * 3 + [city or ''] * 2 + [bio or ''])
+
+
+# kind -> (модель, поля для values_list (перше — id документа), функція тексту документа)
+DOCUMENTS = {
+    'comments': (Comment, ('id', 'body'), lambda body: body),
+    'profiles': (Profile, ('user_id', 'display_name', 'city', 'bio'), profile_text),
+}
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def _tsquery(terms):
+    return ' & '.join(f"{term}:*" for term in terms)
+
+
+def postgres_search(kind, terms, offset, limit):
+    model, fields, _ = DOCUMENTS[kind]
+    table = connection.ops.quote_name(model._meta.db_table)
+    params = (SEARCH_CONFIG, _tsquery(terms))
+    qs = (
+        model.objects
+        .alias(matched=RawSQL(f"{table}.search_vector @@ to_tsquery(%s, %s)", params, output_field=BooleanField()))
+        .filter(matched=True)
+        .annotate(rank=RawSQL(f"ts_rank({table}.search_vector, to_tsquery(%s, %s))", params, output_field=FloatField()))
+        .order_by('-rank', f'-{fields[0]}')
+        .values_list(fields[0], 'rank')
+    )
+    if not sharding.is_sharded(model):
+        return list(qs[offset:offset + limit])
+    # Коментарі на шардах: з кожного перші offset + limit, далі злиття за тим самим порядком
+    rows = sharding.gather(lambda alias: list(qs.using(alias)[:offset + limit]))
+    ranked = sorted((row for shard_rows in rows for row in shard_rows), key=lambda row: (-row[1], -row[0]))
+    return ranked[offset:offset + limit]
+
+
+class InvertedIndex:
+    """Інвертований індекс з BM25 і префіксним збігом термів."""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.postings = defaultdict(dict)  # term -> {doc_id: tf}
+        self.doc_terms = {}  # doc_id -> терми документа (для видалення)
+        self.doc_lengths = {}
+        self._total_length = 0
+        self._vocabulary = None  # відсортований список термів, перебудовується ліниво
+
+    def add(self, doc_id, text):
+        self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        if not counts:
+            return
+        for term, tf in counts.items():
+            if term not in self.postings:
+                self._vocabulary = None
+            self.postings[term][doc_id] = tf
+        length = sum(counts.values())
+        self.doc_terms[doc_id] = list(counts)
+        self.doc_lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id):
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self.doc_terms.pop(doc_id):
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+                self._vocabulary = None
+
+    def _expand(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        start = bisect_left(self._vocabulary, prefix)
+        end = bisect_left(self._vocabulary, prefix + '\U0010ffff')
+        return self._vocabulary[start:end]
+
+    def search(self, terms, offset=0, limit=20):
+        """[(doc_id, score), ...] — документи, що містять усі терми (як префікси)."""
+        if not terms or not self.doc_lengths:
+            return []
+        total_docs = len(self.doc_lengths)
+        average_length = self._total_length / total_docs
+        scores = None
+        for prefix in terms:
+            term_scores = defaultdict(float)
+            for term in self._expand(prefix):
+                docs = self.postings[term]
+                idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / average_length
+                    term_scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    doc_id: score + term_scores[doc_id]
+                    for doc_id, score in scores.items() if doc_id in term_scores
+                }
+            if not scores:
+                return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[offset:offset + limit]
+
+
+_lock = threading.Lock()
+_indexes = {}
+_built = {}  # kind -> (версія DataVersion моделі на момент побудови, time.monotonic())
+
+
+def _rebuild_seconds():
+    return getattr(settings, 'SEARCH_INDEX_REBUILD_SECONDS', 60)
+
+
+def _is_stale(kind, version):
+    built_version, built_at = _built[kind]
+    # Свої записи індекс уже врахував через refresh(), тож версія відрізнятиметься і без чужих;
+    # перебудова — не частіше ніж раз на SEARCH_INDEX_REBUILD_SECONDS
+    return version != built_version and time.monotonic() - built_at > _rebuild_seconds()
+
+
+def _index(kind):
+    model, fields, to_text = DOCUMENTS[kind]
+    # Версію читаємо до побудови: запис, що закомітиться під час неї, дасть наступну перебудову
+    version = get_versions([model])[0][version_name(model)]
+    with _lock:
+        index = _indexes.get(kind)
+        if index is None or _is_stale(kind, version):
+            index = InvertedIndex()
+            rows = model.objects.values_list(*fields)
+            for doc_id, *values in (sharding.scatter(rows) if sharding.is_sharded(model) else rows.iterator()):
+                index.add(doc_id, to_text(*values))
+            _indexes[kind] = index
+            _built[kind] = (version, time.monotonic())
+        return index
+
+
+def invalidate():
+    """Скидає індекси в пам'яті (напр. після масового завантаження); вони перебудуються при пошуку."""
+    with _lock:
+        _indexes.clear()
+        _built.clear()
+
+
+def refresh(kind, doc_id):
+    """Переіндексовує документ у пам'яті (якщо індекс уже побудований)."""
+    if uses_postgres():
+        return  # колонка search_vector згенерована, оновлює її сама БД
+    with _lock:
+        index = _indexes.get(kind)
+        if index is None:
+            return
+        model, fields, to_text = DOCUMENTS[kind]
+        row = (
+            model.objects.using(sharding.locate(model, doc_id))
+            .filter(**{fields[0]: doc_id}).values_list(*fields[1:]).first()
+        )
+        if row is None:
+            index.remove(doc_id)
+        else:
+            index.add(doc_id, to_text(*row))
+
+
+def search_ids(kind, query, offset=0, limit=20):
+    """[(id документа, rank), ...] для kind з DOCUMENTS (для профілів id — user_id)."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    if uses_postgres():
+        return postgres_search(kind, terms, offset, limit)
+    index = _index(kind)
+    with _lock:
+        return index.search(terms, offset, limit)
@@ -10,53 +10,150 @@ from .models import (
     ActivityPoint,
     UserMonthlyStats
 )
+from . import metrics, sharding, summaries
 
-class UserSerializer(serializers.ModelSerializer):
+
+class TimedListSerializer(serializers.ListSerializer):
+    """ListSerializer, що пише час побудови .data у метрики."""
+
+    @property
+    def data(self):
+        with metrics.timer('api_serializer_duration_seconds', serializer=type(self.child).__name__, many='true'):
+            return super().data
+
+
+class ShardedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PK-поле, що шукає рядок sharded-моделі (activity, parent_comment) на його шарді."""
+
+    def to_internal_value(self, data):
+        with sharding.pinned(sharding.locate(self.get_queryset().model, data)):
+            return super().to_internal_value(data)
+
+
+class RepositorySerializer(serializers.ModelSerializer):
+    """
+    Базовий серіалізатор: якщо у save() передано 'repository',
+    створення/оновлення йде через репозиторій DataAccessLayer.
+    """
+    serializer_related_field = ShardedPrimaryKeyRelatedField
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # many=True теж має потрапляти в метрики серіалізації
+        meta = getattr(cls, 'Meta', None)
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with metrics.timer('api_serializer_duration_seconds', serializer=type(self).__name__, many='false'):
+            return super().data
+
+    def create(self, validated_data):
+        repository = validated_data.pop('repository', None)
+        if repository is None:
+            return super().create(validated_data)
+        return repository.add(**validated_data)
+
+    def update(self, instance, validated_data):
+        repository = validated_data.pop('repository', None)
+        model_id = validated_data.pop('model_id', instance.pk)
+        if repository is None:
+            return super().update(instance, validated_data)
+        repository.update(model_id, **validated_data)
+        instance.refresh_from_db()
+        return instance
+
+
+class UserSerializer(RepositorySerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password']
         extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
-        user = User.objects.create_user(
+        repository = validated_data.pop('repository', None)
+        data = dict(
             username=validated_data['username'],
             email=validated_data.get('email', ''), # .get() is safer
             password=validated_data['password']
         )
-        return user
+        if repository is not None:
+            return repository.add(**data)
+        return User.objects.create_user(**data)
+
+class ProfileListSerializer(TimedListSerializer):
+
+    def to_representation(self, data):
+        # Підсумки всієї сторінки одним запитом замість запиту на кожен профіль
+        profiles = list(data.all() if hasattr(data, 'all') else data)
+        self.context['summaries'] = summaries.get_summaries([profile.user_id for profile in profiles])
+        return super().to_representation(profiles)
+
+
+class ProfileSerializer(RepositorySerializer):
+    summary = serializers.SerializerMethodField()
 
-class ProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = Profile
         fields = '__all__'
         read_only_fields = ('user',)
+        list_serializer_class = ProfileListSerializer
 
+    def get_summary(self, obj):
+        prefetched = self.context.get('summaries')
+        if prefetched is not None and obj.user_id in prefetched:
+            return prefetched[obj.user_id]
+        return summaries.get_summary(obj.user_id)
 
-class ActivitySerializer(serializers.ModelSerializer):
+
+class ActivitySerializer(RepositorySerializer):
     class Meta:
         model = Activity
         fields = '__all__'
         read_only_fields = ('user',)
 
-class CommentSerializer(serializers.ModelSerializer):
+
+class UploadPointSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ActivityPoint
+        exclude = ('id', 'activity')
+
+
+class ActivityUploadSerializer(ActivitySerializer):
+    """Активність разом з треком (POST /api/activities/upload/)."""
+    points = UploadPointSerializer(many=True, required=False, max_length=100000)
+
+class CommentSerializer(RepositorySerializer):
     class Meta:
         model = Comment
         fields = '__all__'
         read_only_fields = ('user',)
 
-class KudosSerializer(serializers.ModelSerializer):
+class KudosSerializer(RepositorySerializer):
     class Meta:
         model = Kudos
         fields = '__all__'
         read_only_fields = ('user',)
 
-class FollowerSerializer(serializers.ModelSerializer):
+class KudosBatchSerializer(serializers.Serializer):
+    activity_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500
+    )
+
+
+class FollowerSerializer(RepositorySerializer):
     class Meta:
         model = Follower
         fields = '__all__'
         read_only_fields = ('follower',)
 
-class ActivityPointSerializer(serializers.ModelSerializer):
+class FollowerBatchSerializer(serializers.Serializer):
+    followee_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500
+    )
+
+class ActivityPointSerializer(RepositorySerializer):
     class Meta:
         model = ActivityPoint
         fields = '__all__'
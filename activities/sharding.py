@@ -0,0 +1,435 @@
+"""
+Шардування даних користувачів за user_id.
+
+SHARD_DATABASES — список alias'ів з DATABASES, між якими розподіляються
+активності, точки, коментарі, kudos, місячна статистика і похідні від
+активності таблиці (відбитки, архів треків). Користувачі, профілі,
+підписки, версії, outbox і решта глобальних таблиць лишаються в основній
+БД. Порожній список (за замовчуванням) вимикає шардування.
+
+- Карта user_id -> шард — таблиця UserShard в основній БД (з LRU в процесі
+  і поколінням у спільному кеші). Новий користувач отримує найменш
+  заповнений шард; користувачі без запису живуть на першому шарді.
+- Коментарі / kudos / точки лежать на шарді активності, до якої належать.
+- id на шарді з індексом i починаються з i << SHARD_ID_BITS (manage.py
+  init_shards), тож id глобально унікальні, а шард рядка вгадується з id
+  одним запитом (після переносу користувача — пошуком по всіх шардах).
+- На кожному шарді є "заглушки" auth_user (лише id) для FK; самі
+  користувачі завжди читаються з основної БД.
+
+ShardRouter (DATABASE_ROUTERS) направляє запис екземпляра на шард
+власника, а запити без екземпляра — на шард, закріплений через pinned()
+(репозиторії DataAccessLayer закріплюють шард рядка, з яким працюють).
+Глобальна аналітика виконується scatter-gather: gather() запускає запит
+на всіх шардах паралельно в пулі потоків, результати зливаються в Python.
+
+Транзакції — в межах однієї БД: writing() відкриває atomic() на шарді
+поряд з транзакцією основної БД, але атомарності між ними немає. Шард
+комітиться першим (на виході з writing()), основна БД — після нього,
+тож події outbox, DataVersion (bump_version) і чекпойнти (Outbox /
+RecomputeCheckpoint), що пишуться в default, можуть загубитися, якщо
+збій стався між двома комітами: рядки на шарді є, а подій про них немає
+і кеші / ETag не інвалідовані до наступного запису. Похідні дані
+відновлює manage.py recompute (ідемпотентний).
+Після масового імпорту користувачів (bulk_create, без сигналів) потрібен
+manage.py init_shards, щоб з'явилися їхні заглушки.
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count
+
+from .caching import LRUCache
+from .models import (
+    Activity, ActivityFingerprint, ActivityPoint, ArchivedTrack, Comment, Kudos, UserMonthlyStats, UserShard,
+)
+
+# Модель -> поле власника: 'user' (шард користувача) або 'activity' (шард активності)
+OWNER_FIELDS = {
+    Activity: 'user',
+    UserMonthlyStats: 'user',
+    ActivityPoint: 'activity',
+    Comment: 'activity',
+    Kudos: 'activity',
+    ArchivedTrack: 'activity',
+    ActivityFingerprint: 'activity',
+}
+# Порядок копіювання при переносі користувача (батьки раніше за дітей)
+MOVE_ORDER = (Activity, ActivityPoint, Comment, Kudos, ArchivedTrack, ActivityFingerprint, UserMonthlyStats)
+SHARD_ID_BITS = 40
+BATCH_SIZE = 2000
+GENERATION_KEY = 'shard-map-gen'
+
+_pinned = ContextVar('shard', default=None)
+_lru = LRUCache(100000)
+
+
+def aliases():
+    return list(getattr(settings, 'SHARD_DATABASES', []))
+
+
+def is_enabled():
+    return bool(aliases())
+
+
+def is_sharded(model):
+    return model in OWNER_FIELDS and is_enabled()
+
+
+def all_databases():
+    """Шарди або, без шардування, лише основна БД (для gather)."""
+    return aliases() or [DEFAULT_DB_ALIAS]
+
+
+def stub_databases():
+    """Шарди, яким потрібні заглушки auth_user (усі, крім основної БД)."""
+    return [alias for alias in aliases() if alias != DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def pinned(alias):
+    """Запити sharded-моделей без екземпляра в блоці йдуть на alias (None — без змін)."""
+    if alias is None:
+        yield
+        return
+    token = _pinned.set(alias)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def for_user(user_id):
+    return pinned(shard_for(user_id))
+
+
+@contextmanager
+def writing(alias):
+    """pinned(alias) + atomic() на шарді alias (атомарність з основною БД не гарантується)."""
+    with ExitStack() as stack:
+        if alias is not None and alias != DEFAULT_DB_ALIAS:
+            stack.enter_context(transaction.atomic(using=alias))
+        stack.enter_context(pinned(alias))
+        yield
+
+
+def _shared_cache():
+    return caches[getattr(settings, 'USER_CACHE', 'default')]
+
+
+def _generation():
+    return _shared_cache().get(GENERATION_KEY, 0)
+
+
+def _bump_generation():
+    _lru.clear()
+    cache = _shared_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def _cached(key, load):
+    generation = _generation()
+    cached = _lru.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    value = load()
+    if value is not None:
+        _lru.set(key, (generation, value))
+    return value
+
+
+def shard_for(user_id):
+    """Alias шарду користувача; None без шардування."""
+    if not is_enabled() or user_id is None:
+        return None
+    return _cached(('user', int(user_id)), lambda: (
+        UserShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('alias', flat=True).first()
+        or aliases()[0]
+    ))
+
+
+def home_shard(pk):
+    """Шард, на якому рядок з цим id був створений (за діапазоном id)."""
+    shards = aliases()
+    index = int(pk) >> SHARD_ID_BITS
+    return shards[index] if index < len(shards) else shards[0]
+
+
+def locate(model, pk):
+    """Alias шарду з рядком model.pk; None без шардування або для глобальних моделей."""
+    if not is_sharded(model) or pk is None:
+        return None
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    home = home_shard(pk)
+
+    def find():
+        for alias in [home] + [alias for alias in aliases() if alias != home]:
+            if model._base_manager.using(alias).filter(pk=pk).exists():
+                return alias
+        return None
+
+    return _cached((model._meta.label_lower, pk), find) or home
+
+
+def locate_many(model, pks):
+    """{alias: [pk, ...]} для наявних рядків (pk як передані); без шардування — {None: pks}."""
+    pks = list(pks)
+    if not is_sharded(model):
+        return {None: pks}
+    generation = _generation()
+    label = model._meta.label_lower
+    found = {}
+    missing = {}  # int(pk) -> pk
+    for pk in pks:
+        cached = _lru.get((label, int(pk)))
+        if cached is not None and cached[0] == generation:
+            found.setdefault(cached[1], []).append(pk)
+        else:
+            missing[int(pk)] = pk
+    if missing:
+        for alias, rows in zip(aliases(), gather(
+            lambda alias: list(model._base_manager.using(alias).filter(pk__in=list(missing)).values_list('pk', flat=True))
+        )):
+            for pk in rows:
+                _lru.set((label, pk), (generation, alias))
+                found.setdefault(alias, []).append(missing[pk])
+    return found
+
+
+def owner_alias(instance):
+    """Шард, на який треба записати екземпляр sharded-моделі; None без шардування."""
+    if not is_enabled():
+        return None
+    if OWNER_FIELDS[type(instance)] == 'user':
+        return shard_for(instance.user_id)
+    activity = instance._state.fields_cache.get('activity')
+    if activity is not None and not activity._state.adding and activity._state.db:
+        return activity._state.db
+    return locate(Activity, instance.activity_id)
+
+
+def _route(model, instance):
+    if model not in OWNER_FIELDS:
+        return DEFAULT_DB_ALIAS
+    saved = instance is not None and not instance._state.adding and instance._state.db
+    if saved and type(instance) in OWNER_FIELDS:
+        # Рядок (або батьківська активність для activity.points / comments) уже на своєму шарді
+        return instance._state.db
+    alias = _pinned.get()
+    if alias is not None:
+        return alias
+    if isinstance(instance, model):
+        return owner_alias(instance)
+    if isinstance(instance, User) and OWNER_FIELDS[model] == 'user':
+        return shard_for(instance.pk)
+    return None
+
+
+class ShardRouter:
+    """Роутер БД для SHARD_DATABASES; без шардування нічого не вирішує."""
+
+    def db_for_read(self, model, **hints):
+        return _route(model, hints.get('instance')) if is_enabled() else None
+
+    def db_for_write(self, model, **hints):
+        return _route(model, hints.get('instance')) if is_enabled() else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Зв'язок з User з основної БД тримає заглушка auth_user на шарді, а шард
+        # нового рядка визначає його власник у момент запису, а не _state.db
+        return True if is_enabled() else None
+
+
+def gather(query, databases=None):
+    """[query(alias), ...] для всіх шардів; запити йдуть паралельно в окремих потоках."""
+    databases = list(databases or all_databases())
+    if len(databases) == 1:
+        return [query(databases[0])]
+
+    def run(alias):
+        try:
+            return query(alias)
+        finally:
+            # У потоці пулу — власні з'єднання, закриваємо їх одразу
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(databases)) as pool:
+        return list(pool.map(run, databases))
+
+
+def scatter(queryset, key=None, reverse=False):
+    """
+    QuerySet sharded-моделі з усіх шардів одним списком (відсортованим за key,
+    якщо задано); без шардування — сам QuerySet.
+    """
+    if not is_sharded(queryset.model):
+        return queryset
+    rows = [row for rows in gather(lambda alias: list(queryset.using(alias))) for row in rows]
+    return sorted(rows, key=key, reverse=reverse) if key else rows
+
+
+def group_by_shard(instances):
+    """{alias: [екземпляри]} за шардом власника; без шардування — {None: instances}."""
+    groups = {}
+    for instance in instances:
+        alias = owner_alias(instance) if type(instance) in OWNER_FIELDS else None
+        groups.setdefault(alias, []).append(instance)
+    return groups
+
+
+def ensure_stubs(user_ids, databases=None):
+    """Заглушки auth_user (лише id) на шардах, щоб FK на користувача проходили."""
+    user_ids = list(user_ids)
+    for alias in databases or stub_databases():
+        for offset in range(0, len(user_ids), BATCH_SIZE):
+            User.objects.using(alias).bulk_create([
+                User(id=user_id, username=f"shard-stub-{user_id}", password='!')
+                for user_id in user_ids[offset:offset + BATCH_SIZE]
+            ], ignore_conflicts=True)
+
+
+def assign(user_id):
+    """Закріплює нового користувача за найменш заповненим (за кількістю користувачів) шардом."""
+    loads = Counter(dict.fromkeys(aliases(), 0))
+    loads.update(dict(UserShard.objects.using(DEFAULT_DB_ALIAS).values('alias').annotate(
+        users=Count('user_id')
+    ).values_list('alias', 'users')))
+    alias = min(aliases(), key=lambda name: loads[name])
+    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(user_id=user_id, defaults={'alias': alias})
+    _lru.set(('user', user_id), (_generation(), alias))
+    return alias
+
+
+def purge_user(user_id):
+    """
+    Видаляє дані видаленого користувача з усіх шардів (з сигналами, як
+    каскад в одній БД) і його заглушки.
+    """
+    for alias in aliases():
+        for model in (Comment, Kudos, Activity, UserMonthlyStats):
+            model.objects.using(alias).filter(user_id=user_id).delete()
+        if alias != DEFAULT_DB_ALIAS:
+            User.objects.using(alias).filter(id=user_id)._raw_delete(alias)
+    _lru.pop(('user', user_id))
+
+
+def init_shard(alias):
+    """Зсуває лічильники id sharded-таблиць на alias до початку його діапазону і створює заглушки."""
+    index = aliases().index(alias)
+    connection = connections[alias]
+    start = index << SHARD_ID_BITS
+    if start:
+        with connection.cursor() as cursor:
+            for model in (Activity, ActivityPoint, Comment, Kudos, UserMonthlyStats):
+                table = model._meta.db_table
+                if connection.vendor == 'postgresql':
+                    cursor.execute(
+                        f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                        f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                        [table, start],
+                    )
+                else:
+                    cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s", [start, table])
+                    if not cursor.rowcount:
+                        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start])
+    if alias != DEFAULT_DB_ALIAS:
+        ensure_stubs(User.objects.using(DEFAULT_DB_ALIAS).values_list('id', flat=True).iterator(chunk_size=BATCH_SIZE),
+                     [alias])
+
+
+def _owned(model, alias, user_id):
+    qs = model._base_manager.using(alias)
+    if OWNER_FIELDS[model] == 'user':
+        return qs.filter(user_id=user_id)
+    return qs.filter(activity__user_id=user_id)
+
+
+def _purge(alias, user_id):
+    # Без сигналів: дані не зникають, а переїжджають
+    for model in reversed(MOVE_ORDER):
+        _owned(model, alias, user_id)._raw_delete(alias)
+
+
+def move_user(user_id, target):
+    """
+    Переносить дані користувача на шард target (id рядків зберігаються) і
+    перемикає карту. Записи користувача під час переносу можуть загубитися,
+    тож переносити варто неактивних зараз користувачів. Повертає кількість рядків.
+    """
+    source = shard_for(user_id)
+    if source == target:
+        return 0
+    # Автори коментарів / kudos на активностях користувача теж мають бути на target
+    ensure_stubs(
+        set(_owned(Comment, source, user_id).values_list('user_id', flat=True))
+        | set(_owned(Kudos, source, user_id).values_list('user_id', flat=True))
+        | {user_id},
+        [alias for alias in [target] if alias != DEFAULT_DB_ALIAS],
+    )
+    moved = 0
+    with transaction.atomic(using=target):
+        _purge(target, user_id)  # залишки перерваного переносу
+        for model in MOVE_ORDER:
+            batch = []
+            for instance in _owned(model, source, user_id).iterator(chunk_size=BATCH_SIZE):
+                instance._state.adding, instance._state.db = True, None
+                batch.append(instance)
+                if len(batch) >= BATCH_SIZE:
+                    moved += len(model._base_manager.using(target).bulk_create(batch))
+                    batch = []
+            moved += len(model._base_manager.using(target).bulk_create(batch))
+    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(user_id=user_id, defaults={'alias': target})
+    _bump_generation()
+    with transaction.atomic(using=source):
+        _purge(source, user_id)
+    return moved
+
+
+def shard_loads():
+    """{alias: Counter(user_id -> кількість активностей)}."""
+    return dict(zip(all_databases(), gather(lambda alias: Counter(dict(
+        Activity.objects.using(alias).values('user_id').annotate(activities=Count('id')).order_by()
+        .values_list('user_id', 'activities')
+    )))))
+
+
+def rebalance_plan(tolerance=0.1, loads=None):
+    """
+    [(user_id, з шарду, на шард, активностей), ...]: користувачі з найзавантаженішого
+    шарду переносяться на найменш завантажений, поки різниця більша за tolerance
+    від середнього навантаження.
+    """
+    loads = {alias: Counter(users) for alias, users in (loads or shard_loads()).items()}
+    totals = {alias: sum(users.values()) for alias, users in loads.items()}
+    if len(totals) < 2:
+        return []
+    mean = sum(totals.values()) / len(totals)
+    moves = []
+    while True:
+        heavy = max(totals, key=totals.get)
+        light = min(totals, key=totals.get)
+        gap = totals[heavy] - totals[light]
+        if gap <= tolerance * mean:
+            return moves
+        # Найбільший користувач, перенос якого зменшує розрив
+        fitting = [(count, user_id) for user_id, count in loads[heavy].items() if 0 < count < gap]
+        if not fitting:
+            return moves
+        count, user_id = max(fitting, key=lambda item: (min(item[0], gap - item[0]), item[0]))
+        del loads[heavy][user_id]
+        loads[light][user_id] = count
+        totals[heavy] -= count
+        totals[light] += count
+        moves.append((user_id, heavy, light, count))
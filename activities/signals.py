@@ -0,0 +1,200 @@
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    Activity, Profile, Comment, Kudos, Follower, ActivityPoint, UserMonthlyStats, ArchivedTrack
+)
+from .conditional import bump_version
+from . import (
+    dedup, follow_graph, heatmap, identity_map, leaderboards, outbox, search, sharding, sketches, summaries, track_archive,
+)
+
+# Моделі, для яких ведемо лічильник версій (ETag / Last-Modified)
+VERSIONED_MODELS = (
+    User, Profile, Activity, Comment, Kudos, Follower, ActivityPoint, UserMonthlyStats
+)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_data_version(sender, **kwargs):
+    if sender in VERSIONED_MODELS:
+        bump_version(sender)
+
+
+@receiver(post_save)
+def outbox_on_save(sender, instance, created, **kwargs):
+    if sender in outbox.PAYLOAD_FIELDS:
+        outbox.emit_instance(instance, 'created' if created else 'updated')
+
+
+@receiver(post_delete)
+def outbox_on_delete(sender, instance, **kwargs):
+    if sender in outbox.PAYLOAD_FIELDS:
+        outbox.emit_instance(instance, 'deleted')
+
+
+@receiver(post_save, sender=Activity)
+def summary_on_activity_save(sender, instance, created, **kwargs):
+    if created:
+        summaries.apply_delta(
+            instance.user_id,
+            activities_count=1,
+            total_distance_m=instance.distance_m,
+            total_duration_sec=instance.duration_sec,
+        )
+    else:
+        summaries.rebuild_summary(instance.user_id)
+
+
+@receiver(post_save, sender=Activity)
+def sketches_on_activity_save(sender, instance, created, **kwargs):
+    if created:
+        sketches.record_activity(instance)
+    else:
+        sketches.mark_stale()
+
+
+@receiver(post_delete, sender=Activity)
+def sketches_on_activity_delete(sender, instance, **kwargs):
+    sketches.mark_stale()
+
+
+@receiver(post_save, sender=Activity)
+def leaderboards_on_activity_save(sender, instance, created, **kwargs):
+    if created:
+        leaderboards.record_activity(instance)
+    else:
+        leaderboards.invalidate()
+
+
+@receiver(post_delete, sender=Activity)
+def leaderboards_on_activity_delete(sender, instance, **kwargs):
+    leaderboards.record_activity(instance, sign=-1)
+
+
+@receiver(post_delete, sender=Activity)
+def summary_on_activity_delete(sender, instance, **kwargs):
+    summaries.apply_delta(
+        instance.user_id,
+        activities_count=-1,
+        total_distance_m=-instance.distance_m,
+        total_duration_sec=-instance.duration_sec,
+    )
+
+
+def _activity_owner_id(kudos):
+    # Kudos лежить на тому ж шарді, що й активність
+    return Activity.objects.using(kudos._state.db).filter(id=kudos.activity_id).values_list('user_id', flat=True).first()
+
+
+@receiver(post_save, sender=Kudos)
+def summary_on_kudos_save(sender, instance, created, **kwargs):
+    if created:
+        summaries.apply_delta(_activity_owner_id(instance), kudos_received=1)
+
+
+@receiver(post_delete, sender=Kudos)
+def summary_on_kudos_delete(sender, instance, **kwargs):
+    summaries.apply_delta(_activity_owner_id(instance), kudos_received=-1)
+
+
+@receiver(post_save, sender=Follower)
+def summary_on_follow(sender, instance, created, **kwargs):
+    if created:
+        summaries.apply_delta(instance.followee_id, followers_count=1)
+        summaries.apply_delta(instance.follower_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follower)
+def summary_on_unfollow(sender, instance, **kwargs):
+    summaries.apply_delta(instance.followee_id, followers_count=-1)
+    summaries.apply_delta(instance.follower_id, following_count=-1)
+
+
+@receiver(post_save, sender=Follower)
+def graph_on_follow(sender, instance, created, **kwargs):
+    if created:
+        follow_graph.record_follows([(instance.follower_id, instance.followee_id)])
+
+
+@receiver(post_delete, sender=Follower)
+def graph_on_unfollow(sender, instance, **kwargs):
+    follow_graph.record_unfollows([(instance.follower_id, instance.followee_id)])
+
+
+@receiver(post_delete, sender=ArchivedTrack)
+def remove_archived_track_file(sender, instance, **kwargs):
+    # І після rehydrate, і при каскадному видаленні активності
+    path = instance.path
+    transaction.on_commit(lambda: track_archive.remove_file(path))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def search_on_comment_change(sender, instance, **kwargs):
+    search.refresh('comments', instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def search_on_profile_change(sender, instance, **kwargs):
+    search.refresh('profiles', instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def identity_map_on_user_change(sender, instance, **kwargs):
+    identity_map.invalidate(User, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def summary_on_user_create(sender, instance, created, **kwargs):
+    if created:
+        summaries.create_empty(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def shard_on_user_create(sender, instance, created, using=None, **kwargs):
+    # Заглушки на шардах пишуться bulk_create і сюди не потрапляють
+    if created and using == DEFAULT_DB_ALIAS and sharding.is_enabled():
+        sharding.assign(instance.pk)
+        sharding.ensure_stubs([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def shard_on_user_delete(sender, instance, using=None, **kwargs):
+    if using == DEFAULT_DB_ALIAS and sharding.is_enabled():
+        sharding.purge_user(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def identity_map_on_profile_change(sender, instance, **kwargs):
+    identity_map.invalidate(Profile, instance.user_id)
+
+
+@receiver(post_delete, sender=Activity)
+def heatmap_on_activity_delete(sender, instance, **kwargs):
+    heatmap.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=ActivityPoint)
+def heatmap_on_point_save(sender, instance, created, **kwargs):
+    # Нові точки карта дочитує сама (за id), зміна координат потребує перебудови
+    if not created:
+        heatmap.invalidate_activities([instance.activity_id])
+
+
+@receiver(post_delete, sender=ActivityPoint)
+def heatmap_on_point_delete(sender, instance, origin=None, **kwargs):
+    # Каскад від видалення активності обробляє heatmap_on_activity_delete
+    if not isinstance(origin, Activity):
+        heatmap.invalidate_activities([instance.activity_id])
+
+
+@receiver(post_save, sender=Activity)
+def fingerprint_on_activity_save(sender, instance, **kwargs):
+    dedup.record(instance)
@@ -0,0 +1,315 @@
+"""
+Наближена аналітика на злиттєвих скетчах.
+
+HyperLogLog рахує унікальних активних користувачів, KLL — квантилі
+distance/duration. Для кожної пари (місяць, activity_type) зберігається
+по одному скетчу кожного виду (модель AnalyticsSketch). Скетчі
+оновлюються при створенні активності, а під час запиту зливаються за
+потрібний проміжок місяців і типів. Разом із результатом повертаються
+межі похибки.
+
+Нові активності пачки складаються в скетч-дельту в пам'яті, а в рядки
+AnalyticsSketch зливаються після коміту транзакції запису, в короткій
+власній транзакції: паралельні завантаження одного типу не чекають на
+блокування рядка скетча до кінця чужої транзакції. Якщо процес упав між
+комітом і злиттям, активність у скетчі не потрапить до rebuild_sketches.
+
+Скетчі лише накопичують значення. Зміна або видалення активності в них
+не відображається: тоді маркер STALE_MARKER (рядок DataVersion) фіксує
+момент, з якого результати неточні понад заявлені межі похибки
+(stale_since у відповіді), аж до manage.py rebuild_sketches.
+"""
+import hashlib
+import math
+import random
+import struct
+from array import array
+from datetime import date
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import sharding
+from .conditional import bump_version
+from .models import Activity, AnalyticsSketch, DataVersion
+
+ACTIVE_USERS = AnalyticsSketch.ACTIVE_USERS
+DISTANCE = AnalyticsSketch.DISTANCE
+DURATION = AnalyticsSketch.DURATION
+QUANTILE_KINDS = (DISTANCE, DURATION)
+# version > 0 — з updated_at активності змінювалися / видалялися без відображення в скетчах
+STALE_MARKER = 'activities.analyticssketch:stale'
+
+
+class HyperLogLog:
+    """HyperLogLog з 2**p однобайтними регістрами; відносна похибка ≈ 1.04 / sqrt(2**p)."""
+
+    def __init__(self, p=12, registers=None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    def add(self, value):
+        x = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision.")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * self.m and zeros:
+            # Поправка для малих кардинальностей (linear counting)
+            return self.m * math.log(self.m / zeros)
+        return raw
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.m)
+
+    def to_bytes(self):
+        return bytes([self.p]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)  # PostgreSQL повертає BinaryField як memoryview
+        return cls(p=data[0], registers=data[1:])
+
+
+class KLLSketch:
+    """
+    KLL-скетч квантилів (Karnin, Lang, Liberty). Рівень h зберігає елементи
+    з вагою 2**h; коли рівень переповнюється, він сортується і кожен другий
+    елемент переходить на рівень вище.
+    """
+
+    def __init__(self, k=200):
+        self.k = k
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.levels = [[]]
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _size(self):
+        return sum(len(items) for items in self.levels)
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def _compress(self):
+        while self._size() >= self._max_size():
+            for level, items in enumerate(self.levels):
+                if len(items) >= self._capacity(level):
+                    if level + 1 == len(self.levels):
+                        self.levels.append([])
+                    items.sort()
+                    leftover = [items.pop()] if len(items) % 2 else []
+                    self.levels[level + 1].extend(items[random.getrandbits(1)::2])
+                    self.levels[level] = leftover
+                    break
+
+    def add(self, value):
+        value = float(value)
+        self.n += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.levels[0].append(value)
+        self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        if not self.n:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        weighted = sorted(
+            (value, 1 << level) for level, items in enumerate(self.levels) for value in items
+        )
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return self.max
+
+    @property
+    def rank_error(self):
+        # Емпірична оцінка нормованої похибки рангу (99% довіри) з Apache DataSketches
+        return 2.296 / self.k ** 0.9723
+
+    def to_bytes(self):
+        parts = [struct.pack('<HQddH', self.k, self.n, self.min, self.max, len(self.levels))]
+        for items in self.levels:
+            parts.append(struct.pack('<I', len(items)))
+            parts.append(array('d', items).tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        k, n, low, high, level_count = struct.unpack_from('<HQddH', data)
+        sketch = cls(k)
+        sketch.n, sketch.min, sketch.max = n, low, high
+        sketch.levels = []
+        offset = struct.calcsize('<HQddH')
+        for _ in range(level_count):
+            (size,) = struct.unpack_from('<I', data, offset)
+            offset += 4
+            sketch.levels.append(array('d', data[offset:offset + 8 * size]).tolist())
+            offset += 8 * size
+        return sketch
+
+
+SKETCH_CLASSES = {ACTIVE_USERS: HyperLogLog, DISTANCE: KLLSketch, DURATION: KLLSketch}
+
+
+def _bucket(value):
+    return date(value.year, value.month, 1)
+
+
+def _activity_values(user_id, distance_m, duration_sec):
+    return {ACTIVE_USERS: user_id, DISTANCE: distance_m, DURATION: duration_sec}
+
+
+def record_activity(activity):
+    """Додає нову активність у скетчі її місяця та типу."""
+    record_activities([activity])
+
+
+def record_activities(activities):
+    """Як record_activity для пачки: дельта зливається в скетчі після коміту транзакції запису."""
+    deltas = {}  # (kind, bucket, activity_type) -> [скетч пачки, кількість]
+    for activity in activities:
+        if activity.start_time is None:
+            continue
+        bucket = _bucket(activity.start_time)
+        for kind, value in _activity_values(activity.user_id, activity.distance_m, activity.duration_sec).items():
+            delta = deltas.setdefault((kind, bucket, activity.activity_type), [SKETCH_CLASSES[kind](), 0])
+            delta[0].add(value)
+            delta[1] += 1
+    if deltas:
+        # Коміт потрібен саме тієї БД (шарду), куди записані активності
+        transaction.on_commit(lambda: _merge(deltas), using=activities[0]._state.db)
+
+
+def _merge(deltas):
+    with transaction.atomic():
+        # Однаковий порядок блокувань у всіх процесах — без взаємних блокувань
+        for (kind, bucket, dimension), (delta, count) in sorted(deltas.items(), key=lambda item: item[0]):
+            row, _ = AnalyticsSketch.objects.select_for_update().get_or_create(
+                kind=kind, bucket=bucket, dimension=dimension,
+                defaults={'data': SKETCH_CLASSES[kind]().to_bytes()},
+            )
+            row.data = SKETCH_CLASSES[kind].from_bytes(row.data).merge(delta).to_bytes()
+            row.item_count += count
+            row.save(update_fields=['data', 'item_count', 'updated_at'])
+        bump_version(AnalyticsSketch)
+
+
+def mark_stale():
+    """Активність змінено чи видалено: скетчі цього не відображають до rebuild_all."""
+    transaction.on_commit(_mark_stale)
+
+
+def _mark_stale():
+    # Оновлює рядок лише перша зміна після перебудови, решта UPDATE нічого не знаходять і не блокують
+    if not DataVersion.objects.filter(name=STALE_MARKER, version=0).update(version=1, updated_at=timezone.now()):
+        DataVersion.objects.get_or_create(name=STALE_MARKER, defaults={'version': 1})
+    bump_version(AnalyticsSketch)
+
+
+def stale_since():
+    """Момент першої зміни / видалення активності після останньої перебудови або None."""
+    return DataVersion.objects.filter(name=STALE_MARKER, version__gt=0).values_list('updated_at', flat=True).first()
+
+
+def _build(alias):
+    built = {}
+    activities = Activity.objects.using(alias).filter(start_time__isnull=False).values_list(
+        'start_time', 'activity_type', 'user_id', 'distance_m', 'duration_sec'
+    )
+    for start_time, activity_type, user_id, distance_m, duration_sec in activities.iterator(chunk_size=5000):
+        bucket = _bucket(start_time)
+        for kind, value in _activity_values(user_id, distance_m, duration_sec).items():
+            key = (kind, bucket, activity_type)
+            if key not in built:
+                built[key] = [SKETCH_CLASSES[kind](), 0]
+            built[key][0].add(value)
+            built[key][1] += 1
+    return built
+
+
+def rebuild_all():
+    """Перебудовує всі скетчі з таблиці Activity. Повертає кількість рядків AnalyticsSketch."""
+    built = {}
+    # З шардуванням кожен шард будує свої скетчі паралельно, у default вони зливаються
+    for shard_built in sharding.gather(_build):
+        for key, (sketch, count) in shard_built.items():
+            if key in built:
+                built[key][0].merge(sketch)
+                built[key][1] += count
+            else:
+                built[key] = [sketch, count]
+
+    with transaction.atomic():
+        DataVersion.objects.update_or_create(name=STALE_MARKER, defaults={'version': 0})
+        AnalyticsSketch.objects.all().delete()
+        AnalyticsSketch.objects.bulk_create(
+            [
+                AnalyticsSketch(kind=kind, bucket=bucket, dimension=dimension,
+                                data=sketch.to_bytes(), item_count=count)
+                for (kind, bucket, dimension), (sketch, count) in built.items()
+            ],
+            batch_size=1000,
+        )
+        bump_version(AnalyticsSketch)
+    return len(built)
+
+
+def load_sketches(kind, since=None, until=None, activity_type=None):
+    """[(bucket, activity_type, sketch), ...]; since/until (datetime) округлюються до місяців."""
+    qs = AnalyticsSketch.objects.filter(kind=kind)
+    if since:
+        qs = qs.filter(bucket__gte=_bucket(since))
+    if until:
+        qs = qs.filter(bucket__lt=until.date())
+    if activity_type:
+        qs = qs.filter(dimension=activity_type)
+    return [
+        (bucket, dimension, SKETCH_CLASSES[kind].from_bytes(data))
+        for bucket, dimension, data in qs.order_by('bucket').values_list('bucket', 'dimension', 'data')
+    ]
+
+
+def merge_all(kind, sketches):
+    merged = SKETCH_CLASSES[kind]()
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
@@ -0,0 +1,244 @@
+"""
+Підсумки користувача (UserSummary) для сторінки профілю.
+
+Рядок UserSummary оновлюється інкрементально (F-вирази) при записах
+Activity / Follower / Kudos. Читання йде через обмежений LRU-кеш у процесі;
+щоб інші воркери не віддавали застарілі дані, кожен запис збільшує
+"покоління" користувача у спільному кеші Django (settings.USER_SUMMARY_CACHE,
+у production — Redis/Memcached), а локальний запис вважається валідним лише
+поки його покоління збігається зі спільним. Якщо кеш не спільний (LocMem —
+кеш за замовчуванням), LRU у процесі не використовується і підсумки щоразу
+читаються з БД.
+
+Рядок UserSummary створюється разом з користувачем. Для користувачів без
+рядка (напр. завантажених bulkload) GET рахує підсумки лише читанням, а
+запис рядка ставиться в чергу фонового потоку процесу.
+"""
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Sum, F
+
+from . import metrics, sharding
+from .caching import LRUCache, is_shared
+from .conditional import bump_version
+from .models import Activity, Follower, Kudos, UserSummary
+
+SUMMARY_FIELDS = (
+    'activities_count',
+    'total_distance_m',
+    'total_duration_sec',
+    'followers_count',
+    'following_count',
+    'kudos_received',
+)
+
+logger = logging.getLogger(__name__)
+
+_local_cache = LRUCache(getattr(settings, 'USER_SUMMARY_CACHE_SIZE', 10000))
+_rebuild_queue = queue.SimpleQueue()
+_worker_lock = threading.Lock()
+_worker = None
+
+
+def _cache_alias():
+    return getattr(settings, 'USER_SUMMARY_CACHE', 'default')
+
+
+def _shared_cache():
+    return caches[_cache_alias()]
+
+
+def _generation_key(user_id):
+    return f"user-summary-gen:{user_id}"
+
+
+def invalidate(user_id):
+    """Скидає кеш підсумків користувача в усіх воркерах."""
+    _local_cache.pop(user_id)
+    cache = _shared_cache()
+    key = _generation_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_summary(user_id):
+    """Повертає підсумки користувача як dict (з кешу, якщо він актуальний)."""
+    return get_summaries([user_id])[user_id]
+
+
+def get_summaries(user_ids):
+    """{user_id: dict} для сторінки профілів: один запит до кешу і один до UserSummary."""
+    user_ids = list(dict.fromkeys(user_ids))
+    use_local = is_shared(_cache_alias())
+    result, generations = {}, {}
+    if use_local:
+        stored = _shared_cache().get_many([_generation_key(user_id) for user_id in user_ids])
+        for user_id in user_ids:
+            generations[user_id] = stored.get(_generation_key(user_id), 0)
+            cached = _local_cache.get(user_id)
+            if cached is not None and cached[0] == generations[user_id]:
+                result[user_id] = cached[1]
+    hits = len(result)
+    if hits:
+        metrics.inc('cache_requests_total', hits, cache='user_summary', result='hit')
+    missing = [user_id for user_id in user_ids if user_id not in result]
+    if not missing:
+        return result
+    metrics.inc('cache_requests_total', len(missing), cache='user_summary', result='miss')
+
+    for row in UserSummary.objects.filter(user_id__in=missing).values('user_id', *SUMMARY_FIELDS):
+        result[row.pop('user_id')] = row
+    without_row = [user_id for user_id in missing if user_id not in result]
+    if without_row:
+        # GET не пише в БД: рахуємо читанням, а рядки запише фоновий потік
+        computed = compute_all_summaries(user_ids=without_row)
+        for user_id in without_row:
+            result[user_id] = computed.get(user_id, dict.fromkeys(SUMMARY_FIELDS, 0))
+        queue_rebuild(without_row)
+    if use_local:
+        for user_id in missing:
+            if user_id not in without_row:
+                _local_cache.set(user_id, (generations[user_id], result[user_id]))
+    return result
+
+
+def queue_rebuild(user_ids):
+    """Ставить запис UserSummary цих користувачів у чергу фонового потоку процесу."""
+    global _worker
+    for user_id in user_ids:
+        _rebuild_queue.put(user_id)
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_rebuilds, name='user-summary-rebuild', daemon=True)
+            _worker.start()
+
+
+def rebuild_queued():
+    """Будує рядки для всіх користувачів з черги. Повертає їх кількість."""
+    return _rebuild(_drain())
+
+
+def _drain():
+    user_ids = set()
+    while True:
+        try:
+            user_ids.add(_rebuild_queue.get_nowait())
+        except queue.Empty:
+            return user_ids
+
+
+def _rebuild(user_ids):
+    for user_id in user_ids:
+        # Рядок міг з'явитися, поки користувач чекав у черзі
+        if not UserSummary.objects.filter(user_id=user_id).exists():
+            rebuild_summary(user_id)
+    return len(user_ids)
+
+
+def _run_rebuilds():
+    while True:
+        user_ids = {_rebuild_queue.get()} | _drain()
+        close_old_connections()
+        try:
+            _rebuild(user_ids)
+        except Exception:
+            logger.exception("User summary rebuild failed")
+        finally:
+            close_old_connections()
+
+
+def compute_summary(user_id):
+    """Рахує підсумки користувача "з нуля" агрегатними запитами."""
+    # Активності користувача і kudos на них лежать на його шарді
+    shard = sharding.shard_for(user_id)
+    activities = Activity.objects.using(shard).filter(user_id=user_id).aggregate(
+        activities_count=Count('id'),
+        total_distance_m=Sum('distance_m'),
+        total_duration_sec=Sum('duration_sec'),
+    )
+    return {
+        'activities_count': activities['activities_count'],
+        'total_distance_m': activities['total_distance_m'] or 0.0,
+        'total_duration_sec': activities['total_duration_sec'] or 0.0,
+        'followers_count': Follower.objects.filter(followee_id=user_id).count(),
+        'following_count': Follower.objects.filter(follower_id=user_id).count(),
+        'kudos_received': Kudos.objects.using(shard).filter(activity__user_id=user_id).count(),
+    }
+
+
+def compute_all_summaries(user_range=None, user_ids=None):
+    """
+    Рахує підсумки всіх користувачів кількома згрупованими запитами: {user_id: dict}.
+    user_range=(start, end) обмежує user_id напівінтервалом [start, end), user_ids — списком.
+    """
+    result = {}
+
+    def row(user_id):
+        return result.setdefault(user_id, dict.fromkeys(SUMMARY_FIELDS, 0))
+
+    def in_range(queryset, field):
+        if user_ids is not None:
+            queryset = queryset.filter(**{f'{field}__in': user_ids})
+        if user_range is None:
+            return queryset
+        return queryset.filter(**{f'{field}__gte': user_range[0], f'{field}__lt': user_range[1]})
+
+    # З шардуванням — рядки всіх шардів, тож суми накопичуються
+    activities = in_range(Activity.objects, 'user_id').values('user_id').annotate(
+        count=Count('id'), distance=Sum('distance_m'), duration=Sum('duration_sec')
+    ).order_by()
+    for item in sharding.scatter(activities):
+        data = row(item['user_id'])
+        data['activities_count'] += item['count']
+        data['total_distance_m'] += item['distance'] or 0.0
+        data['total_duration_sec'] += item['duration'] or 0.0
+
+    followers = in_range(Follower.objects, 'followee_id').values_list('followee_id')
+    for user_id, count in followers.annotate(c=Count('id')).order_by():
+        row(user_id)['followers_count'] = count
+    following = in_range(Follower.objects, 'follower_id').values_list('follower_id')
+    for user_id, count in following.annotate(c=Count('id')).order_by():
+        row(user_id)['following_count'] = count
+    kudos = in_range(Kudos.objects, 'activity__user_id').values_list('activity__user_id')
+    for user_id, count in sharding.scatter(kudos.annotate(c=Count('id')).order_by()):
+        row(user_id)['kudos_received'] += count
+    return result
+
+
+def rebuild_summary(user_id):
+    data = compute_summary(user_id)
+    UserSummary.objects.update_or_create(user_id=user_id, defaults=data)
+    _after_write(user_id)
+    return data
+
+
+def create_empty(user_id):
+    """Нульовий рядок для нового користувача, щоб дельти застосовувалися з першого запису."""
+    UserSummary.objects.get_or_create(user_id=user_id)
+
+
+def apply_delta(user_id, **deltas):
+    """
+    Інкрементально змінює поля підсумків, напр. apply_delta(5, activities_count=1).
+    Якщо рядка ще немає, нічого не робимо: його порахує get_summaries() і запише черга.
+    """
+    if user_id is None:
+        return
+    updated = UserSummary.objects.filter(user_id=user_id).update(
+        **{field: F(field) + value for field, value in deltas.items()}
+    )
+    if updated:
+        _after_write(user_id)
+
+
+def _after_write(user_id):
+    bump_version(UserSummary)
+    # Інвалідація після коміту, щоб інші воркери не закешували старий рядок
+    transaction.on_commit(lambda: invalidate(user_id))
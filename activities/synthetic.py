@@ -0,0 +1,321 @@
+"""
+Генерація синтетичних даних (користувачі, профілі, граф підписок,
+активності з GPS-треками, коментарі, kudos).
+
+Усі функції детерміновані: результат залежить лише від seed.
+Генератори повертають прості dict'и / кортежі, а не моделі, щоб їх
+можна було завантажувати як через bulk_create, так і через COPY.
+"""
+import bisect
+import itertools
+import math
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+# (lat, lon) міст, навколо яких "живуть" користувачі
+CITIES = [
+    ('Kyiv', 'Ukraine', 50.4501, 30.5234),
+    ('Lviv', 'Ukraine', 49.8397, 24.0297),
+    ('Odesa', 'Ukraine', 46.4825, 30.7233),
+    ('Kharkiv', 'Ukraine', 49.9935, 36.2304),
+    ('Warsaw', 'Poland', 52.2297, 21.0122),
+    ('Berlin', 'Germany', 52.5200, 13.4050),
+]
+
+# activity_type: (частка, середня швидкість м/с, чи є GPS-трек)
+ACTIVITY_PROFILES = {
+    'running': (0.35, 2.9, True),
+    'cycling': (0.25, 7.0, True),
+    'walking': (0.15, 1.4, True),
+    'hiking': (0.07, 1.1, True),
+    'swimming': (0.05, 0.7, False),
+    'yoga': (0.04, 0.0, False),
+    'gym': (0.05, 0.0, False),
+    'crossfit': (0.02, 0.0, False),
+    'other': (0.02, 1.0, False),
+}
+
+EARTH_RADIUS_M = 6371000.0
+
+COMMENT_WORDS = (
+    "great run nice pace well done strong finish tough climb beautiful route "
+    "keep going awesome ride recovery day new record windy hot cold rain"
+).split()
+
+
+def rng_for(seed, *parts):
+    """Окремий детермінований генератор для кожного шматка роботи (зручно для пулу процесів)."""
+    return random.Random(":".join(str(part) for part in (seed,) + parts))
+
+
+def generate_users(rng, start_id, count):
+    for user_id in range(start_id, start_id + count):
+        city, country, _, _ = rng.choice(CITIES)
+        yield {
+            'id': user_id,
+            'username': f"user{user_id}",
+            'email': f"user{user_id}@example.com",
+            'profile': {
+                'display_name': f"User {user_id}",
+                'city': city,
+                'country': country,
+                'gender': rng.choice(('male', 'female', 'other', None)),
+                'weight_kg': round(max(35.0, rng.gauss(72, 12)), 1),
+                'height_cm': round(max(120.0, rng.gauss(174, 9)), 1),
+                'age': rng.randint(16, 70),
+                'bio': None,
+            },
+        }
+
+
+class PopularitySampler:
+    """
+    Вибір "кого фоловити" зі степеневим розподілом популярності:
+    популярність користувача ~ Zipf(exponent) за випадковим (але
+    детермінованим від seed) рангом. Однаковий у всіх процесах пулу.
+    """
+
+    def __init__(self, user_ids, exponent=2.1, seed=0):
+        self.user_ids = list(user_ids)
+        rng_for(seed, 'popularity').shuffle(self.user_ids)
+        self.cumulative = list(itertools.accumulate(
+            (rank + 1) ** (-1.0 / (exponent - 1)) for rank in range(len(self.user_ids))
+        ))
+        self.total = self.cumulative[-1] if self.cumulative else 0.0
+
+    def sample(self, rng):
+        index = bisect.bisect_left(self.cumulative, rng.random() * self.total)
+        return self.user_ids[min(index, len(self.user_ids) - 1)]
+
+    def followees(self, rng, follower_id, avg_degree):
+        degree = min(len(self.user_ids) - 1, max(0, int(rng.expovariate(1.0 / avg_degree))))
+        chosen = set()
+        attempts = 0
+        while len(chosen) < degree and attempts < degree * 4:
+            attempts += 1
+            followee_id = self.sample(rng)
+            if followee_id != follower_id:
+                chosen.add(followee_id)
+        return chosen
+
+
+def power_law_follows(rng, user_ids, avg_degree, exponent=2.1, seed=0):
+    """
+    Граф підписок зі степеневим розподілом вхідних степенів.
+    Повертає пари (follower_id, followee_id) без дублікатів і петель.
+    """
+    user_ids = list(user_ids)
+    if len(user_ids) < 2:
+        return
+    sampler = PopularitySampler(user_ids, exponent, seed)
+    for follower_id in user_ids:
+        for followee_id in sampler.followees(rng, follower_id, avg_degree):
+            yield follower_id, followee_id
+
+
+def pick_activity_type(rng):
+    roll = rng.random()
+    acc = 0.0
+    for activity_type, (share, _, _) in ACTIVITY_PROFILES.items():
+        acc += share
+        if roll <= acc:
+            return activity_type
+    return 'other'
+
+
+def generate_activity(rng, user_id, days_back=365, now=None):
+    """Одна активність без треку: dict з полями моделі Activity."""
+    now = now or datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+    activity_type = pick_activity_type(rng)
+    _, speed, _ = ACTIVITY_PROFILES[activity_type]
+    duration = max(300.0, rng.lognormvariate(math.log(2700), 0.5))
+    distance = max(0.0, duration * speed * rng.uniform(0.8, 1.2))
+    start = now - timedelta(days=rng.uniform(0, days_back), hours=rng.uniform(0, 12))
+    return {
+        'user_id': user_id,
+        'activity_type': activity_type,
+        'duration_sec': round(duration, 1),
+        'distance_m': round(distance, 1),
+        'elevation_gain_m': int(abs(rng.gauss(distance / 200, 20))),
+        'height': int(abs(rng.gauss(150, 80))),
+        'start_time': start,
+        'end_time': start + timedelta(seconds=duration),
+    }
+
+
+def generate_track(rng, activity, interval_sec=5, origin=None):
+    """
+    Реалістичний GPS-трек для активності: випадкове блукання з інерцією
+    напрямку, швидкістю навколо середньої для типу та плавною висотою.
+    Повертає список dict'ів з полями ActivityPoint (без activity_id).
+    """
+    _, speed, has_track = ACTIVITY_PROFILES[activity['activity_type']]
+    if not has_track or activity['duration_sec'] <= 0:
+        return []
+
+    if origin is None:
+        _, _, lat, lon = rng.choice(CITIES)
+        lat += rng.uniform(-0.05, 0.05)
+        lon += rng.uniform(-0.05, 0.05)
+    else:
+        lat, lon = origin
+
+    heading = rng.uniform(0, 2 * math.pi)
+    ele = rng.uniform(100, 300)
+    ele_trend = 0.0
+    points = []
+    steps = int(activity['duration_sec'] // interval_sec)
+    for step in range(steps):
+        heading += rng.gauss(0, 0.15)
+        current_speed = max(0.0, rng.gauss(speed, speed * 0.1))
+        step_m = current_speed * interval_sec
+        lat += math.degrees(step_m * math.cos(heading) / EARTH_RADIUS_M)
+        lon += math.degrees(step_m * math.sin(heading) / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+        ele_trend = 0.95 * ele_trend + rng.gauss(0, 0.2)
+        ele += ele_trend
+        points.append({
+            'lat': round(lat, 6),
+            'lon': round(lon, 6),
+            'recorded_at': activity['start_time'] + timedelta(seconds=step * interval_sec),
+            'ele': round(ele, 1),
+            'speed': round(current_speed, 2),
+            'cadence': int(rng.gauss(170, 8)) if activity['activity_type'] == 'running' else None,
+        })
+    return points
+
+
+def generate_comment_body(rng):
+    return " ".join(rng.choice(COMMENT_WORDS) for _ in range(rng.randint(2, 12))).capitalize()
+
+
+# ---------------------------------------------------------------------------
+# Генерація великими шматками (для пулу процесів у generate_data)
+# ---------------------------------------------------------------------------
+
+# Колонки таблиць у тому порядку, в якому generate_chunk() повертає рядки
+TABLE_COLUMNS = {
+    'user': ('id', 'password', 'is_superuser', 'username', 'first_name', 'last_name',
+             'email', 'is_staff', 'is_active', 'date_joined'),
+    'profile': ('user_id', 'display_name', 'city', 'country', 'gender',
+                'weight_kg', 'height_cm', 'age', 'bio', 'created_at'),
+    'follower': ('follower_id', 'followee_id', 'created_at'),
+    'activity': ('id', 'user_id', 'activity_type', 'duration_sec', 'distance_m',
+                 'elevation_gain_m', 'height', 'start_time', 'end_time'),
+    'point': ('activity_id', 'lat', 'lon', 'recorded_at', 'ele', 'speed', 'cadence'),
+    'comment': ('activity_id', 'user_id', 'body', 'created_at'),
+    'kudos': ('activity_id', 'user_id', 'created_at'),
+}
+
+BASE_TIME = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+_samplers = {}
+
+
+def activity_counts(task):
+    """Кількість активностей для кожного користувача шматка (детерміновано від seed)."""
+    rng = rng_for(task['seed'], 'activity-counts', task['chunk'])
+    mean = task['activities_per_user']
+    distribution = task['activity_distribution']
+    counts = []
+    for _ in range(task['user_count']):
+        if distribution == 'fixed':
+            counts.append(int(mean))
+        elif distribution == 'lognormal':
+            counts.append(int(rng.lognormvariate(math.log(max(mean, 1)), 1.0)))
+        else:
+            counts.append(int(rng.expovariate(1.0 / mean)) if mean > 0 else 0)
+    return counts
+
+
+def chunk_activity_total(task):
+    return sum(activity_counts(task))
+
+
+def _sampler(task):
+    key = (task['seed'], task['all_user_start'], task['all_user_count'])
+    if key not in _samplers:
+        _samplers.clear()
+        _samplers[key] = PopularitySampler(
+            range(task['all_user_start'], task['all_user_start'] + task['all_user_count']),
+            seed=task['seed'],
+        )
+    return _samplers[key]
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return str(value)
+
+
+def to_copy_text(rows):
+    """Рядки у текстовому форматі PostgreSQL COPY (табуляція, NULL = \\N)."""
+    return ''.join('\t'.join(_copy_value(value) for value in row) + '\n' for row in rows)
+
+
+def generate_chunk(task):
+    """
+    Генерує всі рядки для шматка користувачів [user_start, user_start + user_count).
+    Активності отримують id, починаючи з task['activity_id_base'].
+    Повертає {table: [tuple, ...]} або {table: текст для COPY} при task['format'] == 'copy'.
+    """
+    rng = rng_for(task['seed'], 'chunk', task['chunk'])
+    all_start, all_count = task['all_user_start'], task['all_user_count']
+    user_ids = range(task['user_start'], task['user_start'] + task['user_count'])
+    sampler = _sampler(task)
+    rows = {table: [] for table in TABLE_COLUMNS}
+
+    for user in generate_users(rng, task['user_start'], task['user_count']):
+        rows['user'].append((
+            user['id'], task['password'], False, user['username'], '', '',
+            user['email'], False, True, BASE_TIME,
+        ))
+        profile = user['profile']
+        rows['profile'].append((
+            user['id'], profile['display_name'], profile['city'], profile['country'],
+            profile['gender'], profile['weight_kg'], profile['height_cm'], profile['age'],
+            profile['bio'], BASE_TIME,
+        ))
+
+    if all_count > 1 and task['avg_follows'] > 0:
+        for follower_id in user_ids:
+            for followee_id in sampler.followees(rng, follower_id, task['avg_follows']):
+                rows['follower'].append((follower_id, followee_id, BASE_TIME))
+
+    activity_id = task['activity_id_base']
+    for user_id, count in zip(user_ids, activity_counts(task)):
+        for _ in range(count):
+            activity = generate_activity(rng, user_id, now=BASE_TIME)
+            rows['activity'].append((
+                activity_id, user_id, activity['activity_type'], activity['duration_sec'],
+                activity['distance_m'], activity['elevation_gain_m'], activity['height'],
+                activity['start_time'], activity['end_time'],
+            ))
+            if task['point_interval'] > 0:
+                for point in generate_track(rng, activity, task['point_interval']):
+                    rows['point'].append((
+                        activity_id, point['lat'], point['lon'], point['recorded_at'],
+                        point['ele'], point['speed'], point['cadence'],
+                    ))
+            if task['comments_per_activity'] > 0:
+                for _ in range(int(rng.expovariate(1.0 / task['comments_per_activity']))):
+                    rows['comment'].append((
+                        activity_id, rng.randrange(all_start, all_start + all_count),
+                        generate_comment_body(rng), activity['end_time'],
+                    ))
+            if task['kudos_per_activity'] > 0:
+                givers = {
+                    sampler.sample(rng)
+                    for _ in range(int(rng.expovariate(1.0 / task['kudos_per_activity'])))
+                }
+                for giver_id in givers:
+                    rows['kudos'].append((activity_id, giver_id, activity['end_time']))
+            activity_id += 1
+
+    if task['format'] == 'copy':
+        return {table: to_copy_text(table_rows) for table, table_rows in rows.items()}
+    return rows
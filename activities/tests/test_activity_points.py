@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+
+class ActivityPointListTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_points_outside_activity_window_are_listed(self):
+        start = timezone.now().replace(microsecond=0) - timedelta(days=3)
+        points = [
+            {'lat': 50.0, 'lon': 30.0, 'recorded_at': (start - timedelta(minutes=5)).isoformat()},
+            {'lat': 50.1, 'lon': 30.1, 'recorded_at': (start + timedelta(minutes=5)).isoformat()},
+            {'lat': 50.2, 'lon': 30.2, 'recorded_at': (start + timedelta(hours=2)).isoformat()},
+        ]
+        response = self.client.post('/api/activities/upload/', {
+            'activity_type': 'running', 'duration_sec': 1800, 'distance_m': 5000, 'elevation_gain_m': 0,
+            'height': 0, 'start_time': start.isoformat(), 'end_time': (start + timedelta(minutes=30)).isoformat(),
+            'points': points,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        listed = self.client.get(f"/api/activity-points/?activity={response.data['id']}")
+        self.assertEqual(listed.status_code, 200)
+        self.assertEqual([point['lat'] for point in listed.data], [50.0, 50.1, 50.2])
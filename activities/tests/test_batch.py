@@ -0,0 +1,85 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from activities.models import Activity, Follower, Kudos
+from activities.repositories import KudosRepository
+
+
+class BatchEndpointTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('runner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.others = [User.objects.create_user(f'other{i}') for i in range(3)]
+        self.activities = [
+            Activity.objects.create(user=other, activity_type='running', duration_sec=60, distance_m=100,
+                                    elevation_gain_m=0, height=0)
+            for other in self.others
+        ]
+
+    def test_kudos_statuses_in_request_order(self):
+        first, second, third = (activity.id for activity in self.activities)
+        Kudos.objects.create(user=self.user, activity_id=second)
+        response = self.client.post('/api/kudos/batch/', {'activity_ids': [third, 999999, second, first]},
+                                    format='json')
+        self.assertEqual(response.data['results'], [
+            {'activity_id': third, 'status': 'created'},
+            {'activity_id': 999999, 'status': 'not_found'},
+            {'activity_id': second, 'status': 'exists'},
+            {'activity_id': first, 'status': 'created'},
+        ])
+
+    def test_follow_statuses_in_request_order(self):
+        ids = [self.others[2].id, self.user.id, self.others[0].id]
+        Follower.objects.create(follower=self.user, followee=self.others[0])
+        response = self.client.post('/api/followers/batch/', {'followee_ids': ids}, format='json')
+        self.assertEqual([item['status'] for item in response.data['results']], ['created', 'self', 'exists'])
+
+    def test_idempotency_key_replays_same_request(self):
+        body = {'activity_ids': [self.activities[0].id]}
+        first = self.client.post('/api/kudos/batch/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        Kudos.objects.all().delete()
+        again = self.client.post('/api/kudos/batch/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(again.data, first.data)
+        self.assertFalse(Kudos.objects.exists())
+
+    def test_idempotency_key_reused_with_other_body(self):
+        self.client.post('/api/kudos/batch/', {'activity_ids': [self.activities[0].id]}, format='json',
+                         HTTP_IDEMPOTENCY_KEY='k2')
+        response = self.client.post('/api/kudos/batch/', {'activity_ids': [self.activities[1].id]}, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='k2')
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Kudos.objects.filter(activity=self.activities[1]).exists())
+
+    def test_retry_while_first_request_runs_is_rejected(self):
+        body = {'activity_ids': [self.activities[0].id]}
+        add_many = KudosRepository.add_many
+        retries = []
+
+        def slow_add_many(repository, *args):
+            # Повтор приходить, поки перший запит ще пише
+            retries.append(self.client.post('/api/kudos/batch/', body, format='json', HTTP_IDEMPOTENCY_KEY='k3'))
+            return add_many(repository, *args)
+
+        with mock.patch.object(KudosRepository, 'add_many', slow_add_many):
+            first = self.client.post('/api/kudos/batch/', body, format='json', HTTP_IDEMPOTENCY_KEY='k3')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertEqual(retries[0]['Retry-After'], '1')
+        self.assertEqual(Kudos.objects.count(), 1)
+        again = self.client.post('/api/kudos/batch/', body, format='json', HTTP_IDEMPOTENCY_KEY='k3')
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+
+    def test_failed_request_releases_key(self):
+        invalid = self.client.post('/api/kudos/batch/', {'activity_ids': []}, format='json', HTTP_IDEMPOTENCY_KEY='k4')
+        self.assertEqual(invalid.status_code, 400)
+        again = self.client.post('/api/kudos/batch/', {'activity_ids': []}, format='json', HTTP_IDEMPOTENCY_KEY='k4')
+        self.assertEqual(again.status_code, 400)
+        self.assertFalse(again.has_header('Idempotent-Replayed'))
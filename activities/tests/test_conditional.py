@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from activities.conditional import bump_version, get_versions
+from activities.models import Activity, DataVersion
+
+
+class BumpVersionTests(TestCase):
+
+    def test_rows_are_created_by_migration(self):
+        self.assertTrue(DataVersion.objects.filter(name='activities.activity').exists())
+
+    def test_bump_is_applied_after_commit(self):
+        before = get_versions([Activity])[0]['activities.activity']
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(Activity)
+            bump_version(Activity)
+            # До коміту версія не змінюється
+            self.assertEqual(get_versions([Activity])[0]['activities.activity'], before)
+        self.assertEqual(get_versions([Activity])[0]['activities.activity'], before + 2)
+
+
+class ConditionalRetrieveTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.activity = Activity.objects.create(
+                user=self.user, activity_type='running', duration_sec=600, distance_m=2000,
+                elevation_gain_m=0, height=0,
+            )
+
+    def test_not_modified_with_matching_etag(self):
+        response = self.client.get(f'/api/activities/{self.activity.id}/')
+        self.assertEqual(response.status_code, 200)
+        again = self.client.get(f'/api/activities/{self.activity.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_etag_changes_after_write(self):
+        etag = self.client.get(f'/api/activities/{self.activity.id}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/activities/{self.activity.id}/', {'distance_m': 2500}, format='json')
+        response = self.client.get(f'/api/activities/{self.activity.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['distance_m'], 2500)
+
+    def test_missing_object_is_404_not_304(self):
+        response = self.client.get('/api/activities/999999/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
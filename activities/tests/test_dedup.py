@@ -0,0 +1,98 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from activities import dedup
+from activities.models import ActivityFingerprint, ActivityPoint
+
+
+def track(start, count=300, lat_shift=0.0, step=1):
+    return [
+        {'lat': 50.45 + i * 0.0005 + lat_shift, 'lon': 30.52 + i * 0.0003,
+         'recorded_at': (start + timedelta(seconds=10 * i)).isoformat()}
+        for i in range(0, count, step)
+    ]
+
+
+class MatchScoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.start = timezone.now()
+
+    def test_tolerances(self):
+        wanted = dedup.fingerprint(self.start, 3000, 10000)
+        self.assertEqual(dedup.match_score(dedup.fingerprint(self.start + timedelta(seconds=60), 3050, 10200), wanted), 0.0)
+        self.assertIsNone(dedup.match_score(dedup.fingerprint(self.start + timedelta(minutes=10), 3000, 10000), wanted))
+        self.assertIsNone(dedup.match_score(dedup.fingerprint(self.start, 3000, 12000), wanted))
+        # Нульові дистанції (зал) теж збігаються
+        self.assertEqual(dedup.match_score(dedup.fingerprint(self.start, 3000, 0), dedup.fingerprint(self.start, 3000, 0)), 0.0)
+
+    def test_track_similarity(self):
+        lat = [50.45 + i * 0.0005 for i in range(300)]
+        lon = [30.52 + i * 0.0003 for i in range(300)]
+        wanted = dedup.fingerprint(self.start, 3000, 10000, lat, lon)
+        noisy = dedup.fingerprint(self.start, 3000, 10000, [value + 0.00005 for value in lat[::2]], lon[::2])
+        other = dedup.fingerprint(self.start, 3000, 10000, [value + 0.3 for value in lat], lon)
+        self.assertGreaterEqual(dedup.match_score(noisy, wanted), dedup.min_similarity())
+        self.assertIsNone(dedup.match_score(other, wanted))
+
+
+class UploadTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+
+    def _body(self, start=None, points=(), **overrides):
+        start = start or self.start
+        body = {
+            'activity_type': 'running', 'duration_sec': 3000, 'distance_m': 10000, 'elevation_gain_m': 10, 'height': 0,
+            'start_time': start.isoformat(), 'end_time': (start + timedelta(seconds=3000)).isoformat(),
+            'points': list(points),
+        }
+        body.update(overrides)
+        return body
+
+    def _upload(self, body, query=''):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/activities/upload/{query}', body, format='json')
+
+    def test_duplicate_from_another_device_is_rejected(self):
+        created = self._upload(self._body(points=track(self.start)))
+        self.assertEqual(created.status_code, 201)
+        self.assertIsNotNone(ActivityFingerprint.objects.get(activity_id=created.data['id']).track_minhash)
+        points = ActivityPoint.objects.count()
+
+        duplicate = self._upload(self._body(
+            self.start + timedelta(seconds=40), track(self.start, lat_shift=0.00005, step=2), distance_m=10150,
+        ))
+        self.assertEqual(duplicate.status_code, 409)
+        self.assertEqual(duplicate.data['duplicate_of'], created.data['id'])
+        self.assertEqual(ActivityPoint.objects.count(), points)
+
+        other_route = self._upload(self._body(points=track(self.start, lat_shift=0.3)))
+        self.assertEqual(other_route.status_code, 201)
+
+    def test_plain_create_checks_fingerprint(self):
+        created = self._upload(self._body())
+        body = self._body()
+        del body['points']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/activities/', body, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['duplicate_of'], created.data['id'])
+
+    def test_merge_adds_track_only_once(self):
+        created = self._upload(self._body())
+        merged = self._upload(self._body(points=track(self.start)), '?on_duplicate=merge')
+        self.assertEqual(merged.status_code, 200)
+        self.assertEqual((merged.data['duplicate_of'], merged.data['points_merged']), (created.data['id'], True))
+        self.assertEqual(ActivityPoint.objects.filter(activity_id=created.data['id']).count(), 300)
+        again = self._upload(self._body(points=track(self.start)), '?on_duplicate=merge')
+        self.assertFalse(again.data['points_merged'])
+        self.assertEqual(ActivityPoint.objects.filter(activity_id=created.data['id']).count(), 300)
@@ -0,0 +1,84 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from activities import follow_graph
+from activities.follow_graph import FollowGraph
+
+
+class FollowGraphTests(SimpleTestCase):
+
+    def test_overlay_changes_are_visible(self):
+        graph = FollowGraph([(1, 2), (1, 3), (2, 3)])
+        graph.follow(1, 4)
+        graph.unfollow(1, 2)
+        self.assertEqual(graph.following(1).tolist(), [3, 4])
+        self.assertEqual(graph.counts([3]), {3: {'followers': 2, 'following': 0}})
+        self.assertEqual(graph.suggestions(2), [])
+
+    def test_reads_survive_concurrent_overlay_changes(self):
+        graph = FollowGraph([(1, 2)])
+        stop = threading.Event()
+        errors = []
+
+        def writer():
+            followee = 100
+            while not stop.is_set():
+                graph.follow(1, followee)
+                graph.unfollow(1, followee)
+                followee += 1
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            for _ in range(2000):
+                try:
+                    graph.following(1)
+                    graph.counts([1, 2])
+                except RuntimeError as exc:  # "Set changed size during iteration"
+                    errors.append(exc)
+                    break
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+class GraphReloadTests(SimpleTestCase):
+
+    def setUp(self):
+        follow_graph.invalidate()
+        self.addCleanup(follow_graph.invalidate)
+
+    def test_changes_during_load_are_replayed(self):
+        def load():
+            # Підписка закомічена вже після того, як завантаження прочитало таблицю
+            follow_graph._apply('follow', [(1, 3)])
+            return FollowGraph([(1, 2)])
+
+        with mock.patch.object(follow_graph, 'load_graph', side_effect=load):
+            graph = follow_graph.get_graph()
+        self.assertEqual(graph.following(1).tolist(), [2, 3])
+        self.assertIsNone(follow_graph._replay)
+
+    @override_settings(FOLLOW_GRAPH_REBUILD_SECONDS=0)
+    def test_stale_graph_is_reloaded_in_background(self):
+        with mock.patch.object(follow_graph, 'load_graph', return_value=FollowGraph([(1, 2)])):
+            old = follow_graph.get_graph()
+        started, release = threading.Event(), threading.Event()
+
+        def load():
+            started.set()
+            release.wait(5)
+            return FollowGraph([(1, 2), (1, 3)])
+
+        with mock.patch.object(follow_graph, 'load_graph', side_effect=load), \
+                mock.patch.object(follow_graph.connections, 'close_all'):
+            # Поки новий граф будується, запит отримує попередній
+            self.assertIs(follow_graph.get_graph(), old)
+            self.assertTrue(started.wait(5))
+            release.set()
+            with follow_graph._load_lock:
+                pass
+        self.assertEqual(follow_graph._graph.following(1).tolist(), [2, 3])
@@ -0,0 +1,66 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from activities.models import Follower
+
+
+class FollowerPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.target = User.objects.create(username='target')
+        cls.users = [User.objects.create(username=f'user{i}') for i in range(12)]
+        for user in cls.users:
+            Follower.objects.create(follower=user, followee=cls.target)
+        # Однаковий created_at у кількох рядків: порядок і курсор тримаються на id
+        Follower.objects.filter(follower__in=cls.users[3:8]).update(created_at=timezone.now())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def _expected(self):
+        return list(
+            Follower.objects.filter(followee=self.target).order_by('-created_at', '-id').values_list('follower_id', flat=True)
+        )
+
+    def _pages(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['user_id'] for row in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_pages_cover_every_follower_once(self):
+        pages = self._pages(f'/api/users/{self.target.id}/followers/?limit=5')
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual([user_id for page in pages for user_id in page], self._expected())
+
+    def test_new_follower_does_not_shift_next_page(self):
+        expected = self._expected()
+        first = self.client.get(f'/api/users/{self.target.id}/followers/?limit=5').data
+        Follower.objects.create(follower=User.objects.create(username='late'), followee=self.target)
+        rest = [user_id for page in self._pages(first['next']) for user_id in page]
+        self.assertEqual([row['user_id'] for row in first['results']] + rest, expected)
+
+    def test_following(self):
+        response = self.client.get(f'/api/users/{self.users[0].id}/following/')
+        self.assertEqual([row['user_id'] for row in response.data['results']], [self.target.id])
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(f'/api/users/{self.target.id}/followers/?cursor=zzz').status_code, 400)
+        self.assertEqual(self.client.get('/api/users/999999/followers/').status_code, 404)
+
+    def test_unfollow_by_composite_key(self):
+        me, other = self.users[0], self.users[1]
+        url = f'/api/users/{me.id}/following/{self.target.id}/'
+        self.assertEqual(self.client.delete(f'/api/users/{other.id}/following/{self.target.id}/').status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertFalse(Follower.objects.filter(follower=me, followee=self.target).exists())
+        self.assertTrue(Follower.objects.filter(follower=other, followee=self.target).exists())
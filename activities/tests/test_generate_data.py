@@ -0,0 +1,31 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TransactionTestCase, override_settings
+
+from activities import search, summaries
+from activities.models import Activity, ActivityFingerprint, Profile, UserSummary
+
+
+class GenerateDataTests(TransactionTestCase):
+    # Рядки DataVersion з міграції потрібні іншим тестам
+    serialized_rollback = True
+
+    def test_derived_data_is_rebuilt_after_load(self):
+        search.invalidate()
+        call_command('generate_data', users=6, activities_per_user=3, point_interval=60, workers=1,
+                     stdout=StringIO())
+        activities = Activity.objects.exclude(start_time=None)
+        self.assertEqual(UserSummary.objects.count(), 6)
+        self.assertEqual(ActivityFingerprint.objects.count(), activities.count())
+        for summary in UserSummary.objects.all():
+            self.assertEqual(summaries.compute_summary(summary.user_id)['activities_count'], summary.activities_count)
+        profile = Profile.objects.first()
+        found = search.search_ids('profiles', profile.display_name.split()[0])
+        self.assertIn(profile.user_id, [doc_id for doc_id, _ in found])
+
+    @override_settings(SHARD_DATABASES=['default'])
+    def test_refuses_to_load_with_sharding(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_data', users=2, workers=1, stdout=StringIO())
+        self.assertFalse(Activity.objects.exists())
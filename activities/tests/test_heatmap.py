@@ -0,0 +1,95 @@
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from activities import heatmap
+from activities.conditional import bump_version
+from activities.models import Activity, ActivityPoint, Follower, HeatmapGeneration
+
+
+class HeatmapUpdateTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(HEATMAP_DIR=Path(directory.name), HEATMAP_MIN_ZOOM=2, HEATMAP_MAX_ZOOM=4)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('runner', password='x')
+        self.activity = Activity.objects.create(
+            user=self.user, activity_type='running', duration_sec=600, distance_m=2000, elevation_gain_m=0, height=0,
+        )
+
+    def _add_points(self, count):
+        points = ActivityPoint.objects.bulk_create(
+            [ActivityPoint(activity=self.activity, lat=50.45 + i / 1000, lon=30.52) for i in range(count)]
+        )
+        self._bump()
+        return points
+
+    def _bump(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(ActivityPoint)
+
+    def test_incremental_update(self):
+        self._add_points(3)
+        self.assertEqual(heatmap.refresh(self.user.id)['point_count'], 3)
+        self._add_points(2)
+        meta = heatmap.refresh(self.user.id)
+        self.assertEqual(meta['point_count'], 5)
+        self.assertEqual(int(heatmap.density(self.user.id, 2, 2, 1, meta).sum()), 5)
+
+    def test_point_committed_after_a_higher_id_is_counted(self):
+        first, late, last = self._add_points(3)
+        # Транзакція з `late` ще не закомічена, коли карта оновлюється
+        ActivityPoint.objects.filter(id=late.id).delete()
+        self._bump()
+        self.assertEqual(heatmap.refresh(self.user.id)['point_count'], 2)
+        ActivityPoint.objects.create(id=late.id, activity=self.activity, lat=late.lat, lon=late.lon)
+        self._bump()
+        self.assertEqual(heatmap.refresh(self.user.id)['point_count'], 3)
+        # Повторна перевірка не рахує ті самі точки вдруге
+        self._bump()
+        self.assertEqual(heatmap.refresh(self.user.id)['point_count'], 3)
+
+    @override_settings(HEATMAP_LOOKBACK_SECONDS=0)
+    def test_watermark_advances_after_lookback(self):
+        points = self._add_points(2)
+        meta = heatmap.refresh(self.user.id)
+        self.assertEqual(meta['watermark'], points[-1].id)
+        self.assertEqual(meta['checks'], [])
+
+    def test_previous_revision_is_kept_for_readers(self):
+        revisions = []
+        for _ in range(3):
+            self._add_points(1)
+            revisions.append(heatmap.refresh(self.user.id)['revision'])
+        directory = heatmap.user_dir(self.user.id)
+        remaining = sorted(child.name for child in directory.iterdir() if child.is_dir())
+        self.assertEqual(remaining, revisions[1:])
+        self.assertTrue((directory / '.lock').exists())
+
+    def test_point_delete_rebuilds_map_in_every_worker(self):
+        first, _ = self._add_points(2)
+        self.assertEqual(heatmap.refresh(self.user.id)['point_count'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        # Покоління в БД, а не в кеші процесу: інший воркер з порожнім кешем теж його бачить
+        cache.clear()
+        self.assertEqual(HeatmapGeneration.objects.get(user=self.user).generation, 1)
+        self.assertEqual(heatmap.refresh(self.user.id)['point_count'], 1)
+
+    def test_only_owner_and_followers_see_the_map(self):
+        follower = User.objects.create_user('follower', password='x')
+        stranger = User.objects.create_user('stranger', password='x')
+        Follower.objects.create(follower=follower, followee=self.user)
+        client = APIClient()
+        url = f'/api/heatmaps/{self.user.id}/'
+        for user, status_code in ((self.user, 200), (follower, 200), (stranger, 404)):
+            client.force_authenticate(user)
+            self.assertEqual(client.get(url).status_code, status_code, user.username)
+        self.assertEqual(client.get(f'{url}tiles/2/2/1.png/').status_code, 404)
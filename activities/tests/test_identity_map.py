@@ -0,0 +1,44 @@
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from activities import identity_map
+
+
+class IdentityMapTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner', password='x')
+        identity_map._lru.clear()
+        self.addCleanup(identity_map._lru.clear)
+
+    def _load_in_request(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            return User.objects.get(pk=self.user.pk)
+
+        token = identity_map.activate()
+        try:
+            first = identity_map.get(User, self.user.pk, load)
+            self.assertIs(identity_map.get(User, self.user.pk, load), first)
+        finally:
+            identity_map.deactivate(token)
+        return len(loads)
+
+    def test_local_cache_limits_map_to_request(self):
+        # LocMem не бачить інвалідацій інших процесів: між запитами рядок перечитується
+        self.assertEqual(self._load_in_request(), 1)
+        self.assertEqual(self._load_in_request(), 1)
+
+    def test_shared_cache_enables_lru(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }):
+            self.assertEqual(self._load_in_request(), 1)
+            self.assertEqual(self._load_in_request(), 0)
+            with self.captureOnCommitCallbacks(execute=True):
+                identity_map.invalidate(User, self.user.pk)
+            self.assertEqual(self._load_in_request(), 1)
@@ -0,0 +1,50 @@
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from activities.lazy import lazy_import
+
+SLOW_MODULE = '''
+import time
+import builtins
+builtins._lazy_test_execs = getattr(builtins, '_lazy_test_execs', 0) + 1
+time.sleep(0.05)
+VALUE = 42
+'''
+
+
+class LazyImportTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        Path(directory.name, 'lazy_slow_module.py').write_text(SLOW_MODULE)
+        sys.path.insert(0, directory.name)
+        self.addCleanup(sys.path.remove, directory.name)
+        self.addCleanup(sys.modules.pop, 'lazy_slow_module', None)
+        import builtins
+        builtins._lazy_test_execs = 0
+
+    def test_module_is_not_executed_until_used(self):
+        module = lazy_import('lazy_slow_module')
+        self.assertNotIn('lazy_slow_module', sys.modules)
+        self.assertEqual(module.VALUE, 42)
+
+    def test_concurrent_first_access_executes_module_once(self):
+        import builtins
+        module = lazy_import('lazy_slow_module')
+        values = []
+        threads = [threading.Thread(target=lambda: values.append(module.VALUE)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(values, [42] * 8)
+        self.assertEqual(builtins._lazy_test_execs, 1)
+
+    def test_missing_module(self):
+        with self.assertRaises(ModuleNotFoundError):
+            lazy_import('no_such_module_here')
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from activities import leaderboards
+from activities.models import Activity, Follower
+
+
+class LeaderboardViewTests(TestCase):
+
+    def setUp(self):
+        leaderboards.invalidate()
+        self.user = User.objects.create_user('runner', password='x')
+        self.friend = User.objects.create_user('friend', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            for user, distance in ((self.user, 1000), (self.friend, 5000)):
+                Activity.objects.create(
+                    user=user, activity_type='running', duration_sec=600, distance_m=distance,
+                    elevation_gain_m=0, height=0,
+                )
+        self.addCleanup(leaderboards.invalidate)
+
+    def test_limit_is_clamped_to_at_least_one(self):
+        response = self.client.get('/api/analytics/leaderboards/', {'limit': -5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['user_id'], self.friend.id)
+
+    def test_non_integer_limit_is_rejected(self):
+        response = self.client.get('/api/analytics/leaderboards/', {'limit': 'ten'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_follow_changes_the_etag(self):
+        first = self.client.get('/api/analytics/leaderboards/', {'circle': 'following'})
+        self.assertEqual(len(first.data['results']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Follower.objects.create(follower=self.user, followee=self.friend)
+        second = self.client.get(
+            '/api/analytics/leaderboards/', {'circle': 'following'}, HTTP_IF_NONE_MATCH=first['ETag'],
+        )
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(second.data['results']), 2)
+
+
+class LeaderboardBuildTests(TestCase):
+
+    def setUp(self):
+        leaderboards.invalidate()
+        self.addCleanup(leaderboards.invalidate)
+
+    def test_build_runs_without_the_shared_lock(self):
+        original = leaderboards._build
+
+        def build(start):
+            # Інший потік у цей момент може взяти _lock (RLock тут не допоможе — перевіряємо власника)
+            self.assertFalse(leaderboards._lock._is_owned())
+            return original(start)
+
+        with mock.patch.object(leaderboards, '_build', side_effect=build):
+            leaderboards.get_leaderboard('all')
+
+    def test_invalidate_during_build_is_not_cached(self):
+        original = leaderboards._build
+
+        def build(start):
+            boards = original(start)
+            leaderboards.invalidate()
+            return boards
+
+        with mock.patch.object(leaderboards, '_build', side_effect=build):
+            leaderboards.get_leaderboard('all')
+        self.assertNotIn('all', leaderboards._windows)
@@ -0,0 +1,114 @@
+import asyncio
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from activities import live
+from activities.models import Activity, ActivityPoint
+
+
+def point(**overrides):
+    return {'lat': 50.45, 'lon': 30.52, 'recorded_at': timezone.now(), **overrides}
+
+
+class LiveHubFlushTests(TransactionTestCase):
+    # Точки пишуться з окремого потоку — йому потрібні закомічені активності
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner', password='x')
+        self.first, self.second = [
+            Activity.objects.create(
+                user=self.user, activity_type='running', duration_sec=600, distance_m=2000, elevation_gain_m=0, height=0,
+            )
+            for _ in range(2)
+        ]
+
+    def _run(self, scenario, logs=True):
+        async def main():
+            hub = live.LiveHub()
+            try:
+                return await scenario(hub)
+            finally:
+                await hub.close()
+        if not logs:
+            return asyncio.run(main())
+        with self.assertLogs('activities.live', 'WARNING') as captured:
+            asyncio.run(main())
+        return [record.getMessage() for record in captured.records]
+
+    def _points(self, activity):
+        return ActivityPoint.objects.filter(activity=activity).count()
+
+    def test_failed_session_keeps_its_buffer(self):
+        write_session = live._write_session
+
+        def failing(activity_id, points):
+            if activity_id == self.first.id:
+                raise OperationalError('database is locked')
+            return write_session(activity_id, points)
+
+        async def scenario(hub):
+            first = hub.session(self.first.id, self.user.id)
+            second = hub.session(self.second.id, self.user.id)
+            hub.push(first, [point()])
+            hub.push(second, [point(), point()])
+            with mock.patch.object(live, '_write_session', failing):
+                self.assertEqual(await hub.flush(), 2)
+            self.assertEqual((len(first.points), len(second.points)), (1, 0))
+            self.assertEqual(await hub.flush(), 1)
+            self.assertEqual(first.points, [])
+            self.assertEqual(hub.sessions, {})
+
+        logs = self._run(scenario)
+        self.assertIn(f"Live points of activity {self.first.id} were not saved", logs)
+        self.assertEqual((self._points(self.first), self._points(self.second)), (1, 2))
+
+    def test_invalid_points_are_dropped(self):
+        async def scenario(hub):
+            session = hub.session(self.first.id, self.user.id)
+            hub.push(session, [point(), point(speed=-1)])
+            self.assertEqual(await hub.flush(), 0)
+            self.assertEqual(session.points, [])
+
+        self._run(scenario)
+        self.assertEqual(self._points(self.first), 0)
+
+    def test_finish_reaches_subscribers_in_other_processes(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }):
+            async def scenario(hub):
+                # Інший процес: свій LiveHub, спільний лише кеш
+                other = live.LiveHub()
+                try:
+                    queue = asyncio.Queue(maxsize=1)
+                    other.session(self.first.id, self.user.id).subscribers.add(queue)
+                    publisher = hub.session(self.first.id, self.user.id)
+                    await hub.start(publisher)
+                    hub.push(publisher, [point()])
+                    await hub.finish(publisher)
+                    await other._poll_remote()
+                    return queue.get_nowait()
+                finally:
+                    await other.close()
+
+            message = self._run(scenario, logs=False)
+        self.assertEqual(message, {"type": "finished", "activity_id": self.first.id})
+        self.assertEqual(self._points(self.first), 1)
+
+    def test_positions_go_only_to_a_shared_cache(self):
+        self.assertIsNone(live._shared_cache())
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }):
+            async def scenario(hub):
+                hub.push(hub.session(self.first.id, self.user.id), [point()])
+                await hub.flush()
+
+            self._run(scenario, logs=False)
+            position = live._shared_cache().get(live._position_key(self.first.id))
+            self.assertEqual(position['points_received'], 1)
@@ -0,0 +1,63 @@
+import tempfile
+import threading
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from activities import metrics
+
+
+class PrometheusPermissionTests(TestCase):
+
+    url = '/api/metrics/prometheus/'
+
+    def test_anonymous_request_is_rejected(self):
+        # Адреса 127.0.0.1 сама по собі більше нічого не дозволяє
+        response = APIClient().get(self.url, REMOTE_ADDR='127.0.0.1')
+        self.assertIn(response.status_code, (401, 403))
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_bearer_token(self):
+        client = APIClient()
+        self.assertEqual(client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        self.assertIn(client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong').status_code, (401, 403))
+
+    def test_admin(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('admin', password='x', is_staff=True))
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE api_request_duration_seconds histogram', response.content.decode())
+
+
+class StoreTests(SimpleTestCase):
+
+    def test_finished_threads_are_merged_not_lost(self):
+        before = metrics.snapshot().get(('test_thread_counter', ()), 0)
+        threads = [threading.Thread(target=metrics.inc, args=('test_thread_counter',)) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metrics.snapshot()[('test_thread_counter', ())], before + 20)
+        self.assertFalse(any(thread in threads for thread, _ in metrics._stores))
+
+    def test_snapshot_file_is_unique_per_process(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            metrics.flush()
+            self.assertEqual([path.name for path in Path(directory).glob('*.json')],
+                             [f"{metrics.os.getpid()}-{metrics._token}.json"])
+
+
+class MetricsMixinTests(TestCase):
+
+    def test_queries_are_counted(self):
+        user = User.objects.create_user('runner', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+        key = ('api_db_queries_total', (('action', 'list'), ('view', 'ActivityViewSet')))
+        before = metrics.snapshot().get(key, 0)
+        client.get('/api/activities/')
+        self.assertGreater(metrics.snapshot().get(key, 0), before)
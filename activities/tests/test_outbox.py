@@ -0,0 +1,81 @@
+from django.test import TestCase, override_settings
+
+from activities import outbox
+from activities.models import OutboxCheckpoint, OutboxEvent
+
+
+class Recorder:
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, events):
+        self.batches.append([event.id for event in events])
+
+    @property
+    def delivered(self):
+        return [event_id for batch in self.batches for event_id in batch]
+
+
+class DispatchTests(TestCase):
+
+    def _emit(self, count):
+        return [outbox.emit(OutboxEvent, 'created', n, {}).id for n in range(count)]
+
+    def test_events_are_delivered_once_in_order(self):
+        ids = self._emit(3)
+        handler = Recorder()
+        self.assertEqual(outbox.dispatch('test', handler), 3)
+        self.assertEqual(outbox.dispatch('test', handler), 0)
+        self.assertEqual(handler.delivered, ids)
+        self.assertEqual(OutboxCheckpoint.objects.get(consumer='test').last_event_id, ids[-1])
+
+    def test_topic_filter_still_advances_checkpoint(self):
+        ids = self._emit(2)
+        handler = Recorder()
+        outbox.dispatch('test', handler, topics=['activity.created'])
+        self.assertEqual(handler.batches, [])
+        self.assertEqual(OutboxCheckpoint.objects.get(consumer='test').last_event_id, ids[-1])
+
+    def test_failed_handler_keeps_checkpoint(self):
+        self._emit(2)
+
+        def broken(events):
+            raise RuntimeError("consumer down")
+
+        with self.assertRaises(RuntimeError):
+            outbox.dispatch('test', broken)
+        self.assertFalse(OutboxCheckpoint.objects.filter(consumer='test', last_event_id__gt=0).exists())
+        handler = Recorder()
+        self.assertEqual(outbox.dispatch('test', handler), 2)
+
+    def test_event_committed_after_checkpoint_passed_it_is_delivered(self):
+        first, late, last = self._emit(3)
+        # Транзакція з подією `late` ще не закомічена: диспетчер її не бачить
+        row = OutboxEvent.objects.get(id=late)
+        row.delete()
+        handler = Recorder()
+        outbox.dispatch('test', handler)
+        self.assertEqual(handler.delivered, [first, last])
+        self.assertEqual([gap[0] for gap in OutboxCheckpoint.objects.get(consumer='test').gaps], [late])
+
+        OutboxEvent.objects.create(id=late, topic=row.topic, aggregate_id=row.aggregate_id, payload={})
+        self.assertEqual(outbox.dispatch('test', handler), 1)
+        self.assertEqual(handler.delivered, [first, last, late])
+        self.assertEqual(OutboxCheckpoint.objects.get(consumer='test').gaps, [])
+
+    @override_settings(OUTBOX_GAP_TIMEOUT=-1)
+    def test_gap_of_rolled_back_transaction_expires(self):
+        _, rolled_back, _ = self._emit(3)
+        OutboxEvent.objects.filter(id=rolled_back).delete()
+        outbox.dispatch('test', Recorder())
+        self.assertEqual(OutboxCheckpoint.objects.get(consumer='test').gaps, [])
+
+    @override_settings(OUTBOX_CONSUMERS={'test': {'HANDLER': 'activities.tests.test_outbox.Recorder'}})
+    def test_prune_keeps_events_that_may_still_commit(self):
+        first, late, last = self._emit(3)
+        OutboxEvent.objects.filter(id=late).delete()
+        outbox.dispatch('test', Recorder())
+        outbox.prune()
+        self.assertFalse(OutboxEvent.objects.filter(id=first).exists())
+        self.assertTrue(OutboxEvent.objects.filter(id=last).exists())
@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from activities import recompute
+from activities.models import Activity, RecomputeCheckpoint, UserMonthlyStats
+
+
+class RecomputeShardTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner', password='x')
+        for month, distance in ((1, 1000), (1, 2000), (2, 500)):
+            Activity.objects.create(
+                user=self.user, activity_type='running', duration_sec=600, distance_m=distance,
+                elevation_gain_m=0, height=0, start_time=datetime(2024, month, 10, tzinfo=timezone.utc),
+            )
+        self.shard = recompute.shards(recompute.SHARD_SIZE)[0]
+
+    def _stats(self):
+        return sorted(UserMonthlyStats.objects.values_list('user_id', 'year', 'month', 'total_distance_m'))
+
+    def test_rerun_is_idempotent(self):
+        recompute.recompute_shard('monthly_stats', *self.shard)
+        first = self._stats()
+        self.assertEqual(first, [(self.user.id, 2024, 1, 3000.0), (self.user.id, 2024, 2, 500.0)])
+        UserMonthlyStats.objects.create(user=self.user, year=2023, month=5, total_distance_m=1, total_duration_sec=1)
+        recompute.recompute_shard('monthly_stats', *self.shard)
+        self.assertEqual(self._stats(), first)
+        self.assertEqual(RecomputeCheckpoint.objects.filter(task='monthly_stats').count(), 1)
+
+    def test_failed_checkpoint_leaves_shard_for_resume(self):
+        with mock.patch.object(RecomputeCheckpoint.objects, 'update_or_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                recompute.recompute_shard('monthly_stats', *self.shard)
+        self.assertEqual(recompute.plan('monthly_stats', resume=True), [self.shard])
+        list(recompute.run('monthly_stats', recompute.plan('monthly_stats', resume=True), workers=1))
+        self.assertEqual(len(self._stats()), 2)
+        self.assertEqual(recompute.plan('monthly_stats', resume=True), [])
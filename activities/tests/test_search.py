@@ -0,0 +1,61 @@
+from unittest import skipIf
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from activities import search
+from activities.conditional import bump_version
+from activities.models import Activity, Comment, Profile
+from activities.repositories import SearchRepository
+
+
+class SearchUsersTests(TestCase):
+
+    def setUp(self):
+        for username, display_name in (('anna', 'Bohdana'), ('bob', 'Anton'), ('boris', 'Boris'), ('zoe', None)):
+            user = User.objects.create_user(username, password='x')
+            if display_name:
+                Profile.objects.create(user=user, display_name=display_name)
+
+    def test_matches_username_or_display_name(self):
+        results = SearchRepository().search_users('an')
+        self.assertEqual([row['username'] for row in results], ['anna', 'bob'])
+
+    def test_user_matching_both_is_returned_once(self):
+        results = SearchRepository().search_users('bo')
+        self.assertEqual([row['username'] for row in results], ['anna', 'bob', 'boris'])
+
+    def test_pagination(self):
+        results = SearchRepository().search_users('bo', offset=1, limit=1)
+        self.assertEqual([row['username'] for row in results], ['bob'])
+
+
+@skipIf(search.uses_postgres(), "PostgreSQL шукає по tsvector-колонках")
+class InMemoryIndexTests(TestCase):
+
+    def setUp(self):
+        search.invalidate()
+        self.addCleanup(search.invalidate)
+        self.user = User.objects.create_user('runner', password='x')
+        self.activity = Activity.objects.create(
+            user=self.user, activity_type='running', duration_sec=600, distance_m=2000,
+            elevation_gain_m=0, height=0,
+        )
+
+    def _write_from_other_process(self, body):
+        # bulk_create не шле сигналів — як запис іншого воркера
+        Comment.objects.bulk_create([Comment(activity=self.activity, user=self.user, body=body)])
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(Comment)
+
+    def test_index_picks_up_writes_of_other_processes(self):
+        self.assertEqual(search.search_ids('comments', 'марафон'), [])
+        self._write_from_other_process('марафон у Львові')
+        with override_settings(SEARCH_INDEX_REBUILD_SECONDS=0):
+            self.assertEqual(len(search.search_ids('comments', 'марафон')), 1)
+
+    def test_rebuild_is_rate_limited(self):
+        self.assertEqual(search.search_ids('comments', 'марафон'), [])
+        self._write_from_other_process('марафон у Львові')
+        with override_settings(SEARCH_INDEX_REBUILD_SECONDS=3600):
+            self.assertEqual(search.search_ids('comments', 'марафон'), [])
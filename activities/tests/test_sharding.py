@@ -0,0 +1,124 @@
+import tempfile
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from activities import search, sharding, sketches, track_archive
+from activities.models import ActivityPoint, AnalyticsSketch, UserMonthlyStats
+from activities.repositories import DataAccessLayer
+
+# Окремі БД під шарди є лише в конфігураціях з кількома DATABASES
+SHARDS = [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+class UserStatsApiMixin:
+    databases = '__all__'
+
+    def setUp(self):
+        sharding._lru.clear()
+        self.addCleanup(sharding._lru.clear)
+        self.user = User.objects.create_user('runner', password='x')
+        self.stats = DataAccessLayer().user_stats.add(
+            user=self.user, year=2024, month=5, total_distance_m=1000, total_duration_sec=600,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _check_reads(self):
+        response = self.client.get('/api/user-stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()], [self.stats.id])
+        self.assertEqual(self.client.get(f'/api/user-stats/{self.stats.id}/').status_code, 200)
+        self.assertEqual(self.client.get('/api/user-stats/0/').status_code, 404)
+
+    def test_reads(self):
+        self._check_reads()
+
+    def test_writes_are_not_allowed(self):
+        self.assertEqual(self.client.post('/api/user-stats/', {}).status_code, 405)
+        self.assertEqual(self.client.delete(f'/api/user-stats/{self.stats.id}/').status_code, 405)
+
+
+@override_settings(SHARD_DATABASES=[])
+class UserStatsApiTests(UserStatsApiMixin, TestCase):
+    pass
+
+
+@skipUnless(SHARDS, 'потрібні додаткові DATABASES під шарди')
+@override_settings(SHARD_DATABASES=SHARDS)
+class ShardedUserStatsApiTests(UserStatsApiMixin, TransactionTestCase):
+    # gather() читає шарди з потоків пулу — їм потрібні закомічені рядки
+
+    def test_stats_live_on_the_user_shard(self):
+        alias = sharding.shard_for(self.user.id)
+        self.assertNotEqual(alias, DEFAULT_DB_ALIAS)
+        self.assertEqual(self.stats._state.db, alias)
+        self.assertFalse(UserMonthlyStats.objects.using(DEFAULT_DB_ALIAS).exists())
+        self._check_reads()
+
+
+class DerivedDataMixin:
+    """Скетчі, архів треків і пошук читають активності з шарду власника."""
+    databases = '__all__'
+
+    def setUp(self):
+        sharding._lru.clear()
+        self.addCleanup(sharding._lru.clear)
+        search.invalidate()
+        self.addCleanup(search.invalidate)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(TRACK_ARCHIVE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create(username='runner')
+        db = DataAccessLayer()
+        start = timezone.now().replace(microsecond=0) - timedelta(days=400)
+        self.activity = db.activities.add(
+            user=self.user, activity_type='running', duration_sec=60, distance_m=100, elevation_gain_m=0,
+            height=0, start_time=start,
+        )
+        with sharding.writing(self.activity._state.db):
+            ActivityPoint.objects.bulk_create([
+                ActivityPoint(activity=self.activity, lat=50, lon=30, recorded_at=start + timedelta(seconds=i))
+                for i in range(3)
+            ])
+        self.comment = db.comments.add(activity=self.activity, user=self.user, body='Morning run')
+
+    def test_rebuild_sketches(self):
+        sketches.rebuild_all()
+        self.assertEqual(AnalyticsSketch.objects.get(kind=sketches.DISTANCE).item_count, 1)
+
+    def test_archive_and_rehydrate(self):
+        self.assertEqual(track_archive.archivable_activity_ids(30), [self.activity.id])
+        self.assertEqual(track_archive.archive_older_than(30)[0].point_count, 3)
+        self.assertTrue(track_archive.is_archived(self.activity.id))
+        self.assertEqual(len(track_archive.read_points(self.activity.id)), 3)
+        self.assertFalse(ActivityPoint.objects.using(self.activity._state.db).exists())
+        self.assertEqual(track_archive.rehydrate(self.activity.id), 3)
+        self.assertFalse(track_archive.is_archived(self.activity.id))
+
+    def test_search_comments(self):
+        found = DataAccessLayer().search.search_comments('morn')
+        self.assertEqual([row['id'] for row in found], [self.comment.id])
+
+
+@override_settings(SHARD_DATABASES=[])
+class DerivedDataTests(DerivedDataMixin, TestCase):
+    pass
+
+
+@skipUnless(SHARDS, 'потрібні додаткові DATABASES під шарди')
+@override_settings(SHARD_DATABASES=SHARDS)
+class ShardedDerivedDataTests(DerivedDataMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.assertNotEqual(self.activity._state.db, DEFAULT_DB_ALIAS)
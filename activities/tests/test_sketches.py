@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from activities import sketches
+from activities.models import Activity, AnalyticsSketch
+from activities.repositories import AnalyticsRepository, DataAccessLayer
+
+
+class SketchUpdateTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner', password='x')
+
+    def _add(self, db, distance):
+        db.activities.add(
+            user=self.user, activity_type='running', duration_sec=600, distance_m=distance,
+            elevation_gain_m=0, height=0, start_time=datetime(2024, 5, 1, 10, tzinfo=timezone.utc),
+        )
+
+    def _count(self, kind=sketches.DISTANCE):
+        return AnalyticsSketch.objects.filter(kind=kind).values_list('item_count', flat=True).first()
+
+    def test_batch_is_merged_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with DataAccessLayer() as db:
+                for distance in (1000, 2000, 3000):
+                    self._add(db, distance)
+            # Рядки скетчів не блокуються в транзакції запису
+            self.assertFalse(AnalyticsSketch.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self._count(), 3)
+        self.assertEqual(self._count(sketches.ACTIVE_USERS), 3)
+        result = AnalyticsRepository().get_approx_quantiles(sketches.DISTANCE, [0.5])
+        self.assertEqual(result['all']['quantiles']['0.5'], 2000)
+        self.assertIsNone(result['stale_since'])
+
+    def test_update_and_delete_mark_results_stale_until_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            activity = Activity.objects.create(
+                user=self.user, activity_type='running', duration_sec=600, distance_m=1000,
+                elevation_gain_m=0, height=0, start_time=datetime(2024, 5, 1, 10, tzinfo=timezone.utc),
+            )
+        self.assertIsNone(sketches.stale_since())
+        with self.captureOnCommitCallbacks(execute=True):
+            DataAccessLayer().activities.update(activity.id, distance_m=5000)
+        since = sketches.stale_since()
+        self.assertIsNotNone(since)
+        self.assertEqual(AnalyticsRepository().get_approx_active_users()['stale_since'], since)
+        with self.captureOnCommitCallbacks(execute=True):
+            activity.delete()
+        self.assertEqual(sketches.stale_since(), since)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sketches.rebuild_all()
+        self.assertIsNone(sketches.stale_since())
+        self.assertFalse(AnalyticsSketch.objects.exists())
@@ -0,0 +1,74 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from activities import summaries
+from activities.models import Activity, Follower, Profile, UserSummary
+
+
+def make_activity(user, distance=1000.0):
+    return Activity.objects.create(
+        user=user, activity_type='running', duration_sec=600, distance_m=distance, elevation_gain_m=0, height=0,
+    )
+
+
+class SummaryTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner', password='x')
+
+    def test_row_created_with_user_and_updated_incrementally(self):
+        make_activity(self.user, 1500)
+        Follower.objects.create(follower=User.objects.create_user('fan'), followee=self.user)
+        summary = summaries.get_summary(self.user.id)
+        self.assertEqual(summary['activities_count'], 1)
+        self.assertEqual(summary['total_distance_m'], 1500)
+        self.assertEqual(summary['followers_count'], 1)
+
+    @mock.patch.object(summaries, 'queue_rebuild')
+    def test_get_without_row_does_not_write(self, queue_rebuild):
+        make_activity(self.user, 1200)
+        UserSummary.objects.filter(user=self.user).delete()
+        summary = summaries.get_summary(self.user.id)
+        self.assertEqual(summary['total_distance_m'], 1200)
+        self.assertFalse(UserSummary.objects.filter(user=self.user).exists())
+        queue_rebuild.assert_called_once_with([self.user.id])
+
+    def test_queued_rebuild_writes_row(self):
+        make_activity(self.user, 900)
+        UserSummary.objects.filter(user=self.user).delete()
+        with mock.patch.object(summaries, '_worker', mock.Mock(is_alive=lambda: True)):
+            summaries.queue_rebuild([self.user.id])
+        self.assertEqual(summaries.rebuild_queued(), 1)
+        self.assertEqual(UserSummary.objects.get(user=self.user).total_distance_m, 900)
+
+
+class ProfileListTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('viewer'))
+
+    def add_profiles(self, count):
+        for _ in range(count):
+            user = User.objects.create_user(f'user{User.objects.count()}')
+            Profile.objects.create(user=user, display_name=user.username)
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/profiles/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_summaries_are_batch_loaded(self):
+        self.add_profiles(2)
+        _, few = self.list_queries()
+        self.add_profiles(6)
+        response, many = self.list_queries()
+        self.assertEqual(len(response.data), 8)
+        self.assertEqual(few, many)
+        self.assertIn('activities_count', response.data[0]['summary'])
@@ -0,0 +1,81 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from activities import throttling
+from activities.models import Activity
+
+CACHE_THROTTLE = {
+    'STORE': 'throttle',
+    'RATES': {'kudos': {'burst': 5, 'sustained': '5/min'}},
+}
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'throttle': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'throttle-tests'},
+}
+
+
+class LocalBucketStoreTests(TestCase):
+
+    def test_cost_above_capacity_needs_full_bucket_and_leaves_debt(self):
+        store = throttling.LocalBucketStore()
+        self.assertEqual(store.consume('k', 5, 1.0, 100.0, cost=12), (True, 0.0))
+        allowed, wait = store.consume('k', 5, 1.0, 101.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 7.0)
+
+
+class CacheBucketStoreTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.store = throttling.CacheBucketStore('default')
+
+    def test_concurrent_requests_do_not_share_tokens(self):
+        allowed = []
+
+        def spend():
+            for _ in range(10):
+                allowed.append(self.store.consume('k', 10, 10 / 60, 1000.0)[0])
+
+        threads = [threading.Thread(target=spend) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(allowed), 10)
+
+    def test_batch_cost(self):
+        self.assertTrue(self.store.consume('k', 10, 10 / 60, 1000.0, cost=8)[0])
+        self.assertFalse(self.store.consume('k', 10, 10 / 60, 1000.0, cost=3)[0])
+        self.assertTrue(self.store.consume('k', 10, 10 / 60, 1000.0, cost=2)[0])
+
+
+@override_settings(TOKEN_BUCKET_THROTTLE=CACHE_THROTTLE, CACHES=CACHES)
+class KudosBatchThrottleTests(TestCase):
+
+    def setUp(self):
+        caches['throttle'].clear()
+        self.user = User.objects.create_user('runner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        owner = User.objects.create_user('owner')
+        self.activities = [
+            Activity.objects.create(user=owner, activity_type='running', duration_sec=60, distance_m=100,
+                                    elevation_gain_m=0, height=0)
+            for _ in range(4)
+        ]
+
+    @mock.patch.object(throttling, '_store', None)
+    def test_batch_is_charged_per_kudos(self):
+        ids = [activity.id for activity in self.activities]
+        response = self.client.post('/api/kudos/batch/', {'activity_ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/api/kudos/batch/', {'activity_ids': ids[:2]}, format='json')
+        self.assertEqual(response.status_code, 429)
+        response = self.client.post('/api/kudos/batch/', {'activity_ids': ids[:1]}, format='json')
+        self.assertEqual(response.status_code, 200)
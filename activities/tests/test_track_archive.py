@@ -0,0 +1,57 @@
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from activities import track_archive
+from activities.models import Activity, ActivityPoint, ArchivedTrack
+
+
+class ArchivedTrackReadTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(TRACK_ARCHIVE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('runner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        start = timezone.now().replace(microsecond=0) - timedelta(days=400)
+        self.activity = Activity.objects.create(
+            user=self.user, activity_type='running', duration_sec=60, distance_m=100, elevation_gain_m=0,
+            height=0, start_time=start,
+        )
+        ActivityPoint.objects.bulk_create([
+            ActivityPoint(activity=self.activity, lat=50 + i / 100, lon=30, recorded_at=start + timedelta(seconds=i))
+            for i in range(5)
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            track_archive.archive_activity(self.activity.id)
+
+    def test_get_reads_archive_without_writing(self):
+        url = f'/api/activity-points/?activity={self.activity.id}'
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.get(url)
+        self.assertEqual(len(first.data), 5)
+        self.assertFalse(ActivityPoint.objects.exists())
+        self.assertTrue(ArchivedTrack.objects.filter(activity=self.activity).exists())
+        # ETag першої відповіді актуальний: GET нічого не змінив
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_points_added_after_archiving_are_merged(self):
+        ActivityPoint.objects.create(activity=self.activity, lat=1, lon=1, recorded_at=timezone.now())
+        response = self.client.get(f'/api/activity-points/?activity={self.activity.id}')
+        self.assertEqual([point['lat'] for point in response.data][-2:], [50.04, 1.0])
+
+    def test_rehydrate_restores_points(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(track_archive.rehydrate(self.activity.id), 5)
+        self.assertEqual(ActivityPoint.objects.filter(activity=self.activity).count(), 5)
+        self.assertIsNone(track_archive.read_points(self.activity.id))
@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from activities.models import Activity, ActivityFingerprint, Follower, OutboxEvent, UserSummary
+from activities.repositories import DataAccessLayer
+
+
+def activity_fields(**overrides):
+    fields = dict(
+        activity_type='running', duration_sec=600, distance_m=2000, elevation_gain_m=0, height=0,
+        start_time=timezone.now() - timedelta(hours=1),
+    )
+    fields.update(overrides)
+    return fields
+
+
+class FlushOrderTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        Follower.objects.create(follower=self.user, followee=self.other)
+
+    def test_unfollow_then_follow(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with DataAccessLayer() as db:
+                db.followers.delete(follower_id=self.user.id, followee_id=self.other.id)
+                db.followers.add(follower=self.user, followee=self.other)
+        self.assertEqual(Follower.objects.filter(follower=self.user, followee=self.other).count(), 1)
+
+    def test_delete_after_add_runs_after_the_insert(self):
+        Follower.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            with DataAccessLayer() as db:
+                db.followers.add(follower=self.user, followee=self.other)
+                db.followers.delete(follower_id=self.user.id, followee_id=self.other.id)
+        self.assertFalse(Follower.objects.exists())
+
+
+class CreateTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('runner', password='x')
+
+    def test_invalid_instance_is_rejected_before_flush(self):
+        start = timezone.now()
+        with self.assertRaises(ValidationError):
+            with DataAccessLayer() as db:
+                db.activities.add(user=self.user, **activity_fields(start_time=start, end_time=start - timedelta(hours=1)))
+        self.assertFalse(Activity.objects.exists())
+
+    def test_derived_data_for_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with DataAccessLayer() as db:
+                for distance in (1000, 2000, 3000):
+                    db.activities.add(user=self.user, **activity_fields(distance_m=distance))
+        summary = UserSummary.objects.get(user=self.user)
+        self.assertEqual(summary.activities_count, 3)
+        self.assertEqual(summary.total_distance_m, 6000)
+        self.assertEqual(OutboxEvent.objects.filter(topic='activity.created').count(), 3)
+        self.assertEqual(ActivityFingerprint.objects.filter(user=self.user).count(), 3)
+
+    def _queries_for(self, count):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                with DataAccessLayer() as db:
+                    for _ in range(count):
+                        db.activities.add(user=self.user, **activity_fields())
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        self._queries_for(1)  # рядки скетчів уже створені
+        self.assertEqual(self._queries_for(2), self._queries_for(20))
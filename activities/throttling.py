@@ -0,0 +1,189 @@
+"""
+Token-bucket throttling для запитів на запис.
+
+Кожен користувач (або IP для анонімів) має відро на кожен scope:
+ємність відра — дозволений "сплеск" (burst), швидкість поповнення —
+середня (sustained) швидкість. Налаштування в settings.TOKEN_BUCKET_THROTTLE:
+
+    TOKEN_BUCKET_THROTTLE = {
+        'STORE': 'local',   # 'local' — пам'ять процесу, інакше — alias кешу Django
+        'RATES': {
+            'writes': {'burst': 30, 'sustained': '120/min'},
+            'kudos': {'burst': 10, 'sustained': '30/min'},
+        },
+    }
+
+Запит коштує view.get_throttle_cost(request) токенів (за замовчуванням 1;
+пакетні ендпоінти — розмір пакета). Запит, дорожчий за ємність відра,
+пропускається лише з повним відром, а решта вартості стає боргом.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Лічильники для метрик: {scope: кількість}
+allowed_requests = Counter()
+rejected_requests = Counter()
+
+
+def parse_rate(rate):
+    """'120/min' -> токенів за секунду."""
+    num, period = rate.split('/')
+    return int(num) / DURATIONS[period[0]]
+
+
+def throttle_settings():
+    return getattr(settings, 'TOKEN_BUCKET_THROTTLE', {})
+
+
+class LocalBucketStore:
+    """Відра в пам'яті процесу: найшвидший варіант (без серіалізації і мережі)."""
+
+    def __init__(self, maxsize=100000):
+        self._buckets = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, now, cost=1):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [float(capacity), now]
+                self._buckets.set(key, bucket)
+            return _take_tokens(bucket, capacity, rate, now, cost)
+
+
+class CacheBucketStore:
+    """
+    Відра в кеші Django (спільні для воркерів, якщо кеш спільний). Без
+    compare-and-set відро не оновити атомарно, тому тут воно наближене
+    ковзним вікном довжиною capacity / rate: лічильники вікон змінюються
+    лише атомарними add / incr / decr, і два воркери не витратять один токен.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, rate, now, cost=1):
+        window = capacity / rate
+        index = int(now // window)
+        current = f"{key}:{index}"
+        self.cache.add(current, 0, int(window * 2) + 1)
+        try:
+            used = self.cache.incr(current, cost)
+        except ValueError:
+            # Лічильник вікна встиг зникнути з кешу між add та incr
+            self.cache.add(current, 0, int(window * 2) + 1)
+            used = self.cache.incr(current, cost)
+        previous = self.cache.get(f"{key}:{index - 1}", 0)
+        # Частка попереднього вікна, що ще потрапляє в ковзне
+        estimated = previous * (1 - (now / window - index)) + used
+        need = min(cost, capacity)
+        if estimated - cost + need <= capacity:
+            return True, 0.0
+        self.cache.decr(current, cost)
+        return False, (estimated - cost + need - capacity) / rate
+
+
+def _take_tokens(bucket, capacity, rate, now, cost=1):
+    """Поповнює відро за час, що минув, і пробує взяти cost токенів. Повертає (allowed, wait)."""
+    tokens, last = bucket
+    tokens = min(capacity, tokens + (now - last) * rate)
+    need = min(cost, capacity)
+    if tokens >= need:
+        bucket[0], bucket[1] = tokens - cost, now
+        return True, 0.0
+    bucket[0], bucket[1] = tokens, now
+    return False, (need - tokens) / rate
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                alias = throttle_settings().get('STORE', 'local')
+                _store = LocalBucketStore() if alias == 'local' else CacheBucketStore(alias)
+    return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Обмежує запити на запис (не GET/HEAD/OPTIONS) для заданого scope."""
+    scope = None
+
+    def __init__(self):
+        self._wait = None
+
+    def get_scope(self, view):
+        return self.scope
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+
+        scope = self.get_scope(view)
+        config = throttle_settings().get('RATES', {}).get(scope) if scope else None
+        if not config:
+            return True
+
+        user = request.user
+        ident = f"user:{user.pk}" if user and user.is_authenticated else f"ip:{self.get_ident(request)}"
+        capacity = config['burst']
+        rate = parse_rate(config['sustained'])
+
+        get_cost = getattr(view, 'get_throttle_cost', None)
+        cost = max(1, get_cost(request)) if get_cost else 1
+
+        allowed, self._wait = get_store().consume(
+            f"throttle:{scope}:{ident}", capacity, rate, time.time(), cost
+        )
+        if allowed:
+            allowed_requests[scope] += 1
+        else:
+            rejected_requests[scope] += 1
+            logger.info("Throttled %s request to %s (%s)", scope, request.path, ident)
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class WriteRateThrottle(TokenBucketThrottle):
+    """Загальний ліміт на запис для ендпоінтів без власного throttle_scope."""
+    scope = 'writes'
+
+    def get_scope(self, view):
+        if getattr(view, 'throttle_scope', None):
+            return None
+        return self.scope
+
+
+class ScopedWriteThrottle(TokenBucketThrottle):
+    """Ліміт для окремого типу ендпоінтів: scope береться з view.throttle_scope."""
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
+
+
+def throttle_metrics():
+    scopes = set(allowed_requests) | set(rejected_requests)
+    return {
+        scope: {'allowed': allowed_requests[scope], 'rejected': rejected_requests[scope]}
+        for scope in sorted(scopes)
+    }
@@ -0,0 +1,248 @@
+"""
+Холодний архів GPS-треків.
+
+Точки старих активностей переносяться з ActivityPoint у файл на диску
+(один файл на активність) і видаляються з БД; про це пам'ятає запис
+ArchivedTrack. API читає архівований трек прямо з файлу (GET нічого не
+пише в БД); повернути точки в БД (rehydrate) можна командою archive_tracks.
+З шардуванням ArchivedTrack і точки лежать на шарді активності.
+
+Формат файлу: 24-байтний заголовок, далі масив записів фіксованої довжини
+(RECORD_FIELDS, 36 байт на точку) — його можна відкрити через numpy.memmap
+без розпакування. Розмір зменшується за рахунок квантування: lat/lon
+зберігаються як int32 у 1e-7 градуса (~1 см), ele/speed — як float32,
+recorded_at — мікросекунди від epoch. NULL кодується як NaN / -1 / INT64_MIN.
+"""
+import functools
+import os
+import struct
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import sharding
+from .conditional import bump_version
+from .lazy import lazy_import
+from .models import Activity, ActivityPoint, ArchivedTrack
+
+MAGIC = b'TRK1'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHqQ')  # magic, version, record size, activity_id, кількість точок
+
+np = lazy_import('numpy')
+
+RECORD_FIELDS = [
+    ('id', '<i8'),
+    ('recorded_at', '<i8'),
+    ('lat', '<i4'),
+    ('lon', '<i4'),
+    ('ele', '<f4'),
+    ('speed', '<f4'),
+    ('cadence', '<i4'),
+]
+
+POINT_FIELDS = ('id', 'recorded_at', 'lat', 'lon', 'ele', 'speed', 'cadence')
+COORD_SCALE = 10 ** 7
+NULL_TIME = -2 ** 63  # INT64_MIN
+NULL_CADENCE = -1
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+@functools.cache
+def record_dtype():
+    return np.dtype(RECORD_FIELDS)
+
+
+def archive_dir():
+    return Path(getattr(settings, 'TRACK_ARCHIVE_DIR', settings.BASE_DIR / 'archive' / 'tracks'))
+
+
+def relative_track_path(activity_id):
+    # Підкаталоги по 1000 активностей, щоб не тримати мільйони файлів в одному каталозі
+    return Path(f"{activity_id // 1000:06d}") / f"{activity_id}.trk"
+
+
+def _to_micros(value):
+    if value is None:
+        return NULL_TIME
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value):
+    if value == NULL_TIME:
+        return None
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def encode_points(rows):
+    """rows — кортежі у порядку POINT_FIELDS -> масив record_dtype()."""
+    records = np.zeros(len(rows), dtype=record_dtype())
+    for index, (point_id, recorded_at, lat, lon, ele, speed, cadence) in enumerate(rows):
+        records[index] = (
+            point_id,
+            _to_micros(recorded_at),
+            round(lat * COORD_SCALE),
+            round(lon * COORD_SCALE),
+            np.nan if ele is None else ele,
+            np.nan if speed is None else speed,
+            NULL_CADENCE if cadence is None else cadence,
+        )
+    return records
+
+
+def decode_points(records):
+    """Масив record_dtype() -> словники з полями ActivityPoint (без activity)."""
+    return [
+        {
+            'id': int(record['id']),
+            'recorded_at': _from_micros(record['recorded_at']),
+            'lat': int(record['lat']) / COORD_SCALE,
+            'lon': int(record['lon']) / COORD_SCALE,
+            'ele': None if np.isnan(record['ele']) else float(record['ele']),
+            'speed': None if np.isnan(record['speed']) else float(record['speed']),
+            'cadence': None if record['cadence'] == NULL_CADENCE else int(record['cadence']),
+        }
+        for record in records
+    ]
+
+
+def write_track(path, activity_id, records):
+    """Атомарно записує файл треку (через тимчасовий файл). Повертає розмір у байтах."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, record_dtype().itemsize, activity_id, len(records)))
+        f.write(records.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path.stat().st_size
+
+
+def open_track(path):
+    """Відкриває файл треку як read-only numpy.memmap з записами record_dtype()."""
+    with open(path, 'rb') as f:
+        magic, version, record_size, _, count = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != FORMAT_VERSION or record_size != record_dtype().itemsize:
+        raise ValueError(f"{path}: unsupported track archive format")
+    if count == 0:
+        return np.zeros(0, dtype=record_dtype())
+    return np.memmap(path, dtype=record_dtype(), mode='r', offset=HEADER.size, shape=(count,))
+
+
+def remove_file(relative_path):
+    try:
+        (archive_dir() / relative_path).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def archive_activity(activity_id):
+    """
+    Переносить точки активності у файл і видаляє їх з БД.
+    Повертає ArchivedTrack або None, якщо архівувати нічого.
+    """
+    relative = relative_track_path(activity_id)
+    path = archive_dir() / relative
+    alias = sharding.locate(Activity, activity_id)
+    with transaction.atomic(), sharding.writing(alias):
+        # Блокування активності серіалізує архівацію і rehydrate одного треку
+        Activity.objects.select_for_update().filter(id=activity_id).first()
+        if ArchivedTrack.objects.filter(activity_id=activity_id).exists():
+            return None
+        rows = list(
+            ActivityPoint.objects.filter(activity_id=activity_id)
+            .order_by('recorded_at', 'id')
+            .values_list(*POINT_FIELDS)
+        )
+        if not rows:
+            return None
+
+        size = write_track(path, activity_id, encode_points(rows))
+        try:
+            # Сирий DELETE: QuerySet.delete() відправляв би post_delete для кожної точки
+            connection = connections[alias or DEFAULT_DB_ALIAS]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {connection.ops.quote_name(ActivityPoint._meta.db_table)} "
+                    f"WHERE activity_id = %s",
+                    [activity_id],
+                )
+            track = ArchivedTrack.objects.create(
+                activity_id=activity_id, path=str(relative), point_count=len(rows), size_bytes=size
+            )
+            bump_version(ActivityPoint)
+        except Exception:
+            path.unlink(missing_ok=True)
+            raise
+    return track
+
+
+def rehydrate(activity_id):
+    """
+    Повертає точки архівованої активності в БД. Файл видаляється після
+    коміту (сигнал на видалення ArchivedTrack). Повертає кількість точок.
+    """
+    with transaction.atomic(), sharding.writing(sharding.locate(Activity, activity_id)):
+        Activity.objects.select_for_update().filter(id=activity_id).first()
+        track = ArchivedTrack.objects.filter(activity_id=activity_id).first()
+        if track is None:
+            return 0
+        points = decode_points(open_track(archive_dir() / track.path))
+        ActivityPoint.objects.bulk_create(
+            [ActivityPoint(activity_id=activity_id, **point) for point in points], batch_size=2000
+        )
+        track.delete()
+        bump_version(ActivityPoint)
+    return len(points)
+
+
+def read_points(activity_id):
+    """Точки архівованого треку (як decode_points) або None, якщо трек не в архіві."""
+    path = (
+        ArchivedTrack.objects.using(sharding.locate(Activity, activity_id))
+        .filter(activity_id=activity_id).values_list('path', flat=True).first()
+    )
+    if path is None:
+        return None
+    try:
+        return decode_points(open_track(archive_dir() / path))
+    except FileNotFoundError:
+        # Паралельний rehydrate уже повернув точки в БД і видалив файл
+        return None
+
+
+def is_archived(activity_id):
+    return ArchivedTrack.objects.using(sharding.locate(Activity, activity_id)).filter(activity_id=activity_id).exists()
+
+
+def archivable_activity_ids(older_than_days, limit=None):
+    """id активностей, старших за older_than_days, у яких є точки в БД."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+
+    def candidates(alias):
+        rows = (
+            Activity.objects.using(alias).filter(start_time__lt=cutoff, archived_track__isnull=True)
+            .filter(Exists(ActivityPoint.objects.using(alias).filter(activity_id=OuterRef('id'))))
+            .order_by('start_time')
+            .values_list('start_time', 'id')
+        )
+        return list(rows[:limit] if limit else rows)
+
+    # З шардуванням — найстаріші з кожного шарду, злиті за start_time
+    rows = sorted(row for rows in sharding.gather(candidates) for row in rows)
+    return [activity_id for _, activity_id in (rows[:limit] if limit else rows)]
+
+
+def archive_older_than(older_than_days, limit=None):
+    """Архівує треки старих активностей по одній (окрема транзакція на кожну)."""
+    archived = []
+    for activity_id in list(archivable_activity_ids(older_than_days, limit)):
+        track = archive_activity(activity_id)
+        if track is not None:
+            archived.append(track)
+    return archived
@@ -15,7 +15,16 @@ router.register(r'user-stats', views.UserMonthlyStatsViewSet, basename='userstat
 
 router.register(r'reports/global-stats', views.GlobalStatsReport, basename='report-stats')
 router.register(r'analytics', views.AnalyticsViewSet, basename='analytics')
+router.register(r'search', views.SearchViewSet, basename='search')
+router.register(r'heatmaps', views.HeatmapViewSet, basename='heatmap')
+router.register(r'metrics/throttling', views.ThrottleMetricsView, basename='throttle-metrics')
+router.register(r'metrics/profiling', views.ProfilingView, basename='profiling')
+router.register(r'metrics/prometheus', views.PrometheusMetricsView, basename='prometheus-metrics')
 
 urlpatterns = [
+    # Роутер не дає DELETE на список: відписка за followee_id у тілі запиту
+    path('followers/', views.FollowerViewSet.as_view(
+        {'get': 'list', 'post': 'create', 'delete': 'unfollow'}, basename='follower', detail=False
+    ), name='follower-list'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,46 +1,129 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser, BasePermission
 from django.contrib.auth.models import User
 from .models import (
-    Activity, Profile, Comment, Kudos, Follower, ActivityPoint, UserMonthlyStats
+    Activity, Profile, Comment, Kudos, Follower, ActivityPoint, UserMonthlyStats, UserSummary,
+    AnalyticsSketch, MaterializedViewRefresh
 )
 from .serializer import (
     ActivitySerializer,
+    ActivityUploadSerializer,
     ProfileSerializer,
     CommentSerializer,
     KudosSerializer,
     FollowerSerializer,
     ActivityPointSerializer,
     UserMonthlyStatsSerializer,
-    UserSerializer
+    UserSerializer,
+    KudosBatchSerializer,
+    FollowerBatchSerializer
 )
 from .repositories import DataAccessLayer
-from django.db import IntegrityError
-from django.http import Http404
+from .conditional import ConditionalResponseMixin
+from .throttling import throttle_metrics
+from .idempotency import idempotent
+from . import dedup, heatmap, identity_map, leaderboards, materialized, metrics, profiling, sharding, sketches, track_archive
+from .lazy import lazy_import
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse
 
-import pandas as pd
 from rest_framework.decorators import action
-
-class AnalyticsViewSet(viewsets.ViewSet):
+from rest_framework.exceptions import NotAuthenticated, ValidationError
+from rest_framework.utils.urls import replace_query_param
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import hmac
+from datetime import datetime
+
+pd = lazy_import('pandas')
+
+
+def parse_time_param(request, name):
+    """Query-параметр з датою ('2025-01-01') або датою-часом (ISO 8601); None, якщо немає."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: "Expected ISO date or datetime."})
+        parsed = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def batch_size(request, field):
+    """Кількість елементів пакета в тілі запиту (вартість пакетного запиту для throttling)."""
+    items = request.data.get(field) if isinstance(request.data, dict) else None
+    return len(items) if isinstance(items, list) else 1
+
+
+def encode_keyset(key):
+    """Непрозорий курсор сторінки з ключа (created_at, id) останнього рядка."""
+    created_at, pk = key
+    return urlsafe_b64encode(f"{created_at.isoformat()}|{pk}".encode()).decode().rstrip('=')
+
+
+def decode_keyset(value):
+    try:
+        created_at, pk = urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode().split('|')
+        parsed = parse_datetime(created_at)
+        if parsed is None:
+            raise ValueError(created_at)
+        return parsed, int(pk)
+    except ValueError:
+        raise ValidationError({"cursor": "Invalid cursor."})
+
+
+class AnalyticsViewSet(metrics.MetricsMixin, ConditionalResponseMixin, viewsets.ViewSet):
 
     permission_classes = [AllowAny]
 
+    # Від яких моделей залежить кожен звіт (для ETag / Last-Modified)
+    action_dependencies = {
+        'leaderboard': (User, Activity),
+        'social_engagement': (User, Activity, Comment, Kudos),
+        'monthly_trends': (Activity, MaterializedViewRefresh),
+        'influencers': (User, Follower),
+        'activity_performance': (Activity, MaterializedViewRefresh),
+        'user_levels': (User, Activity, MaterializedViewRefresh),
+        'leaderboards': (Activity, Follower),
+        'approx_active_users': (AnalyticsSketch,),
+        'approx_quantiles': (AnalyticsSketch,),
+    }
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.db = DataAccessLayer()
 
     def _process_pandas_response(self, queryset, fields, stats_columns=None, group_by_col=None):
+        # QuerySet лінивий, тож при 304 запит до БД і pandas не виконуються
+        return self.conditional_response(
+            self.request,
+            f"analytics:{self.action}",
+            self.action_dependencies.get(self.action, (User, Activity)),
+            lambda: self._build_pandas_response(queryset, fields, stats_columns, group_by_col)
+        )
+
+    def _build_pandas_response(self, queryset, fields, stats_columns=None, group_by_col=None):
 
-        if fields:
+        # Звіти, злиті з шардів, — уже списки dict з потрібними полями
+        if fields and hasattr(queryset, 'values'):
             data = list(queryset.values(*fields))
         else:
             data = list(queryset)
 
         df = pd.DataFrame(data)
+        # Звіт міг бути прочитаний з матеріалізованого представлення (див. activities/materialized.py)
+        freshness = materialized.freshness(queryset)
 
         if df.empty:
-            return Response({"message": "No data available", "statistics": {}})
+            return Response({"message": "No data available", "statistics": {}, "freshness": freshness})
 
         stats = {}
         if stats_columns:
@@ -62,7 +145,8 @@ class AnalyticsViewSet(viewsets.ViewSet):
         response_data = {
             "dataset": df.to_dict(orient="records"),
             "statistics": stats,
-            "grouped_analysis": grouped_data
+            "grouped_analysis": grouped_data,
+            "freshness": freshness,
         }
         return Response(response_data)
 
@@ -86,7 +170,10 @@ class AnalyticsViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def monthly_trends(self, request):
-        qs = self.db.analytics.get_monthly_activity_stats()
+        qs = self.db.analytics.get_monthly_activity_stats(
+            since=parse_time_param(request, 'since'),
+            until=parse_time_param(request, 'until')
+        )
         return self._process_pandas_response(
             qs,
             fields=None,
@@ -122,11 +209,73 @@ class AnalyticsViewSet(viewsets.ViewSet):
         )
 
 
-class RepositoryViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def leaderboards(self, request):
+        window = request.query_params.get('window', 'all')
+        if window not in leaderboards.WINDOWS:
+            raise ValidationError({"window": f"Expected one of: {', '.join(leaderboards.WINDOWS)}."})
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 100))
+        except ValueError:
+            raise ValidationError({"limit": "Expected an integer."})
+        activity_type = request.query_params.get('activity_type') or None
+        user_id = request.user.id if request.user.is_authenticated else None
+        circle = request.query_params.get('circle')
+        if circle == 'following' and user_id is None:
+            raise NotAuthenticated()
+        # Відповідь залежить від користувача ("me") і початку вікна, а не лише від даних
+        scope = f"analytics:leaderboards:{user_id}:{leaderboards.window_start(window)}"
+        return self.conditional_response(
+            request, scope, self.action_dependencies['leaderboards'],
+            lambda: Response(self.db.analytics.get_window_leaderboard(
+                window, activity_type, limit, user_id,
+                circle_of=user_id if circle == 'following' else None,
+            ))
+        )
+
+    def _sketch_response(self, build_data):
+        return self.conditional_response(
+            self.request,
+            f"analytics:{self.action}",
+            self.action_dependencies[self.action],
+            lambda: Response(build_data())
+        )
+
+    @action(detail=False, methods=['get'])
+    def approx_active_users(self, request):
+        since = parse_time_param(request, 'since')
+        until = parse_time_param(request, 'until')
+        activity_type = request.query_params.get('activity_type')
+        return self._sketch_response(
+            lambda: self.db.analytics.get_approx_active_users(since, until, activity_type)
+        )
+
+    @action(detail=False, methods=['get'])
+    def approx_quantiles(self, request):
+        kind = request.query_params.get('metric', sketches.DISTANCE)
+        if kind not in sketches.QUANTILE_KINDS:
+            raise ValidationError({"metric": f"Expected one of: {', '.join(sketches.QUANTILE_KINDS)}."})
+        try:
+            quantiles = [float(q) for q in request.query_params.get('q', '0.5,0.9,0.99').split(',')]
+        except ValueError:
+            raise ValidationError({"q": "Expected comma-separated numbers between 0 and 1."})
+        if not all(0 <= q <= 1 for q in quantiles):
+            raise ValidationError({"q": "Expected comma-separated numbers between 0 and 1."})
+        since = parse_time_param(request, 'since')
+        until = parse_time_param(request, 'until')
+        activity_type = request.query_params.get('activity_type')
+        return self._sketch_response(
+            lambda: self.db.analytics.get_approx_quantiles(kind, quantiles, since, until, activity_type)
+        )
+
+
+class RepositoryViewSet(metrics.MetricsMixin, ConditionalResponseMixin, viewsets.ModelViewSet):
     """
     Кастомний ViewSet, який змушує DRF використовувати наш DataAccessLayer
     замість стандартного `Model.objects.all()`.
     """
+    # Додаткові моделі, від яких залежить відповідь (для ETag)
+    etag_models = ()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -152,9 +301,31 @@ class RepositoryViewSet(viewsets.ModelViewSet):
         else:
             raise ValueError(f"Repository for model {model_name} not found in DataAccessLayer")
 
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Перевірки власника (obj.user != request.user) не вантажать поточного користувача вдруге
+        if request.user.is_authenticated:
+            identity_map.remember(request.user)
+
     def get_queryset(self):
         return self.repo.get_all()
 
+    def list(self, request, *args, **kwargs):
+        model = self.queryset.model
+        return self.conditional_response(
+            request, f"{model._meta.label_lower}:list", (model, *self.etag_models),
+            lambda: super(RepositoryViewSet, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        # Спершу існування і права доступу: 304 не повинен підтверджувати, що об'єкт є і змінився
+        instance = self.get_object()
+        model = self.queryset.model
+        return self.conditional_response(
+            request, f"{model._meta.label_lower}:{self.kwargs['pk']}", (model, *self.etag_models),
+            lambda: Response(self.get_serializer(instance).data)
+        )
+
     def get_object(self):
         obj = self.repo.get_by_id(self.kwargs["pk"])
         if not obj:
@@ -184,11 +355,49 @@ class UserViewSet(RepositoryViewSet):
             return [AllowAny()]
         return [IsAuthenticated()]
 
+    def _follow_page(self, request, pk, get_page):
+        if not str(pk).isdigit() or self.repo.get_by_id(int(pk)) is None:
+            raise Http404
+        limit = request.query_params.get('limit', '50')
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValidationError({"limit": "Expected a positive integer."})
+        cursor = request.query_params.get('cursor')
+        after = decode_keyset(cursor) if cursor else None
+
+        def build():
+            results, next_key = get_page(int(pk), after, min(int(limit), 200))
+            next_url = None
+            if next_key is not None:
+                next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_keyset(next_key))
+            return Response({"results": results, "next": next_url})
+
+        return self.conditional_response(request, f"user:{pk}:{self.action}", (Follower, User), build)
+
+    @action(detail=True, methods=['get'])
+    def followers(self, request, pk=None):
+        """GET /api/users/<id>/followers/?limit=50&cursor=... — підписники, новіші першими"""
+        return self._follow_page(request, pk, self.db.followers.get_followers_page)
+
+    @action(detail=True, methods=['get'])
+    def following(self, request, pk=None):
+        """GET /api/users/<id>/following/?limit=50&cursor=... — на кого підписаний користувач"""
+        return self._follow_page(request, pk, self.db.followers.get_following_page)
+
+    @action(detail=True, methods=['delete'], url_path=r'following/(?P<followee_id>\d+)')
+    def unfollow(self, request, pk=None, followee_id=None):
+        """DELETE /api/users/<ваш id>/following/<id>/ — відписка одним DELETE за (follower, followee)"""
+        if str(pk) != str(request.user.id):
+            return Response({"error": "You can only unfollow for yourself."}, status=status.HTTP_403_FORBIDDEN)
+        if not self.db.followers.delete(follower_id=request.user.id, followee_id=int(followee_id)):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class ProfileViewSet(RepositoryViewSet):
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
     permission_classes = [IsAuthenticated]
+    etag_models = (UserSummary,)
 
     def perform_create(self, serializer):
         try:
@@ -223,9 +432,81 @@ class ActivityViewSet(RepositoryViewSet):
     serializer_class = ActivitySerializer
     permission_classes = [IsAuthenticated]
 
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        wanted = dedup.fingerprint(data.get('start_time'), data['duration_sec'], data['distance_m'])
+        with transaction.atomic(), sharding.writing(sharding.shard_for(request.user.id)):
+            self._lock_uploads(request.user)
+            duplicate_id = dedup.find_duplicate(request.user.id, wanted)
+            if duplicate_id is not None:
+                return self._duplicate_response(duplicate_id)
+            self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(serializer.data))
+
     def perform_create(self, serializer):
         serializer.save(repository=self.repo, user=self.request.user)
 
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def upload(self, request):
+        """
+        POST /api/activities/upload/?on_duplicate=reject|merge — активність разом з точками.
+        Дублікат уже завантаженої активності відхиляється (409) до запису будь-яких рядків
+        або, з on_duplicate=merge, зливається з нею: точки дописуються, лише якщо треку в неї ще немає.
+        """
+        on_duplicate = request.query_params.get('on_duplicate', 'reject')
+        if on_duplicate not in ('reject', 'merge'):
+            raise ValidationError({"on_duplicate": "Expected 'reject' or 'merge'."})
+        serializer = ActivityUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = dict(serializer.validated_data)
+        points = data.pop('points', [])
+        wanted = dedup.fingerprint(
+            data.get('start_time'), data['duration_sec'], data['distance_m'],
+            [point['lat'] for point in points], [point['lon'] for point in points],
+        )
+
+        with transaction.atomic(), sharding.writing(sharding.shard_for(request.user.id)):
+            self._lock_uploads(request.user)
+            duplicate_id = dedup.find_duplicate(request.user.id, wanted)
+            if duplicate_id is not None and on_duplicate == 'reject':
+                return self._duplicate_response(duplicate_id)
+            if duplicate_id is not None:
+                activity = self.repo.get_by_id(duplicate_id)
+                merged = bool(points) and not self._has_track(activity)
+            else:
+                activity = self.repo.add(user=request.user, **data)
+                merged = False
+            if duplicate_id is None or merged:
+                with DataAccessLayer() as db:
+                    for point in points:
+                        db.activity_points.add(activity=activity, **point)
+                if wanted is not None:
+                    dedup.record(activity, wanted.track_minhash)
+
+        result = ActivitySerializer(activity).data
+        if duplicate_id is None:
+            return Response(result, status=status.HTTP_201_CREATED)
+        return Response({"duplicate_of": duplicate_id, "points_merged": merged, "activity": result})
+
+    def _lock_uploads(self, user):
+        # Паралельні завантаження одного користувача (кілька пристроїв) перевіряються по черзі
+        User.objects.select_for_update().filter(id=user.id).first()
+
+    def _has_track(self, activity):
+        return (
+            ActivityPoint.objects.using(activity._state.db).filter(activity_id=activity.id).exists()
+            or track_archive.is_archived(activity.id)
+        )
+
+    def _duplicate_response(self, duplicate_id):
+        return Response(
+            {"error": "This activity duplicates an already uploaded one.", "duplicate_of": duplicate_id},
+            status=status.HTTP_409_CONFLICT,
+        )
+
 
 class CommentViewSet(RepositoryViewSet):
     queryset = Comment.objects.all()
@@ -240,6 +521,10 @@ class KudosViewSet(RepositoryViewSet):
     queryset = Kudos.objects.all()
     serializer_class = KudosSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'kudos'
+
+    def get_throttle_cost(self, request):
+        return batch_size(request, 'activity_ids') if self.action == 'batch' else 1
 
     def perform_create(self, serializer):
         try:
@@ -250,11 +535,38 @@ class KudosViewSet(RepositoryViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def batch(self, request):
+        """POST /api/kudos/batch/ {"activity_ids": [...]} — kudos багатьом активностям за раз"""
+        serializer = KudosBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = self.repo.add_many(request.user.id, serializer.validated_data['activity_ids'])
+        return Response({
+            "results": [{"activity_id": pk, "status": result} for pk, result in results.items()]
+        })
+
 
 class ActivityPointViewSet(RepositoryViewSet):
     queryset = ActivityPoint.objects.all()
     serializer_class = ActivityPointSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'activity-points'
+
+    def get_queryset(self):
+        # ?since= / ?until= фільтрують за recorded_at, тож PostgreSQL читає лише
+        # потрібні місячні партиції; ?activity=<id> — усі точки активності
+        activity_id = self.request.query_params.get('activity')
+        if activity_id and self.action == 'list':
+            activity = self.db.activities.get_by_id(activity_id)
+            if not activity:
+                raise Http404
+            return self.repo.get_for_activity(activity)
+        since = parse_time_param(self.request, 'since')
+        until = parse_time_param(self.request, 'until')
+        if since or until:
+            return self.repo.get_in_range(since, until)
+        return self.repo.get_all()
 
     def perform_create(self, serializer):
         activity = serializer.validated_data['activity']
@@ -269,6 +581,9 @@ class FollowerViewSet(RepositoryViewSet):
     serializer_class = FollowerSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_throttle_cost(self, request):
+        return batch_size(request, 'followee_ids') if self.action == 'batch' else 1
+
     def perform_create(self, serializer):
         if serializer.validated_data['followee'] == self.request.user:
             return Response(
@@ -283,22 +598,70 @@ class FollowerViewSet(RepositoryViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-    def perform_destroy(self, instance):
-        # 'instance' - це об'єкт Follower
-        if instance.follower != self.request.user:
-            return Response(
-                {"error": "You can only unfollow for yourself."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-        self.repo.delete(follower_id=instance.follower.id, followee_id=instance.followee.id)
+    def destroy(self, request, *args, **kwargs):
+        # Без get_object(): один DELETE за (id, follower), рядок наперед не читається
+        pk = self.kwargs['pk']
+        if not pk.isdigit():
+            raise Http404
+        if self.repo.delete(id=int(pk), follower_id=request.user.id):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if Follower.objects.filter(pk=pk).exists():
+            return Response({"error": "You can only unfollow for yourself."}, status=status.HTTP_403_FORBIDDEN)
+        raise Http404
+
+    def unfollow(self, request, *args, **kwargs):
+        """DELETE /api/followers/ {"followee_id": ...} — відписка за складеним ключем (маршрут у urls.py)"""
+        followee_id = str(request.data.get('followee_id', ''))
+        if not followee_id.isdigit():
+            raise ValidationError({"followee_id": "Expected a user id."})
+        if not self.repo.delete(follower_id=request.user.id, followee_id=int(followee_id)):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def batch(self, request):
+        """POST /api/followers/batch/ {"followee_ids": [...]} — підписка на багатьох користувачів"""
+        serializer = FollowerBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = self.repo.add_many(request.user.id, serializer.validated_data['followee_ids'])
+        return Response({
+            "results": [{"followee_id": pk, "status": result} for pk, result in results.items()]
+        })
 
+    @action(detail=False, methods=['get'])
+    def suggestions(self, request):
+        """GET /api/followers/suggestions/?limit=10 — друзі друзів, на яких ви ще не підписані"""
+        limit = request.query_params.get('limit', '10')
+        if not limit.isdigit():
+            raise ValidationError({"limit": "Expected an integer."})
+        return Response({"results": self.repo.get_suggestions(request.user.id, min(int(limit), 100))})
 
-class UserMonthlyStatsViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=False, methods=['get'])
+    def mutual(self, request):
+        """GET /api/followers/mutual/?user=<id> — хто підписаний і на вас, і на користувача"""
+        other_id = request.query_params.get('user')
+        if not other_id or not other_id.isdigit():
+            raise ValidationError({"user": "Expected a user id."})
+        user_ids = self.repo.get_mutual_followers(request.user.id, int(other_id))
+        return Response({"user_id": int(other_id), "count": len(user_ids), "user_ids": user_ids[:100]})
+
+    @action(detail=False, methods=['get'])
+    def counts(self, request):
+        """GET /api/followers/counts/?ids=1,2,3 — кількість підписників/підписок для багатьох користувачів"""
+        ids = [value for value in request.query_params.get('ids', '').split(',') if value]
+        if not ids or not all(value.isdigit() for value in ids) or len(ids) > 500:
+            raise ValidationError({"ids": "Expected up to 500 comma-separated user ids."})
+        return Response({str(pk): counts for pk, counts in self.repo.get_counts([int(pk) for pk in ids]).items()})
+
+
+class UserMonthlyStatsViewSet(RepositoryViewSet):
     queryset = UserMonthlyStats.objects.all()
     serializer_class = UserMonthlyStatsSerializer
     permission_classes = [IsAuthenticated]
-    # Цей ViewSet не використовує RepositoryViewSet, оскільки він ReadOnly
-    # і не потребує кастомних 'create', 'update'
+    # Лише читання; RepositoryViewSet — щоб list / retrieve йшли через репозиторій
+    # (з шардуванням статистика лежить на шардах, а не в default)
+    http_method_names = ['get', 'head', 'options']
 
 
 class GlobalStatsReport(viewsets.ViewSet):
@@ -330,4 +693,156 @@ class GlobalStatsReport(viewsets.ViewSet):
         if not report_data["activities_overview"] or report_data["activities_overview"].get('total_activities') is None:
             return Response({"error": "No data available to report."}, status=status.HTTP_404_NOT_FOUND)
 
-        return Response(report_data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(report_data, status=status.HTTP_200_OK)
+
+
+class SearchViewSet(viewsets.ViewSet):
+    """
+    GET /api/search/?q=...&type=comments|profiles|users&page=1&page_size=20
+    Коментарі та профілі — повнотекстовий пошук з ранжуванням, users — за префіксом імені.
+    """
+    permission_classes = [IsAuthenticated]
+    search_types = ('comments', 'profiles', 'users')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.db = DataAccessLayer()
+
+    def list(self, request):
+        query = request.query_params.get('q', '').strip()
+        search_type = request.query_params.get('type', 'comments')
+        if search_type not in self.search_types:
+            raise ValidationError({"type": f"Expected one of: {', '.join(self.search_types)}."})
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 50)
+        except ValueError:
+            raise ValidationError({"page": "Expected integers for page and page_size."})
+        if not query:
+            raise ValidationError({"q": "This query parameter is required."})
+
+        # Беремо на один рядок більше, щоб знати, чи є наступна сторінка
+        search = getattr(self.db.search, f"search_{search_type}")
+        results = search(query, (page - 1) * page_size, page_size + 1)
+        return Response({
+            "query": query,
+            "type": search_type,
+            "page": page,
+            "page_size": page_size,
+            "has_next": len(results) > page_size,
+            "results": results[:page_size],
+        })
+
+
+class HeatmapViewSet(metrics.MetricsMixin, ConditionalResponseMixin, viewsets.ViewSet):
+    """
+    Теплова карта треків користувача (activities/heatmap.py).
+    GET /api/heatmaps/<user_id>/ — зуми і кількість точок,
+    GET /api/heatmaps/<user_id>/tiles/<z>/<x>/<y>.png|json/ — PNG-тайл або щільність пікселів.
+    Карта показує особисті треки, тож доступна лише власнику та його підписникам.
+    """
+    permission_classes = [IsAuthenticated]
+    dependencies = (Activity, ActivityPoint)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.db = DataAccessLayer()
+
+    def _get_user_id(self, pk):
+        user = self.db.users.get_by_id(int(pk)) if str(pk).isdigit() else None
+        # Чужим — 404, як для неіснуючого користувача: не підтверджуємо, що карта є
+        if user is None or not (
+            user.id == self.request.user.id
+            or self.db.followers.get_by_composite_key(self.request.user.id, user.id) is not None
+        ):
+            raise Http404
+        return user.id
+
+    def retrieve(self, request, pk=None):
+        user_id = self._get_user_id(pk)
+
+        def build():
+            meta = heatmap.refresh(user_id)
+            return Response({
+                "user_id": user_id,
+                "point_count": meta['point_count'],
+                "min_zoom": meta['zooms'][0],
+                "max_zoom": meta['zooms'][1],
+                "tiles": request.build_absolute_uri(request.path) + "tiles/{z}/{x}/{y}.png/",
+            })
+        return self.conditional_response(request, f"heatmap:{user_id}", self.dependencies, build)
+
+    @action(detail=True, methods=['get'], url_path=r'tiles/(?P<zoom>\d+)/(?P<x>\d+)/(?P<y>\d+)\.(?P<fmt>png|json)')
+    def tile(self, request, pk=None, zoom=None, x=None, y=None, fmt=None):
+        user_id = self._get_user_id(pk)
+        zoom, x, y = int(zoom), int(x), int(y)
+        if not heatmap.is_valid_tile(zoom, x, y):
+            raise Http404
+
+        def build():
+            if fmt == 'png':
+                return HttpResponse(heatmap.tile_png(user_id, zoom, x, y), content_type='image/png')
+            meta = heatmap.refresh(user_id)
+            grid = heatmap.density(user_id, zoom, x, y, meta)
+            py, px = grid.nonzero()
+            return Response({
+                "zoom": zoom, "x": x, "y": y,
+                "size": heatmap.TILE_SIZE,
+                "max_count": meta['max_counts'].get(str(zoom), 0),
+                "pixels": [[int(i), int(j), int(grid[j, i])] for i, j in zip(px, py)],
+            })
+        return self.conditional_response(request, f"heatmap:{user_id}", self.dependencies, build)
+
+
+class ThrottleMetricsView(viewsets.ViewSet):
+    """
+    Лічильники дозволених / відхилених запитів по scope (для поточного процесу).
+    """
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        return Response(throttle_metrics())
+
+
+class ProfilingView(viewsets.ViewSet):
+    """
+    Збережені профілі запитів (activities/profiling.py).
+    GET /api/metrics/profiling/ — список, GET /api/metrics/profiling/<id>/ — folded stacks для flamegraph.
+    """
+    permission_classes = [IsAdminUser]
+    lookup_value_regex = r'[\w-]+'
+
+    def list(self, request):
+        return Response(profiling.list_profiles())
+
+    def retrieve(self, request, pk=None):
+        path = profiling.profile_path(pk)
+        if path is None:
+            raise Http404
+        response = HttpResponse(path.read_bytes(), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{path.name}"'
+        return response
+
+
+class HasMetricsToken(BasePermission):
+    """Заголовок `Authorization: Bearer <settings.METRICS_TOKEN>` (bearer_token у scrape-конфігурації Prometheus)."""
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if not token:
+            return False
+        # REMOTE_ADDR за проксі — адреса проксі, тому адресі не довіряємо
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+
+class PrometheusMetricsView(viewsets.ViewSet):
+    """
+    GET /api/metrics/prometheus/ — метрики в текстовому форматі Prometheus.
+    Доступно з токеном METRICS_TOKEN або адміністратору.
+    """
+    permission_classes = [HasMetricsToken | IsAdminUser]
+    throttle_classes = []
+
+    def list(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
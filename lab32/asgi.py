@@ -3,4 +3,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lab32.settings")
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from activities import live  # noqa: E402  (після налаштування Django)
+
+
+async def application(scope, receive, send):
+    # WebSocket живого трекінгу і lifespan (скидання буферів при зупинці) — activities.live
+    if scope['type'] in ('websocket', 'lifespan'):
+        return await live.application(scope, receive, send)
+    return await django_application(scope, receive, send)
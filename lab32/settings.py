@@ -19,15 +19,21 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "activities.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "activities.middleware.IdentityMapMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "activities.middleware.QueryCountMiddleware",
 ]
 
+# Заголовки X-DB-Query-Count / X-DB-Query-Time-Ms (потрібні для benchmark_api)
+QUERY_COUNT_HEADERS = DEBUG
+
 ROOT_URLCONF = "lab32.urls"
 
 TEMPLATES = [
@@ -61,6 +67,18 @@ DATABASES = {
     }
 }
 
+# Шардування даних користувачів (activities/sharding.py): alias'и з DATABASES, між якими
+# розподіляються активності, точки, коментарі, kudos і статистика, напр. ['shard0', 'shard1'].
+# Користувачі та решта таблиць лишаються в 'default'. Порожній список — шардування вимкнено.
+# Новий шард: manage.py migrate --database <alias> && manage.py init_shards
+SHARD_DATABASES = []
+DATABASE_ROUTERS = ['activities.sharding.ShardRouter']
+
+# Спільний між воркерами кеш: через нього інвалідуються кеші в процесах (підсумки профілів,
+# identity map, позиції живого трекінгу). Без CACHES діє LocMem — кеш лише поточного процесу,
+# і ці кеші в процесі вимикаються (дані читаються з БД). Для кількох воркерів, напр.:
+# CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'}}
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -84,9 +102,89 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'activities.throttling.WriteRateThrottle',
+        'activities.throttling.ScopedWriteThrottle',
+    ],
 }
 
+# Token-bucket ліміти на запис: burst — розмір сплеску, sustained — середня швидкість
+TOKEN_BUCKET_THROTTLE = {
+    'STORE': 'local',  # 'local' (пам'ять процесу) або alias кешу з CACHES
+    'RATES': {
+        'writes': {'burst': 60, 'sustained': '300/min'},
+        'kudos': {'burst': 20, 'sustained': '60/min'},
+        'activity-points': {'burst': 120, 'sustained': '600/min'},
+    },
+}
+
+# Idempotency-Key (activities/idempotency.py): кеш відповідей має бути спільним між воркерами
+# (з LocMem повтор на іншому воркері виконає запис ще раз), TTL відповіді і резерву запиту, що виконується
+IDEMPOTENCY_CACHE = 'default'
+IDEMPOTENCY_TTL = 24 * 3600
+IDEMPOTENCY_PENDING_TTL = 60
+
+# Холодний архів GPS-треків (manage.py archive_tracks)
+TRACK_ARCHIVE_DIR = BASE_DIR / 'archive' / 'tracks'
+
+# Пошук дублікатів активностей (activities/dedup.py): допуск часу старту,
+# відносний допуск тривалості / дистанції і мінімальна схожість треків (MinHash)
+DEDUP_START_TOLERANCE_SEC = 120
+DEDUP_TOLERANCE = 0.05
+DEDUP_MIN_SIMILARITY = 0.5
+
+# Теплові карти треків (activities/heatmap.py): масиви щільності і кеш PNG-тайлів
+HEATMAP_DIR = BASE_DIR / 'archive' / 'heatmaps'
+HEATMAP_MIN_ZOOM = 2
+HEATMAP_MAX_ZOOM = 16
+# Скільки (сек.) після перевірки точка з меншим id ще може закомітитися; до того її id перевіряються повторно
+HEATMAP_LOOKBACK_SECONDS = 3600
+
+# Матеріалізовані представлення аналітики (activities/materialized.py, manage.py refresh_analytics_views):
+# оновлення після стількох записів у таблицях-джерелах або, якщо записи були, не рідше ніж раз на
+# MAX_STALENESS секунд; не частіше ніж раз на MIN_INTERVAL секунд
+ANALYTICS_VIEW_REFRESH_WRITES = 1000
+ANALYTICS_VIEW_MAX_STALENESS = 3600
+ANALYTICS_VIEW_MIN_INTERVAL = 60
+
+# Як часто лідерборди в пам'яті перебудовуються з БД (записи інших процесів)
+LEADERBOARD_REBUILD_SECONDS = 300
+
+# Як часто граф підписок у пам'яті перезавантажується з БД
+FOLLOW_GRAPH_REBUILD_SECONDS = 600
+
+# Пошук без PostgreSQL (індекс у пам'яті): перебудова після записів інших процесів не частіше ніж раз на
+SEARCH_INDEX_REBUILD_SECONDS = 60
+
+# Споживачі подій transactional outbox (manage.py run_outbox), напр.:
+# {'search-index': {'HANDLER': 'search.consumers.reindex', 'TOPICS': ['activity.created', 'activity.updated']}}
+# HANDLER отримує список OutboxEvent; доставка at-least-once.
+OUTBOX_CONSUMERS = {}
+# Скільки (сек.) чекати на подію з пропущеним id нижче checkpoint'а, поки її транзакція закомітиться
+OUTBOX_GAP_TIMEOUT = 600
+
+# Вибіркове профілювання запитів (folded stacks у PROFILING_DIR, /api/metrics/profiling/)
+PROFILING_SAMPLE_RATE = 0.0  # частка запитів, що профілюються повністю
+PROFILING_SLOW_MS = None  # зберігати профіль запитів, довших за поріг (мс); None — вимкнено
+PROFILING_INTERVAL_MS = 5
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_FILES = 200
+
+# Міжзапитний LRU рядків User / Profile (activities/identity_map.py)
+USER_CACHE_SIZE = 10000
+
+# Метрики Prometheus (/api/metrics/prometheus/)
+METRICS_DIR = None  # спільний каталог для агрегації між воркерами gunicorn; None — лише поточний процес
+METRICS_FLUSH_SECONDS = 5
+METRICS_TOKEN = None  # bearer-токен для скрейпера; None — лише адміністратор
+
+# Живий трекінг (ws/activities/<id>/live/, activities/live.py)
+LIVE_FLUSH_SECONDS = 2  # як часто буфери точок пишуться в БД
+LIVE_FLUSH_POINTS = 5000  # позачерговий запис, коли в буферах процесу стільки точок
+LIVE_MAX_SESSION_POINTS = 20000  # понад це точки сесії відхиляються, доки БД не наздожене
+LIVE_CACHE = 'default'  # кеш для останніх позицій між процесами (LocMem не підходить: трекінг лише в одному процесі)
+
 
 LOGIN_REDIRECT_URL = '/ui/comments/'
 